@@ -0,0 +1,31 @@
+from django.contrib import admin
+from django.utils import timezone
+from django.utils.translation import ugettext_lazy as _
+
+from apps.tasks.models import TASK_STATES, Task
+
+
+def requeue_tasks(modeladmin, request, queryset):
+    queryset.update(
+        state=TASK_STATES.QUEUED.value, attempts=0, run_after=timezone.now()
+    )
+
+
+requeue_tasks.short_description = _("Requeue tasks")
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = [
+        "function",
+        "state",
+        "attempts",
+        "run_after",
+        "locked_by",
+        "created_at",
+        "finished_at",
+    ]
+    list_filter = ["state", "function"]
+    search_fields = ["function"]
+    readonly_fields = ["attempts", "locked_by", "last_error", "finished_at"]
+    actions = [requeue_tasks]
@@ -0,0 +1,74 @@
+import os
+import signal
+import socket
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from apps.tasks.utils import claim_task, run_task
+
+
+class Command(BaseCommand):
+    help = "Runs the queued tasks"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--pool_size",
+            type=int,
+            default=settings.TASK_WORKER_POOL_SIZE,
+            help="amount of tasks executed in parallel",
+        )
+        parser.add_argument(
+            "--poll_interval",
+            type=float,
+            default=1.0,
+            help="seconds to wait for new tasks if the queue is empty",
+        )
+        parser.add_argument(
+            "--burst",
+            action="store_true",
+            help="stop as soon as there are no tasks left to run",
+        )
+
+    def handle(self, *args, **options):
+        self.stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: self.stop.set())
+        signal.signal(signal.SIGINT, lambda *_: self.stop.set())
+
+        name = "{}-{}".format(socket.gethostname(), os.getpid())
+        if options["pool_size"] <= 1:
+            self.work(name, options)
+            return
+
+        threads = [
+            threading.Thread(
+                target=self.work, args=("{}-{}".format(name, index), options)
+            )
+            for index in range(options["pool_size"])
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def work(self, name, options):
+        try:
+            while not self.stop.is_set():
+                task = claim_task(name)
+                if task is None:
+                    if options["burst"]:
+                        break
+                    self.stop.wait(options["poll_interval"])
+                    continue
+
+                if run_task(task):
+                    self.stdout.write(f"{task.pk} {task.function} done")
+                else:
+                    self.stdout.write(
+                        f"{task.pk} {task.function} failed (attempt {task.attempts})"
+                    )
+        finally:
+            if threading.current_thread() is not threading.main_thread():
+                connection.close()
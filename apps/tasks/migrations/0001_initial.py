@@ -0,0 +1,117 @@
+# Generated by Django 3.1 on 2026-10-18 12:05
+
+import uuid
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.CreateModel(
+            name="Task",
+            fields=[
+                (
+                    "uuid",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True, null=True)),
+                ("updated_at", models.DateTimeField(auto_now=True, null=True)),
+                ("function", models.CharField(max_length=255, verbose_name="Function")),
+                (
+                    "args",
+                    models.JSONField(
+                        blank=True, default=list, verbose_name="Arguments"
+                    ),
+                ),
+                (
+                    "kwargs",
+                    models.JSONField(
+                        blank=True, default=dict, verbose_name="Keyword arguments"
+                    ),
+                ),
+                (
+                    "state",
+                    models.IntegerField(
+                        choices=[
+                            (1, "Queued"),
+                            (2, "Running"),
+                            (3, "Done"),
+                            (4, "Failed"),
+                        ],
+                        default=1,
+                        verbose_name="State",
+                    ),
+                ),
+                (
+                    "run_after",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, verbose_name="Run after"
+                    ),
+                ),
+                (
+                    "visibility_timeout",
+                    models.IntegerField(
+                        default=300,
+                        help_text="Seconds",
+                        verbose_name="Visibility timeout",
+                    ),
+                ),
+                (
+                    "attempts",
+                    models.IntegerField(
+                        default=0, editable=False, verbose_name="Attempts"
+                    ),
+                ),
+                (
+                    "max_attempts",
+                    models.IntegerField(default=5, verbose_name="Max attempts"),
+                ),
+                (
+                    "locked_by",
+                    models.CharField(
+                        blank=True,
+                        editable=False,
+                        max_length=255,
+                        verbose_name="Locked by",
+                    ),
+                ),
+                (
+                    "last_error",
+                    models.TextField(
+                        blank=True, editable=False, verbose_name="Last error"
+                    ),
+                ),
+                (
+                    "finished_at",
+                    models.DateTimeField(
+                        blank=True,
+                        editable=False,
+                        null=True,
+                        verbose_name="Finished at",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Task",
+                "verbose_name_plural": "Tasks",
+                "ordering": ["-created_at"],
+            },
+        ),
+        migrations.AddIndex(
+            model_name="task",
+            index=models.Index(
+                fields=["state", "run_after"], name="tasks_task_state_ecea29_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,56 @@
+from enum import Enum
+
+from django.db import models
+from django.utils import timezone
+from django.utils.translation import ugettext_lazy as _
+
+from project.mixins import UUIDModel
+
+
+class TASK_STATES(Enum):
+    QUEUED = 1
+    RUNNING = 2
+    DONE = 3
+    FAILED = 4
+
+
+TASK_STATE_CHOICES = (
+    (TASK_STATES.QUEUED.value, _("Queued")),
+    (TASK_STATES.RUNNING.value, _("Running")),
+    (TASK_STATES.DONE.value, _("Done")),
+    (TASK_STATES.FAILED.value, _("Failed")),
+)
+
+
+class Task(UUIDModel):
+    function = models.CharField(_("Function"), max_length=255)  # dotted path
+    args = models.JSONField(_("Arguments"), default=list, blank=True)
+    kwargs = models.JSONField(_("Keyword arguments"), default=dict, blank=True)
+    state = models.IntegerField(
+        _("State"), choices=TASK_STATE_CHOICES, default=TASK_STATES.QUEUED.value
+    )
+
+    # a queued task runs after run_after, a running task is claimed until then and
+    # is picked up again by another worker if it did not finish in time
+    run_after = models.DateTimeField(_("Run after"), default=timezone.now)
+    visibility_timeout = models.IntegerField(
+        _("Visibility timeout"), default=300, help_text=_("Seconds")
+    )
+    attempts = models.IntegerField(_("Attempts"), default=0, editable=False)
+    max_attempts = models.IntegerField(_("Max attempts"), default=5)
+    locked_by = models.CharField(
+        _("Locked by"), max_length=255, blank=True, editable=False
+    )
+    last_error = models.TextField(_("Last error"), blank=True, editable=False)
+    finished_at = models.DateTimeField(
+        _("Finished at"), null=True, blank=True, editable=False
+    )
+
+    def __str__(self):
+        return "{} ({})".format(self.function, self.get_state_display())
+
+    class Meta:
+        ordering = ["-created_at"]
+        verbose_name = _("Task")
+        verbose_name_plural = _("Tasks")
+        indexes = [models.Index(fields=["state", "run_after"])]
@@ -0,0 +1,102 @@
+import datetime
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from apps.tasks.models import TASK_STATES, Task
+from apps.tasks.utils import claim_task, enqueue, retry_delay, run_task
+
+calls = []
+
+
+def record_call(*args, **kwargs):
+    calls.append((args, kwargs))
+
+
+def fail(message):
+    raise ValueError(message)
+
+
+@override_settings(TASK_RETRY_BACKOFF_SECONDS=10, TASK_RETRY_BACKOFF_MAX_SECONDS=60)
+class TaskTestCase(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_run_worker(self):
+        task = enqueue(record_call, args=[1, "a"], kwargs={"b": [2]})
+        self.assertEqual(task.function, "apps.tasks.test.tests.record_call")
+        enqueue(record_call, args=[2], delay=60)
+
+        stdout = StringIO()
+        call_command("run_worker", "--burst", "--pool_size", "1", stdout=stdout)
+        self.assertIn("done", stdout.getvalue())
+        self.assertEqual(calls, [((1, "a"), {"b": [2]})])
+
+        task.refresh_from_db()
+        self.assertEqual(task.state, TASK_STATES.DONE.value)
+        self.assertEqual(task.attempts, 1)
+        self.assertIsNotNone(task.finished_at)
+        self.assertEqual(Task.objects.filter(state=TASK_STATES.QUEUED.value).count(), 1)
+
+    def test_retry_with_backoff(self):
+        task = enqueue(fail, args=["broken"], max_attempts=2)
+
+        claimed_task = claim_task("worker")
+        self.assertEqual(claimed_task.state, TASK_STATES.RUNNING.value)
+        self.assertFalse(run_task(claimed_task))
+        task.refresh_from_db()
+        self.assertEqual(task.state, TASK_STATES.QUEUED.value)
+        self.assertIn("broken", task.last_error)
+        self.assertGreater(
+            task.run_after, timezone.now() + datetime.timedelta(seconds=5)
+        )
+        self.assertIsNone(claim_task("worker"))
+
+        Task.objects.filter(pk=task.pk).update(run_after=timezone.now())
+        self.assertFalse(run_task(claim_task("worker")))
+        task.refresh_from_db()
+        self.assertEqual(task.state, TASK_STATES.FAILED.value)
+        self.assertEqual(task.attempts, 2)
+        self.assertIsNone(claim_task("worker"))
+
+        self.assertEqual(
+            [retry_delay(attempt) for attempt in range(1, 6)], [10, 20, 40, 60, 60]
+        )
+
+    def test_visibility_timeout(self):
+        task = enqueue(record_call, visibility_timeout=30)
+        first_claim = claim_task("worker_1")
+        self.assertIsNone(claim_task("worker_2"))
+
+        # the first worker did not finish in time
+        Task.objects.filter(pk=task.pk).update(run_after=timezone.now())
+        second_claim = claim_task("worker_2")
+        self.assertEqual(second_claim.pk, task.pk)
+        self.assertEqual(second_claim.attempts, 2)
+        self.assertEqual(second_claim.locked_by, "worker_2")
+
+        self.assertTrue(run_task(second_claim))
+        Task.objects.filter(pk=task.pk).update(state=TASK_STATES.RUNNING.value)
+        # the outcome of the expired claim is dropped
+        self.assertTrue(run_task(first_claim))
+        task.refresh_from_db()
+        self.assertEqual(task.state, TASK_STATES.RUNNING.value)
+
+    def test_visibility_timeout_max_attempts(self):
+        task = enqueue(record_call, max_attempts=2, visibility_timeout=30)
+        other_task = enqueue(record_call, delay=1)
+        for worker_name in ["worker_1", "worker_2"]:
+            self.assertEqual(claim_task(worker_name).pk, task.pk)
+            # the worker died
+            Task.objects.filter(pk=task.pk).update(run_after=timezone.now())
+
+        # the task is not claimed a third time, the next one is
+        Task.objects.filter(pk=other_task.pk).update(run_after=timezone.now())
+        self.assertEqual(claim_task("worker_3").pk, other_task.pk)
+        task.refresh_from_db()
+        self.assertEqual(task.state, TASK_STATES.FAILED.value)
+        self.assertEqual(task.attempts, 2)
+        self.assertIn("worker_2", task.last_error)
+        self.assertIsNotNone(task.finished_at)
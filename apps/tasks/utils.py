@@ -0,0 +1,113 @@
+import datetime
+import traceback
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from apps.tasks.models import TASK_STATES, Task
+
+
+def enqueue(
+    function,
+    args=None,
+    kwargs=None,
+    delay=0,
+    max_attempts=None,
+    visibility_timeout=None,
+):
+    """
+    Stores a call of function (a module level callable or its dotted path) with
+    JSON serializable arguments, it is executed by the run_worker command
+    """
+    if callable(function):
+        function = "{}.{}".format(function.__module__, function.__qualname__)
+    return Task.objects.create(
+        function=function,
+        args=list(args or []),
+        kwargs=kwargs or {},
+        run_after=timezone.now() + datetime.timedelta(seconds=delay),
+        max_attempts=max_attempts or settings.TASK_MAX_ATTEMPTS,
+        visibility_timeout=visibility_timeout or settings.TASK_VISIBILITY_TIMEOUT,
+    )
+
+
+def claim_task(worker_name):
+    while True:
+        with transaction.atomic():
+            task = (
+                Task.objects.select_for_update(skip_locked=True)
+                .filter(
+                    state__in=[TASK_STATES.QUEUED.value, TASK_STATES.RUNNING.value],
+                    run_after__lte=timezone.now(),
+                )
+                .order_by("run_after")
+                .first()
+            )
+            if task is None:
+                return None
+
+            if (
+                task.state == TASK_STATES.RUNNING.value
+                and task.attempts >= task.max_attempts
+            ):
+                # the last attempt did not finish in time, e.g. it killed its worker
+                Task.objects.filter(pk=task.pk).update(
+                    state=TASK_STATES.FAILED.value,
+                    last_error="Not finished by {} within {} seconds".format(
+                        task.locked_by, task.visibility_timeout
+                    ),
+                    finished_at=timezone.now(),
+                )
+                continue
+
+            task.state = TASK_STATES.RUNNING.value
+            task.attempts += 1
+            task.locked_by = worker_name
+            task.run_after = timezone.now() + datetime.timedelta(
+                seconds=task.visibility_timeout
+            )
+            Task.objects.filter(pk=task.pk).update(
+                state=task.state,
+                attempts=task.attempts,
+                locked_by=task.locked_by,
+                run_after=task.run_after,
+            )
+            return task
+
+
+def retry_delay(attempts):
+    return min(
+        settings.TASK_RETRY_BACKOFF_SECONDS * 2 ** (attempts - 1),
+        settings.TASK_RETRY_BACKOFF_MAX_SECONDS,
+    )
+
+
+def run_task(task):
+    """
+    Runs a claimed task, returns True if it succeeded
+    """
+    # only the worker holding the latest claim may store the outcome
+    claimed_task = Task.objects.filter(pk=task.pk, attempts=task.attempts)
+    try:
+        import_string(task.function)(*task.args, **task.kwargs)
+    except Exception as error:
+        last_error = "{}\nTraceback: {}".format(repr(error), traceback.format_exc())
+        if task.attempts >= task.max_attempts:
+            claimed_task.update(
+                state=TASK_STATES.FAILED.value,
+                last_error=last_error,
+                finished_at=timezone.now(),
+            )
+        else:
+            claimed_task.update(
+                state=TASK_STATES.QUEUED.value,
+                last_error=last_error,
+                run_after=timezone.now()
+                + datetime.timedelta(seconds=retry_delay(task.attempts)),
+            )
+        return False
+
+    claimed_task.update(state=TASK_STATES.DONE.value, finished_at=timezone.now())
+    return True
@@ -1,7 +1,6 @@
 import datetime
 import random
 import string
-import traceback
 from enum import Enum
 
 import requests
@@ -16,7 +15,8 @@ from oauthlib.oauth2 import BackendApplicationClient
 from requests_oauthlib import OAuth2Session
 
 from apps.profiles.models import CompanyProfile, UserProfile
-from apps.verification.utils import send_sms
+from apps.tasks.utils import enqueue
+from apps.verification.utils import send_sms_pin_verification
 from project.mixins import UUIDModel
 
 
@@ -184,19 +184,8 @@ class SMSPinVerification(AbstractVerification):
             system_random = random.SystemRandom()
 
             self.pin = "".join(system_random.choice(string.digits) for x in range(6))
-            try:
-                success, payload = send_sms(
-                    to_number=self.user_profile.telephone_number,
-                    message="{} {}".format(self.pin, settings.SMS_TEXT),
-                )
-                if success:
-                    self.external_id = payload
-                else:
-                    self.notes = payload
-            except Exception as error:
-                self.notes = "Exception during sync: {}\nTraceback: {}".format(
-                    repr(error), traceback.format_exc()
-                )
+            # sent by a worker once the verification is stored, see save
+            self._send_pin = True
 
         if hasattr(self, "user_profile") or hasattr(self, "company_profile"):
             profile = self.user_profile if self.user_profile else self.company_profile
@@ -232,6 +221,12 @@ class SMSPinVerification(AbstractVerification):
             raise ValidationError(errors)
         super(SMSPinVerification, self).clean(*args, **kwargs)
 
+    def save(self, *args, **kwargs):
+        super(SMSPinVerification, self).save(*args, **kwargs)
+        if getattr(self, "_send_pin", False):
+            del self._send_pin
+            enqueue(send_sms_pin_verification, args=[str(self.pk)])
+
     class Meta:
         verbose_name = _("SMS pin verification")
         verbose_name_plural = _("SMS pin verifications")
@@ -3,6 +3,7 @@ from rest_framework.test import APITestCase
 
 from apps.profiles.models import CompanyProfile, UserProfile
 from apps.verification.models import VERIFICATION_STATES, SMSPinVerification
+from apps.verification.utils import send_sms_pin_verification
 from project.utils_testing import EcouponTestCaseMixin
 
 
@@ -114,6 +115,9 @@ class SmsVerificationApiTest(EcouponTestCaseMixin, APITestCase):
             SMSPinVerification.objects.all().count(), sms_verification_count + 1
         )
 
+        # the queued send reads the number of the company profile
+        send_sms_pin_verification(str(profile.sms_pin_verifications.get().pk))
+
     def test_create_sms_verification_company_wrong_profile(self):
         profile = CompanyProfile.objects.create(
             owner=self.user,
@@ -25,6 +25,32 @@ def send_sms(to_number: str, message: str):
         print('sending immaginary SMS to {}:"{}"'.format(to_number, message))
 
 
+def send_sms_pin_verification(sms_pin_verification_uuid):
+    from apps.verification.models import SMSPinVerification
+
+    sms_pin_verification = SMSPinVerification.objects.get(pk=sms_pin_verification_uuid)
+    profile = (
+        sms_pin_verification.user_profile
+        if sms_pin_verification.user_profile
+        else sms_pin_verification.company_profile
+    )
+    result = send_sms(
+        to_number=profile.telephone_number,
+        message="{} {}".format(sms_pin_verification.pin, settings.SMS_TEXT),
+    )
+    if result is None:
+        return
+    success, payload = result
+    if success:
+        SMSPinVerification.objects.filter(pk=sms_pin_verification.pk).update(
+            external_id=payload
+        )
+    else:
+        SMSPinVerification.objects.filter(pk=sms_pin_verification.pk).update(
+            notes=payload
+        )
+
+
 def send_postcard(
     message="",
     firstname=" ",
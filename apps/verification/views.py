@@ -12,6 +12,7 @@ from rest_framework.response import Response
 
 from apps.currency.models import Currency
 from apps.profiles.models import CompanyProfile, UserProfile
+from apps.tasks.utils import enqueue
 from apps.verification.models import (
     VERIFICATION_STATES,
     AddressPinVerification,
@@ -43,7 +44,13 @@ def resend_user_profile_pin(request, user_profile_uuid=None):
         user_profile.sms_pin_verification is not None
         and user_profile.sms_pin_verification.state == VERIFICATION_STATES.PENDING.value
     ):
-        send_sms(user_profile.telephone_number, user_profile.sms_pin_verification.pin)
+        enqueue(
+            send_sms,
+            args=[
+                user_profile.telephone_number,
+                user_profile.sms_pin_verification.pin,
+            ],
+        )
         return Response(status=status.HTTP_204_NO_CONTENT)
     else:
         raise_api_exception(
@@ -65,8 +72,12 @@ def resend_company_profile_pin(request, profile_uuid=None):
         and company_profile.sms_pin_verification.state
         == VERIFICATION_STATES.PENDING.value
     ):
-        send_sms(
-            company_profile.telephone_number, company_profile.sms_pin_verification.pin
+        enqueue(
+            send_sms,
+            args=[
+                company_profile.telephone_number,
+                company_profile.sms_pin_verification.pin,
+            ],
         )
         return Response(status=status.HTTP_204_NO_CONTENT)
     else:
@@ -121,7 +132,10 @@ def create_sms_pin_verification(request, profile_uuid=None):
             SMSPinVerification.objects.create(
                 company_profile=profile, state=VERIFICATION_STATES.PENDING.value
             )
-            send_sms(profile.telephone_number, profile.sms_pin_verification.pin)
+            enqueue(
+                send_sms,
+                args=[profile.telephone_number, profile.sms_pin_verification.pin],
+            )
             return HttpResponse(status=status.HTTP_201_CREATED)
     else:
         profile = UserProfile.objects.filter(pk=profile_uuid).first()
@@ -132,7 +146,10 @@ def create_sms_pin_verification(request, profile_uuid=None):
             SMSPinVerification.objects.create(
                 user_profile=profile, state=VERIFICATION_STATES.PENDING.value
             )
-            send_sms(profile.telephone_number, profile.sms_pin_verification.pin)
+            enqueue(
+                send_sms,
+                args=[profile.telephone_number, profile.sms_pin_verification.pin],
+            )
             return HttpResponse(status=status.HTTP_201_CREATED)
     return HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
 
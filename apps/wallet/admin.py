@@ -12,7 +12,6 @@ from django.conf import settings
 from django.contrib import admin, messages
 from django.core.exceptions import PermissionDenied
 from django.db.models.query import QuerySet
-from django.db.models.query_utils import Q
 from django.http import FileResponse, HttpRequest, HttpResponse, HttpResponseRedirect
 from django.shortcuts import render
 from django.template.loader import get_template
@@ -31,6 +30,9 @@ from apps.wallet.models import (
     MetaTransaction,
     OwnerWallet,
     PaperWallet,
+    Reconciliation,
+    ReconciliationMismatch,
+    SyncBatch,
     Transaction,
     Wallet,
     WalletPublicKeyTransferRequest,
@@ -210,10 +212,7 @@ class TransactionCurrencyFilter(admin.SimpleListFilter):
         """
 
         if self.value() is not None:
-            return queryset.filter(
-                Q(from_wallet__currency__pk=self.value())
-                | Q(to_wallet__currency__pk=self.value())
-            )
+            return queryset.filter(currency=self.value())
 
         return queryset
 
@@ -223,6 +222,7 @@ class TransactionAdmin(admin.ModelAdmin):
     readonly_fields = [
         "submitted_to_chain_at",
         "operation_hash",
+        "sync_batch",
         "user_notes",
         "notes",
         "created_at",
@@ -236,10 +236,7 @@ class TransactionAdmin(admin.ModelAdmin):
     def get_queryset(self, request: HttpRequest) -> QuerySet:
         qs = super().get_queryset(request)
         if not request.user.has_perm("currency.can_view_all_currencies"):
-            qs = qs.filter(
-                Q(from_wallet__currency__users__id__exact=request.user.id)
-                | Q(to_wallet__currency__users__id__exact=request.user.id),
-            )
+            qs = qs.filter(currency__users__id__exact=request.user.id)
         return qs
 
     def has_delete_permission(self, request, obj=None):
@@ -263,6 +260,7 @@ class MetaTransactionAdmin(admin.ModelAdmin):
     readonly_fields = [
         "submitted_to_chain_at",
         "operation_hash",
+        "sync_batch",
         "user_notes",
         "notes",
         "created_at",
@@ -275,16 +273,19 @@ class MetaTransactionAdmin(admin.ModelAdmin):
     def get_queryset(self, request: HttpRequest) -> QuerySet:
         qs = super().get_queryset(request)
         if not request.user.has_perm("currency.can_view_all_currencies"):
-            qs = qs.filter(
-                Q(from_wallet__currency__users__id__exact=request.user.id)
-                | Q(to_wallet__currency__users__id__exact=request.user.id)
-            )
+            qs = qs.filter(currency__users__id__exact=request.user.id)
         return qs
 
 
 @admin.register(WalletPublicKeyTransferRequest)
 class WalletPublicKeyTransferRequestAdmin(admin.ModelAdmin):
-    readonly_fields = ["submitted_to_chain_at", "operation_hash", "notes", "created_at"]
+    readonly_fields = [
+        "submitted_to_chain_at",
+        "operation_hash",
+        "sync_batch",
+        "notes",
+        "created_at",
+    ]
     list_display = ["wallet", "old_public_key", "new_public_key", "state", "created_at"]
     list_filter = ["state", "created_at"]
     search_fields = ["wallet__wallet_id"]
@@ -299,6 +300,100 @@ class WalletPublicKeyTransferRequestAdmin(admin.ModelAdmin):
         return qs
 
 
+@admin.register(SyncBatch)
+class SyncBatchAdmin(admin.ModelAdmin):
+    readonly_fields = [
+        "state",
+        "operation_hash",
+        "result",
+        "notes",
+        "item_count",
+        "created_at",
+        "submitted_to_chain_at",
+        "finished_at",
+        "injected_level",
+        "included_level",
+        "checked_level",
+    ]
+    list_display = [
+        "operation_hash",
+        "state",
+        "item_count",
+        "created_at",
+        "finished_at",
+    ]
+    list_filter = ["state", "created_at"]
+    search_fields = ["operation_hash"]
+
+    def get_queryset(self, request: HttpRequest) -> QuerySet:
+        # a batch mixes the transactions of all currencies
+        qs = super().get_queryset(request)
+        if not (
+            request.user.has_perm("currency.can_view_all_currencies")
+            or request.user.is_superuser
+        ):
+            qs = qs.none()
+        return qs
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+class ReconciliationMismatchInline(admin.TabularInline):
+    model = ReconciliationMismatch
+    fields = readonly_fields = [
+        "wallet",
+        "address",
+        "token_id",
+        "balance",
+        "on_chain_balance",
+        "notes",
+    ]
+    extra = 0
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Reconciliation)
+class ReconciliationAdmin(admin.ModelAdmin):
+    inlines = [ReconciliationMismatchInline]
+    readonly_fields = [
+        "watermark",
+        "since",
+        "checkpoint",
+        "checked_count",
+        "mismatch_count",
+        "created_at",
+        "finished_at",
+    ]
+    list_display = [
+        "created_at",
+        "checked_count",
+        "mismatch_count",
+        "finished_at",
+    ]
+
+    def get_queryset(self, request: HttpRequest) -> QuerySet:
+        # a reconciliation covers the wallets of all currencies
+        qs = super().get_queryset(request)
+        if not (
+            request.user.has_perm("currency.can_view_all_currencies")
+            or request.user.is_superuser
+        ):
+            qs = qs.none()
+        return qs
+
+    def has_add_permission(self, request):
+        return False
+
+
 @admin.register(CashOutRequest)
 class CashOutRequestAdmin(admin.ModelAdmin):
     class PaymentDateForm(forms.Form):
@@ -0,0 +1,357 @@
+"""
+In-memory stand-in for the Tezos node and the token contract, to benchmark and load
+test the sync without a node. It covers the parts of the pytezos client the wallet
+app uses: the ledger big map, the admin account counter, preapply, inject, blocks
+and the effects of mint, transfer, meta_transfer and nonce_of. Blocks are only baked
+when bake is called. Every call that would reach the node is counted like a real RPC
+call and waits latency seconds. With failure_rate preapplies of synced items fail at
+random, with drop_rate injected operations never make it into a block.
+"""
+import collections
+import hashlib
+import json
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from pytezos.crypto.key import Key
+
+from apps.wallet.tezos import count_rpc_call, tezos_client_cache
+
+FAKE_CHAIN_ID = "NetXfakefakefak"
+
+
+class FakeRpcError(Exception):
+    pass
+
+
+class FakeTezosNode:
+    def __init__(self, latency=0.0, failure_rate=0.0, drop_rate=0.0, seed=0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.drop_rate = drop_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        # (address, token_id) to amount
+        self.ledger = collections.Counter()
+        self.nonces = collections.Counter()
+        self.counter = 0
+        # operations by hash for every level, level 0 is the genesis block
+        self.blocks = [{}]
+        self.mempool = []
+        self.operation_count = 0
+
+    @property
+    def level(self):
+        return len(self.blocks) - 1
+
+    def rpc(self):
+        count_rpc_call()
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    def run(self, contents, ledger, nonces):
+        """
+        Applies the contents to the given ledger and nonces, returns the contents
+        with their operation results. A failing operation reverts the whole group.
+        """
+        statuses = []
+        for content in contents:
+            try:
+                apply_parameters(content["parameters"], ledger, nonces)
+                statuses.append("applied")
+            except FakeRpcError as error:
+                statuses.append(str(error))
+                break
+        is_applied = all(status == "applied" for status in statuses)
+        statuses += ["skipped"] * (len(contents) - len(statuses))
+
+        results = []
+        for content, status in zip(contents, statuses):
+            operation_result = {"status": "applied"}
+            if not is_applied:
+                operation_result = {"status": "backtracked"}
+                if status not in ["applied", "skipped"]:
+                    operation_result = {"status": "failed", "errors": [{"id": status}]}
+                elif status == "skipped":
+                    operation_result = {"status": "skipped"}
+            metadata = {"operation_result": operation_result}
+            if content["parameters"]["entrypoint"] == "nonce_of":
+                # the callback with the nonce of every requested address
+                metadata["internal_operation_results"] = [
+                    {
+                        "parameters": {
+                            "value": [
+                                {
+                                    "prim": "Pair",
+                                    "args": [
+                                        {"int": str(nonces[address])},
+                                        {"string": address},
+                                    ],
+                                }
+                                for address in content["parameters"]["value"]
+                            ]
+                        }
+                    }
+                ]
+            results.append({**content, "metadata": metadata})
+        return is_applied, results
+
+    def preapply(self, contents):
+        self.rpc()
+        with self.lock:
+            # nonce reads are not synced items, they never fail
+            is_nonce_read = contents[0]["parameters"]["entrypoint"] == "nonce_of"
+            if not is_nonce_read and self.random.random() < self.failure_rate:
+                contents = [
+                    {**contents[0], "parameters": {"entrypoint": "fake_failure"}}
+                ] + contents[1:]
+            is_applied, results = self.run(
+                contents, self.ledger.copy(), self.nonces.copy()
+            )
+        return {"contents": results}
+
+    def inject(self, contents):
+        self.rpc()
+        with self.lock:
+            # the counters have to continue the ones of the account
+            expected_counter = self.counter + 1
+            for operation in self.mempool:
+                expected_counter += len(operation["contents"])
+            if int(contents[0]["counter"]) != expected_counter:
+                raise FakeRpcError("counter_in_the_past_or_future")
+            self.operation_count += 1
+            operation_hash = hash_contents(contents)
+            self.mempool.append({"hash": operation_hash, "contents": contents})
+        return operation_hash
+
+    def bake(self):
+        """
+        Includes the operations in the mempool into a new block, except the dropped
+        ones. Included operations consume their counters even if they fail.
+        """
+        with self.lock:
+            block = {}
+            for operation in self.mempool:
+                if self.random.random() < self.drop_rate:
+                    continue
+                ledger, nonces = self.ledger.copy(), self.nonces.copy()
+                is_applied, results = self.run(operation["contents"], ledger, nonces)
+                if is_applied:
+                    self.ledger, self.nonces = ledger, nonces
+                self.counter = int(operation["contents"][-1]["counter"])
+                block[operation["hash"]] = {
+                    "hash": operation["hash"],
+                    "contents": results,
+                }
+            self.mempool = []
+            self.blocks.append(block)
+
+    def next_counter(self):
+        self.rpc()
+        with self.lock:
+            return self.counter
+
+
+def hash_contents(contents):
+    """
+    Stands in for the operation hash, the same contents with the same counters get
+    the same hash
+    """
+    digest = hashlib.sha256(json.dumps(contents, sort_keys=True).encode())
+    return "oo" + digest.hexdigest()[:49]
+
+
+def apply_parameters(parameters, ledger, nonces):
+    """
+    The effects of the token contract entrypoints
+    """
+
+    def move(from_, txs):
+        for tx in txs:
+            if ledger[(from_, tx["token_id"])] < tx["amount"]:
+                raise FakeRpcError("FA2_INSUFFICIENT_BALANCE")
+            ledger[(from_, tx["token_id"])] -= tx["amount"]
+            ledger[(tx["to_"], tx["token_id"])] += tx["amount"]
+
+    entrypoint, value = parameters["entrypoint"], parameters.get("value")
+    if entrypoint == "mint":
+        ledger[(value["address"], value["token_id"])] += value["amount"]
+    elif entrypoint == "transfer":
+        for transfer in value:
+            move(transfer["from_"], transfer["txs"])
+    elif entrypoint == "meta_transfer":
+        for meta_transfer in value:
+            from_ = Key.from_encoded_key(
+                meta_transfer["from_public_key"]
+            ).public_key_hash()
+            if meta_transfer["nonce"] <= nonces[from_]:
+                raise FakeRpcError("NONCE_MISMATCH")
+            nonces[from_] = meta_transfer["nonce"]
+            move(from_, meta_transfer["txs"])
+    elif entrypoint == "nonce_of":
+        pass
+    else:
+        raise FakeRpcError(entrypoint)
+
+
+class FakeOperationGroup:
+    def __init__(self, node, contents):
+        self.node = node
+        self.contents = contents
+
+    @property
+    def shell(self):
+        return FakeShell(self.node)
+
+    def fill(self):
+        counter = self.node.next_counter()
+        contents = []
+        for content in self.contents:
+            counter += 1
+            contents.append({**content, "counter": str(counter)})
+        return FakeOperationGroup(self.node, contents)
+
+    def sign(self):
+        return self
+
+    def hash(self):
+        return hash_contents(self.contents)
+
+    def preapply(self):
+        return self.node.preapply(self.contents)
+
+    def inject(self, _async=True, preapply=True, check_result=True, num_blocks_wait=5):
+        if preapply:
+            operation_result = self.preapply()
+            if check_result and not all(
+                content["metadata"]["operation_result"]["status"] == "applied"
+                for content in operation_result["contents"]
+            ):
+                raise FakeRpcError("Preapply failed")
+        operation_hash = self.node.inject(self.contents)
+        if not _async:
+            self.node.bake()
+        return {"chain_id": FAKE_CHAIN_ID, "hash": operation_hash}
+
+
+class FakeContractCall:
+    def __init__(self, node, entrypoint, value):
+        self.node = node
+        self.content = {
+            "kind": "transaction",
+            "counter": "0",
+            "parameters": {"entrypoint": entrypoint, "value": value},
+        }
+
+    def as_transaction(self):
+        return FakeOperationGroup(self.node, [self.content])
+
+    @property
+    def operation_group(self):
+        return self.as_transaction().fill()
+
+
+class FakeContract:
+    def __init__(self, node):
+        self.node = node
+
+    def mint(self, **kwargs):
+        return FakeContractCall(self.node, "mint", kwargs)
+
+    def transfer(self, payloads):
+        return FakeContractCall(self.node, "transfer", payloads)
+
+    def meta_transfer(self, payloads):
+        return FakeContractCall(self.node, "meta_transfer", payloads)
+
+    def nonce_of(self, callback, requests):
+        return FakeContractCall(self.node, "nonce_of", requests)
+
+    def big_map_get(self, path):
+        self.node.rpc()
+        big_map, key = path.split("/")
+        address, token_id = key.split("::")
+        with self.node.lock:
+            if big_map != "ledger" or (address, int(token_id)) not in self.node.ledger:
+                raise FakeRpcError("Not found: {}".format(path))
+            return self.node.ledger[(address, int(token_id))]
+
+
+class FakeBlockQuery:
+    def __init__(self, node, level):
+        self.node = node
+        self.level = level
+
+    def operation_hashes(self):
+        self.node.rpc()
+        with self.node.lock:
+            block = self.node.blocks[self.level]
+            return [[], [], [], list(block.keys())]
+
+    @property
+    def operations(self):
+        return self
+
+    def __getitem__(self, operation_hash):
+        def get():
+            self.node.rpc()
+            with self.node.lock:
+                block = self.node.blocks[self.level]
+                if operation_hash not in block:
+                    raise StopIteration
+                return block[operation_hash]
+
+        return get
+
+
+class FakeShell:
+    def __init__(self, node):
+        self.node = node
+        self.blocks = FakeBlocks(node)
+
+    @property
+    def head(self):
+        return self
+
+    def level(self):
+        self.node.rpc()
+        return self.node.level
+
+
+class FakeBlocks:
+    def __init__(self, node):
+        self.node = node
+
+    def __getitem__(self, level):
+        return FakeBlockQuery(self.node, level)
+
+
+class FakeTezosClient:
+    def __init__(self, node):
+        self.node = node
+        self.shell = FakeShell(node)
+
+    def contract(self, address):
+        return FakeContract(self.node)
+
+    def bulk(self, *contract_calls):
+        return FakeOperationGroup(
+            self.node, [contract_call.content for contract_call in contract_calls]
+        )
+
+
+@contextmanager
+def fake_tezos(node):
+    """
+    Serves get_tezos_client and get_token_contract from the given fake node
+    """
+    load = tezos_client_cache.load
+    tezos_client_cache.load = lambda: (FakeTezosClient(node), FakeContract(node))
+    tezos_client_cache.invalidate()
+    try:
+        yield node
+    finally:
+        tezos_client_cache.load = load
+        tezos_client_cache.invalidate()
@@ -0,0 +1,104 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from pytezos import Key
+from pytezos.crypto.encoding import base58_encode
+
+from apps.wallet.michelson import pack_message, pack_paper_wallet_message
+from apps.wallet.utils import (
+    create_paper_wallet_message_micheline,
+    pack_meta_transaction_micheline,
+)
+
+
+class PaperWalletStub:
+    def __init__(self, wallet_id):
+        self.wallet_id = wallet_id
+
+
+class Command(BaseCommand):
+    help = "Compares the pytezos message packing with the byte level encoders"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--iterations",
+            type=int,
+            default=1000,
+            help="amount of messages packed per implementation",
+        )
+        parser.add_argument(
+            "--txs",
+            type=int,
+            default=1,
+            help="amount of transfers in every meta transaction",
+        )
+
+    def timed(self, name, function, arguments):
+        start = time.perf_counter()
+        results = [function(*argument) for argument in arguments]
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f"{name}: {elapsed * 1e6 / len(arguments):.1f} µs per message"
+        )
+        return results, elapsed
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        public_keys = [Key.generate(export=False).public_key() for _ in range(10)]
+        addresses = [
+            base58_encode(rng.getrandbits(160).to_bytes(20, "big"), b"tz1").decode()
+            for _ in range(100)
+        ]
+        meta_transactions = [
+            (
+                {
+                    "from_public_key": rng.choice(public_keys),
+                    "nonce": rng.randint(1, 10000),
+                    "txs": [
+                        {
+                            "to_": rng.choice(addresses),
+                            "token_id": rng.randint(0, 10),
+                            "amount": rng.randint(1, 10 ** 6),
+                        }
+                        for _ in range(options["txs"])
+                    ],
+                },
+            )
+            for _ in range(options["iterations"])
+        ]
+        paper_wallets = [
+            (PaperWalletStub(f"AB{rng.randint(0, 999999):06d}"), rng.randint(0, 10))
+            for _ in range(options["iterations"])
+        ]
+
+        self.stdout.write("meta transaction message")
+        reference, reference_time = self.timed(
+            "pytezos", pack_meta_transaction_micheline, meta_transactions
+        )
+        fast, fast_time = self.timed(
+            "encoder",
+            lambda meta: pack_message(
+                meta["from_public_key"], meta["nonce"], meta["txs"]
+            ),
+            meta_transactions,
+        )
+        self.report(reference, reference_time, fast, fast_time)
+
+        self.stdout.write("paper wallet message")
+        reference, reference_time = self.timed(
+            "pytezos", create_paper_wallet_message_micheline, paper_wallets
+        )
+        fast, fast_time = self.timed(
+            "encoder",
+            lambda wallet, token_id: pack_paper_wallet_message(
+                wallet.wallet_id, token_id
+            ),
+            paper_wallets,
+        )
+        self.report(reference, reference_time, fast, fast_time)
+
+    def report(self, reference, reference_time, fast, fast_time):
+        if reference != fast:
+            self.stderr.write("encoder output differs from pytezos")
+        self.stdout.write(f"speedup: {reference_time / fast_time:.1f}x")
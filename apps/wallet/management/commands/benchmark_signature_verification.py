@@ -0,0 +1,65 @@
+import time
+
+from django.core.management.base import BaseCommand
+from pytezos import Key
+
+from apps.wallet.signatures import (
+    decode_ed25519_signature,
+    verify_signature,
+    verify_signatures,
+)
+
+
+class Command(BaseCommand):
+    help = "Compares the pytezos signature verification with the libsodium path"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--iterations",
+            type=int,
+            default=1000,
+            help="amount of signatures verified per implementation",
+        )
+        parser.add_argument(
+            "--keys",
+            type=int,
+            default=10,
+            help="amount of distinct ed25519 keys signing the messages",
+        )
+
+    def timed(self, name, function):
+        # every signature is new to the application, only the keys are known
+        decode_ed25519_signature.cache_clear()
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f"{name}: {elapsed * 1e6 / self.iterations:.1f} µs per signature"
+        )
+        return elapsed
+
+    def handle(self, *args, **options):
+        self.iterations = options["iterations"]
+        keys = [Key.generate(export=False) for _ in range(options["keys"])]
+        triples = []
+        for i in range(self.iterations):
+            key = keys[i % len(keys)]
+            message = i.to_bytes(8, "big")
+            triples.append((message, key.sign(message), key.public_key()))
+
+        def pytezos_path():
+            for message, signature, public_key in triples:
+                Key.from_encoded_key(public_key).verify(signature, message)
+
+        def libsodium_path():
+            for message, signature, public_key in triples:
+                verify_signature(message, signature, public_key)
+
+        def batch_path():
+            if not all(verify_signatures(triples)):
+                self.stderr.write("batch verification failed")
+
+        reference_time = self.timed("pytezos", pytezos_path)
+        self.timed("libsodium", libsodium_path)
+        batch_time = self.timed("libsodium batch", batch_path)
+        self.stdout.write(f"speedup: {reference_time / batch_time:.1f}x")
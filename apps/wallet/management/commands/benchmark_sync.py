@@ -0,0 +1,215 @@
+import random
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from pytezos.crypto.key import Key
+
+from apps.currency.models import Currency
+from apps.wallet.fake_tezos import FakeTezosNode, fake_tezos
+from apps.wallet.models import (
+    TRANSACTION_STATES,
+    WALLET_STATES,
+    MetaTransaction,
+    SyncBatch,
+    Transaction,
+    Wallet,
+)
+from apps.wallet.reconciliation import reconcile_sync_state
+from apps.wallet.tezos import rpc_call_count
+from apps.wallet.utils import (
+    confirm_sync_batches,
+    pack_meta_transaction,
+    read_nonce_from_chain,
+    sync_batch_to_blockchain,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds wallets and pending transactions and syncs them against a fake node, "
+        "everything is rolled back afterwards"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--wallets", type=int, default=100, help="amount of wallets to seed"
+        )
+        parser.add_argument(
+            "--transactions",
+            type=int,
+            default=1000,
+            help="amount of pending transactions to seed, mints and meta transactions",
+        )
+        parser.add_argument(
+            "--batch_size",
+            type=int,
+            default=settings.BLOCKCHAIN_SYNC_BATCH_SIZE,
+            help="maximum amount of transactions per sync batch",
+        )
+        parser.add_argument(
+            "--latency",
+            type=float,
+            default=0.0,
+            help="seconds every call to the fake node takes",
+        )
+        parser.add_argument(
+            "--failure_rate",
+            type=float,
+            default=0.0,
+            help="share of preapplies failing at random",
+        )
+        parser.add_argument(
+            "--drop_rate",
+            type=float,
+            default=0.0,
+            help="share of injected operations never included in a block",
+        )
+        parser.add_argument(
+            "--max_cycles",
+            type=int,
+            default=1000,
+            help="stop syncing after this many cycles",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        node = FakeTezosNode(
+            latency=options["latency"],
+            failure_rate=options["failure_rate"],
+            drop_rate=options["drop_rate"],
+            seed=options["seed"],
+        )
+        with fake_tezos(node), transaction.atomic():
+            self.seed(options["wallets"], options["transactions"], options["seed"])
+            self.run(node, options)
+            transaction.set_rollback(True)
+
+    def seed(self, wallet_count, transaction_count, seed):
+        rng = random.Random(seed)
+        started_at = time.perf_counter()
+        currency = Currency.objects.create(
+            token_id=rng.randint(10 ** 6, 10 ** 7),
+            name="benchmark",
+            symbol="bench",
+            claim_deadline="2120-01-01",
+            campaign_end="2120-01-01",
+        )
+        keys = {}
+        wallets = []
+        for _ in range(wallet_count):
+            key = Key.generate(export=False)
+            wallet = Wallet.objects.create(
+                wallet_id=Wallet.generate_wallet_id(),
+                public_key=key.public_key(),
+                currency=currency,
+                state=WALLET_STATES.VERIFIED.value,
+            )
+            keys[wallet.pk] = key
+            wallets.append(wallet)
+
+        for index in range(transaction_count):
+            if index < wallet_count:
+                Transaction.objects.create(to_wallet=wallets[index], amount=100)
+                continue
+
+            from_wallet, to_wallet = rng.sample(wallets, 2)
+            from_wallet.refresh_from_db()
+            if from_wallet.balance == 0:
+                Transaction.objects.create(to_wallet=from_wallet, amount=100)
+                continue
+            meta_transaction = MetaTransaction(
+                from_wallet=from_wallet,
+                to_wallet=to_wallet,
+                amount=rng.randint(1, min(from_wallet.balance, 10)),
+                nonce=from_wallet.nonce + 1,
+            )
+            meta_transaction.signature = keys[from_wallet.pk].sign(
+                pack_meta_transaction(meta_transaction.to_meta_transaction_dictionary())
+            )
+            meta_transaction.save()
+
+        self.stdout.write(
+            "seeded wallets={} transactions={} in {:.1f}s".format(
+                wallet_count,
+                Transaction.objects.filter(currency=currency).count(),
+                time.perf_counter() - started_at,
+            )
+        )
+        self.wallets = wallets
+
+    def run(self, node, options):
+        query_count = 0
+
+        def count_query(execute, sql, params, many, context):
+            nonlocal query_count
+            query_count += 1
+            return execute(sql, params, many, context)
+
+        tracemalloc.start()
+        rpc_calls = rpc_call_count()
+        started_at = time.perf_counter()
+        cycles = 0
+        with connection.execute_wrapper(count_query):
+            while cycles < options["max_cycles"]:
+                cycles += 1
+                confirm_sync_batches()
+                batch = sync_batch_to_blockchain(options["batch_size"])
+                for _ in range(settings.TEZOS_CONFIRMATION_DEPTH):
+                    node.bake()
+                if (
+                    batch.size == 0
+                    and not SyncBatch.objects.filter(
+                        state=TRANSACTION_STATES.PENDING.value
+                    ).exists()
+                ):
+                    break
+        elapsed = time.perf_counter() - started_at
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        rpc_calls = rpc_call_count() - rpc_calls
+
+        synced_count = Transaction.objects.filter(
+            to_wallet__in=self.wallets, state=TRANSACTION_STATES.DONE.value
+        ).count()
+        self.stdout.write(
+            "synced={} failed={} open={} cycles={} elapsed={:.2f}s "
+            "throughput={:.1f}tx/s queries={} rpc_calls={} peak_memory={:.1f}MiB".format(
+                synced_count,
+                Transaction.objects.filter(
+                    to_wallet__in=self.wallets, state=TRANSACTION_STATES.FAILED.value
+                ).count(),
+                Transaction.objects.filter(
+                    to_wallet__in=self.wallets, state=TRANSACTION_STATES.OPEN.value
+                ).count(),
+                cycles,
+                elapsed,
+                synced_count / elapsed,
+                query_count,
+                rpc_calls,
+                peak_memory / 2 ** 20,
+            )
+        )
+
+        started_at = time.perf_counter()
+        nonces_match = all(
+            read_nonce_from_chain(wallet.address) == wallet.nonce
+            for wallet in Wallet.objects.filter(pk__in=[w.pk for w in self.wallets])
+        )
+        self.stdout.write(
+            "nonce reads={} in {:.2f}s match={}".format(
+                len(self.wallets), time.perf_counter() - started_at, nonces_match
+            )
+        )
+
+        started_at = time.perf_counter()
+        reconciliation = reconcile_sync_state()
+        self.stdout.write(
+            "reconciliation checked={} mismatches={} in {:.2f}s".format(
+                reconciliation.checked_count,
+                reconciliation.mismatch_count,
+                time.perf_counter() - started_at,
+            )
+        )
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from apps.wallet.utils import confirm_sync_batches
+
+
+class Command(BaseCommand):
+    help = "Completes injected sync batches once the chain confirmed or dropped them"
+
+    def handle(self, *args, **options):
+        self.stdout.write("finished={}".format(confirm_sync_batches()))
@@ -36,7 +36,7 @@ class Command(BaseCommand):
                 for category, msg in mapping:
                     users_to_notify = (
                         Wallet.objects.filter(
-                            currency=currency, balance__gt=0, category=category
+                            currency=currency, cached_balance__gt=0, category=category
                         )
                         .values_list("owner")
                         .distinct()
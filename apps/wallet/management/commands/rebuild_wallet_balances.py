@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Sum
+
+from apps.wallet.models import Transaction, Wallet
+
+
+class Command(BaseCommand):
+    help = (
+        "Verifies the stored wallet balances against the transactions and rebuilds them"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify_only",
+            action="store_true",
+            help="only report wallets with a wrong stored balance, do not fix them",
+        )
+
+    def handle(self, *args, **options):
+        mismatch_count = 0
+        with transaction.atomic():
+            # locking the wallets first makes concurrent transactions wait for the rebuild
+            wallets = list(
+                Wallet.objects.select_for_update()
+                .only("wallet_id", "cached_balance")
+                .order_by("pk")
+            )
+            received = dict(
+                Transaction.objects.order_by()
+                .values_list("to_wallet")
+                .annotate(Sum("amount"))
+            )
+            sent = dict(
+                Transaction.objects.exclude(from_wallet=None)
+                .order_by()
+                .values_list("from_wallet")
+                .annotate(Sum("amount"))
+            )
+
+            for wallet in wallets:
+                balance = received.get(wallet.pk, 0) - sent.get(wallet.pk, 0)
+                if wallet.cached_balance != balance:
+                    mismatch_count += 1
+                    self.stdout.write(
+                        f"{wallet.wallet_id} has stored balance {wallet.cached_balance} but transactions sum up to {balance}"
+                    )
+                    if not options["verify_only"]:
+                        Wallet.objects.filter(pk=wallet.pk).update(
+                            cached_balance=balance
+                        )
+
+        if options["verify_only"] and mismatch_count > 0:
+            raise CommandError(
+                f"{mismatch_count} of {len(wallets)} wallets have a wrong stored balance"
+            )
+        self.stdout.write(
+            f"Checked {len(wallets)} wallets, {mismatch_count} balances rebuilt"
+        )
@@ -0,0 +1,83 @@
+import csv
+
+from django.core.management.base import BaseCommand
+
+from apps.wallet.reconciliation import reconcile_sync_state
+from apps.wallet.tezos import rpc_call_count
+
+
+class Command(BaseCommand):
+    help = "Compares the synced wallet balances with the on-chain ledger"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="continue the last unfinished reconciliation after its checkpoint",
+        )
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help="only compare wallets with activity since the last reconciliation",
+        )
+        parser.add_argument(
+            "--idle_sample_size",
+            type=int,
+            default=None,
+            help="idle wallets compared by an incremental run, defaults to "
+            "RECONCILIATION_IDLE_SAMPLE_SIZE",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="threads reading the ledger, defaults to RECONCILIATION_WORKERS",
+        )
+        parser.add_argument(
+            "--csv",
+            default=None,
+            help="path of a csv file the mismatches are written to",
+        )
+
+    def handle(self, *args, **options):
+        reconciliation = reconcile_sync_state(
+            resume=options["resume"],
+            incremental=options["incremental"],
+            idle_sample_size=options["idle_sample_size"],
+            workers=options["workers"],
+        )
+        self.stdout.write(
+            "checked={} mismatches={} rpc_calls={}".format(
+                reconciliation.checked_count,
+                reconciliation.mismatch_count,
+                rpc_call_count(),
+            )
+        )
+        if options["csv"] is None:
+            return
+
+        with open(options["csv"], "w", newline="") as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(
+                [
+                    "wallet_id",
+                    "address",
+                    "token_id",
+                    "balance",
+                    "on_chain_balance",
+                    "notes",
+                ]
+            )
+            for mismatch in reconciliation.mismatches.select_related(
+                "wallet"
+            ).iterator():
+                writer.writerow(
+                    [
+                        mismatch.wallet.wallet_id,
+                        mismatch.address,
+                        mismatch.token_id,
+                        mismatch.balance,
+                        mismatch.on_chain_balance,
+                        mismatch.notes,
+                    ]
+                )
@@ -2,12 +2,21 @@ import datetime
 
 from django.core.management.base import BaseCommand, CommandError
 
-from apps.wallet.utils import check_sync_state, sync_to_blockchain
+from apps.wallet.utils import (
+    blockchain_sync_lock,
+    check_sync_state,
+    confirm_sync_batches,
+    sync_to_blockchain,
+)
 
 
 class Command(BaseCommand):
     help = "Syncs the database with the blockchain"
 
     def handle(self, *args, **options):
-        sync_to_blockchain(is_dry_run=False)
+        confirm_sync_batches()
+        with blockchain_sync_lock() as acquired:
+            if not acquired:
+                raise CommandError("Another sync is running")
+            sync_to_blockchain(is_dry_run=False)
         # check_sync_state()
@@ -0,0 +1,94 @@
+import signal
+import threading
+import time
+import traceback
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from apps.wallet.tezos import rpc_call_count
+from apps.wallet.utils import (
+    blockchain_sync_lock,
+    confirm_sync_batches,
+    sync_batch_to_blockchain,
+)
+
+
+class Command(BaseCommand):
+    help = "Syncs open transactions and transfer requests in bounded batches, forever"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch_size",
+            type=int,
+            default=settings.BLOCKCHAIN_SYNC_BATCH_SIZE,
+            help="maximum amount of transactions and transfer requests per batch",
+        )
+        parser.add_argument(
+            "--idle_interval",
+            type=float,
+            default=settings.BLOCKCHAIN_SYNC_IDLE_INTERVAL,
+            help="seconds to wait if there is nothing to sync or the batch failed",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="stop after the first cycle",
+        )
+
+    def handle(self, *args, **options):
+        self.stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: self.stop.set())
+        signal.signal(signal.SIGINT, lambda *_: self.stop.set())
+
+        while not self.stop.is_set():
+            try:
+                is_busy = self.sync_cycle(options)
+            except Exception:
+                # an unreachable node or database must not stop the worker, the
+                # items stay open or pending for the next cycle
+                self.stderr.write(
+                    "sync cycle failed\n{}".format(traceback.format_exc())
+                )
+                if not connection.in_atomic_block:
+                    # a broken database connection is reopened by the next cycle
+                    connection.close_if_unusable_or_obsolete()
+                is_busy = False
+
+            if options["once"]:
+                break
+            if not is_busy:
+                self.stop.wait(options["idle_interval"])
+
+    def sync_cycle(self, options):
+        """
+        Confirms the injected batches and syncs the next batch, returns whether more
+        items are likely waiting
+        """
+        started_at = time.monotonic()
+        rpc_calls = rpc_call_count()
+        finished = confirm_sync_batches()
+        with blockchain_sync_lock() as acquired:
+            if acquired:
+                batch = sync_batch_to_blockchain(options["batch_size"])
+        cycle_time = time.monotonic() - started_at
+        rpc_calls = rpc_call_count() - rpc_calls
+
+        if not acquired:
+            self.stdout.write("another sync is running")
+            return False
+
+        self.stdout.write(
+            "batch_size={} lag={:.1f}s cycle_time={:.1f}s applied={} "
+            "confirmed={} rpc_calls={}".format(
+                batch.size,
+                batch.lag,
+                cycle_time,
+                batch.is_applied,
+                finished,
+                rpc_calls,
+            )
+        )
+        # a full and applied batch means more items are waiting, keep going
+        return bool(batch.is_applied) and batch.size >= options["batch_size"]
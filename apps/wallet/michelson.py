@@ -0,0 +1,62 @@
+from functools import lru_cache
+
+from pytezos.michelson.forge import (
+    forge_address,
+    forge_array,
+    forge_int,
+    forge_public_key,
+)
+
+# Byte level PACK encoders for the two fixed layouts in apps.wallet.utils
+# (MESSAGE_STRUCTURE and PAPER_WALLET_MESSAGE_STRUCTURE). They produce the same
+# bytes as MichelsonType.match(...).pack() without building a Micheline tree.
+
+PACK_PREFIX = b"\x05"
+PAIR = b"\x07\x07"  # prim with two args and no annotations, "Pair"
+INT_TAG = b"\x00"
+STRING_TAG = b"\x01"
+SEQUENCE_TAG = b"\x02"
+BYTES_TAG = b"\x0a"
+
+
+def _nat(value):
+    value = int(value)
+    if value < 0:
+        raise ValueError("nat must be >= 0, got {}".format(value))
+    return INT_TAG + forge_int(value)
+
+
+def _string(value):
+    return STRING_TAG + forge_array(value.encode())
+
+
+@lru_cache(maxsize=4096)
+def _key(public_key):
+    return BYTES_TAG + forge_array(forge_public_key(public_key))
+
+
+@lru_cache(maxsize=4096)
+def _address(address):
+    return BYTES_TAG + forge_array(forge_address(address))
+
+
+def pack_message(public_key, nonce, txs):
+    # pair key (pair nat (list (pair address (pair nat nat))))
+    packed_txs = b"".join(
+        PAIR + _address(tx["to_"]) + PAIR + _nat(tx["token_id"]) + _nat(tx["amount"])
+        for tx in txs
+    )
+    return (
+        PACK_PREFIX
+        + PAIR
+        + _key(public_key)
+        + PAIR
+        + _nat(nonce)
+        + SEQUENCE_TAG
+        + forge_array(packed_txs)
+    )
+
+
+def pack_paper_wallet_message(wallet_id, token_id):
+    # pair string nat
+    return PACK_PREFIX + PAIR + _string(wallet_id) + _nat(token_id)
@@ -0,0 +1,45 @@
+# Generated by Django 3.1 on 2026-10-18 09:12
+
+from django.db import migrations, models
+from django.db.models import IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def calculate_cached_balances(apps, schema_editor):
+    Wallet = apps.get_model("wallet", "Wallet")
+    Transaction = apps.get_model("wallet", "Transaction")
+
+    def amount_sum(wallet_field):
+        return Coalesce(
+            Subquery(
+                Transaction.objects.filter(**{wallet_field: OuterRef("pk")})
+                .order_by()
+                .values(wallet_field)
+                .annotate(total=Sum("amount"))
+                .values("total"),
+                output_field=IntegerField(),
+            ),
+            Value(0),
+        )
+
+    Wallet.objects.update(
+        cached_balance=amount_sum("to_wallet") - amount_sum("from_wallet")
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("wallet", "0046_auto_20210416_0911"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="wallet",
+            name="cached_balance",
+            field=models.IntegerField(
+                default=0, editable=False, verbose_name="Balance"
+            ),
+        ),
+        migrations.RunPython(calculate_cached_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 3.1 on 2026-10-18 10:03
+
+from django.db import migrations, models
+from django.db.models import IntegerField, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def calculate_last_nonces(apps, schema_editor):
+    Wallet = apps.get_model("wallet", "Wallet")
+    MetaTransaction = apps.get_model("wallet", "MetaTransaction")
+
+    Wallet.objects.update(
+        last_nonce=Coalesce(
+            Subquery(
+                MetaTransaction.objects.filter(
+                    from_wallet=OuterRef("pk"),
+                    from_public_key=OuterRef("public_key"),
+                    amount__gt=0,
+                )
+                .order_by()
+                .values("from_wallet")
+                .annotate(max_nonce=Max("nonce"))
+                .values("max_nonce"),
+                output_field=IntegerField(),
+            ),
+            Value(0),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("wallet", "0047_wallet_cached_balance"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="wallet",
+            name="last_nonce",
+            field=models.IntegerField(
+                default=0, editable=False, verbose_name="Last nonce"
+            ),
+        ),
+        migrations.RunPython(calculate_last_nonces, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 3.1 on 2026-10-18 10:41
+
+from django.db import migrations, models
+from pytezos.crypto.key import Key
+
+
+def calculate_addresses(apps, schema_editor):
+    Wallet = apps.get_model("wallet", "Wallet")
+
+    wallets = []
+    for wallet in Wallet.objects.only("public_key").iterator():
+        try:
+            wallet.address = Key.from_encoded_key(wallet.public_key).public_key_hash()
+        except:
+            continue
+        wallets.append(wallet)
+    Wallet.objects.bulk_update(wallets, ["address"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("wallet", "0048_wallet_last_nonce"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="wallet",
+            name="address",
+            field=models.CharField(
+                blank=True,
+                db_index=True,
+                editable=False,
+                max_length=36,
+                verbose_name="Address",
+            ),
+        ),
+        migrations.RunPython(calculate_addresses, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 3.1 on 2026-10-18 11:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("wallet", "0049_wallet_address"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="transaction",
+            name="leg_index",
+            field=models.PositiveSmallIntegerField(
+                default=0, editable=False, verbose_name="Leg index"
+            ),
+        ),
+        migrations.AddField(
+            model_name="transaction",
+            name="meta_transaction",
+            field=models.ForeignKey(
+                blank=True,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="legs",
+                to="wallet.metatransaction",
+                verbose_name="Meta transaction",
+            ),
+        ),
+    ]
@@ -0,0 +1,102 @@
+# Generated by Django 3.1 on 2026-10-18 14:05
+
+import uuid
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("wallet", "0050_transaction_meta_transaction"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SyncBatch",
+            fields=[
+                (
+                    "uuid",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True, null=True)),
+                ("updated_at", models.DateTimeField(auto_now=True, null=True)),
+                (
+                    "state",
+                    models.IntegerField(
+                        choices=[
+                            (1, "Open"),
+                            (2, "Pending"),
+                            (3, "Done"),
+                            (4, "Failed"),
+                        ],
+                        default=2,
+                        verbose_name="State",
+                    ),
+                ),
+                (
+                    "operation_hash",
+                    models.CharField(
+                        blank=True, max_length=128, verbose_name="Operation hash"
+                    ),
+                ),
+                (
+                    "result",
+                    models.JSONField(blank=True, null=True, verbose_name="Result"),
+                ),
+                ("notes", models.TextField(blank=True, verbose_name="Notes")),
+                (
+                    "item_count",
+                    models.PositiveIntegerField(default=0, verbose_name="Items"),
+                ),
+                (
+                    "submitted_to_chain_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Submitted to chain"
+                    ),
+                ),
+                (
+                    "finished_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Finished"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Sync batch",
+                "verbose_name_plural": "Sync batches",
+                "ordering": ["-created_at"],
+            },
+        ),
+        migrations.AddField(
+            model_name="transaction",
+            name="sync_batch",
+            field=models.ForeignKey(
+                blank=True,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="transactions",
+                to="wallet.syncbatch",
+                verbose_name="Sync batch",
+            ),
+        ),
+        migrations.AddField(
+            model_name="walletpublickeytransferrequest",
+            name="sync_batch",
+            field=models.ForeignKey(
+                blank=True,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="transfer_requests",
+                to="wallet.syncbatch",
+            ),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 3.1 on 2026-10-18 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("wallet", "0051_syncbatch"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="syncbatch",
+            name="checked_level",
+            field=models.IntegerField(
+                blank=True, null=True, verbose_name="Checked up to level"
+            ),
+        ),
+        migrations.AddField(
+            model_name="syncbatch",
+            name="included_level",
+            field=models.IntegerField(
+                blank=True, null=True, verbose_name="Included at level"
+            ),
+        ),
+        migrations.AddField(
+            model_name="syncbatch",
+            name="injected_level",
+            field=models.IntegerField(
+                blank=True, null=True, verbose_name="Injected at level"
+            ),
+        ),
+    ]
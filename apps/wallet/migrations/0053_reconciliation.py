@@ -0,0 +1,104 @@
+# Generated by Django 3.1 on 2026-10-18 15:12
+
+import uuid
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("wallet", "0052_syncbatch_levels"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Reconciliation",
+            fields=[
+                (
+                    "uuid",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True, null=True)),
+                ("updated_at", models.DateTimeField(auto_now=True, null=True)),
+                (
+                    "checkpoint",
+                    models.UUIDField(blank=True, null=True, verbose_name="Checkpoint"),
+                ),
+                (
+                    "checked_count",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Checked wallets"
+                    ),
+                ),
+                (
+                    "mismatch_count",
+                    models.PositiveIntegerField(default=0, verbose_name="Mismatches"),
+                ),
+                (
+                    "finished_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Finished"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Reconciliation",
+                "verbose_name_plural": "Reconciliations",
+                "ordering": ["-created_at"],
+            },
+        ),
+        migrations.CreateModel(
+            name="ReconciliationMismatch",
+            fields=[
+                (
+                    "uuid",
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True, null=True)),
+                ("updated_at", models.DateTimeField(auto_now=True, null=True)),
+                ("address", models.CharField(max_length=36, verbose_name="Address")),
+                ("token_id", models.IntegerField(verbose_name="Token Id")),
+                ("balance", models.IntegerField(verbose_name="Synced balance")),
+                (
+                    "on_chain_balance",
+                    models.IntegerField(verbose_name="On-chain balance"),
+                ),
+                ("notes", models.TextField(blank=True, verbose_name="Notes")),
+                (
+                    "reconciliation",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="mismatches",
+                        to="wallet.reconciliation",
+                        verbose_name="Reconciliation",
+                    ),
+                ),
+                (
+                    "wallet",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="reconciliation_mismatches",
+                        to="wallet.wallet",
+                        verbose_name="Wallet",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Reconciliation mismatch",
+                "verbose_name_plural": "Reconciliation mismatches",
+                "ordering": ["created_at"],
+            },
+        ),
+    ]
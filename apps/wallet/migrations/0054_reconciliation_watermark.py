@@ -0,0 +1,23 @@
+# Generated by Django 3.1 on 2026-10-18 15:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("wallet", "0053_reconciliation"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="reconciliation",
+            name="since",
+            field=models.DateTimeField(blank=True, null=True, verbose_name="Since"),
+        ),
+        migrations.AddField(
+            model_name="reconciliation",
+            name="watermark",
+            field=models.DateTimeField(blank=True, null=True, verbose_name="Watermark"),
+        ),
+    ]
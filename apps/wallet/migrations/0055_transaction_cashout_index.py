@@ -0,0 +1,20 @@
+# Generated by Django 3.1 on 2026-10-18 16:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("wallet", "0054_reconciliation_watermark"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(
+                fields=["to_wallet", "from_wallet"],
+                name="wallet_tran_to_wall_dcf9c5_idx",
+            ),
+        ),
+    ]
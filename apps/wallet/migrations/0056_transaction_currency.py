@@ -0,0 +1,61 @@
+# Generated by Django 3.1 on 2026-10-18 16:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery
+
+
+def set_currency_and_tags(apps, schema_editor):
+    Wallet = apps.get_model("wallet", "Wallet")
+    Transaction = apps.get_model("wallet", "Transaction")
+
+    Transaction.objects.update(
+        currency=Subquery(
+            Wallet.objects.filter(pk=OuterRef("to_wallet")).values("currency")[:1]
+        )
+    )
+    Transaction.objects.filter(from_wallet=F("currency__owner_wallet")).update(
+        is_from_owner=True
+    )
+    Transaction.objects.filter(to_wallet=F("currency__owner_wallet")).update(
+        is_to_owner=True
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("currency", "0031_currency_needs_sms_verification"),
+        ("wallet", "0055_transaction_cashout_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="transaction",
+            name="currency",
+            field=models.ForeignKey(
+                blank=True,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.DO_NOTHING,
+                related_name="transactions",
+                to="currency.currency",
+                verbose_name="Currency",
+            ),
+        ),
+        migrations.AddField(
+            model_name="transaction",
+            name="is_from_owner",
+            field=models.BooleanField(
+                default=False, editable=False, verbose_name="From owner wallet"
+            ),
+        ),
+        migrations.AddField(
+            model_name="transaction",
+            name="is_to_owner",
+            field=models.BooleanField(
+                default=False, editable=False, verbose_name="To owner wallet"
+            ),
+        ),
+        migrations.RunPython(set_currency_and_tags, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.1 on 2026-10-18 16:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("wallet", "0056_transaction_currency"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(
+                fields=["from_wallet", "created_at"],
+                name="wallet_tran_from_wa_a5cf14_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="transaction",
+            index=models.Index(
+                fields=["to_wallet", "created_at"],
+                name="wallet_tran_to_wall_d7f37c_idx",
+            ),
+        ),
+    ]
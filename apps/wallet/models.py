@@ -1,25 +1,28 @@
 import base64
+import collections
 import secrets
 import string
 from enum import Enum
 from urllib.parse import urlencode
 
 import pysodium
-import pytezos
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
 from django.db import models, transaction
-from django.db.models import Max, Q, Sum
+from django.db.models import F, Max, Sum
 from django.utils.crypto import get_random_string
 from django.utils.text import slugify
+from django.utils.timezone import now
 from django.utils.translation import ugettext_lazy as _
-from fcm_django.models import FCMDevice
 from pytezos.crypto.key import Key
 from schwifty import IBAN
 
 from apps.currency.mixins import CurrencyOwnedMixin
-from apps.wallet.utils import create_message
+from apps.currency.models import Currency
+from apps.tasks.utils import enqueue
+from apps.wallet.signatures import verify_signature
+from apps.wallet.utils import pack_meta_transaction, send_push_notification
 from project.mixins import UUIDModel
 
 
@@ -64,6 +67,9 @@ class Wallet(CurrencyOwnedMixin):
     public_key = models.CharField(
         _("Publickey"), unique=True, blank=True, editable=True, max_length=60
     )  # encoded public_key
+    address = models.CharField(
+        _("Address"), blank=True, editable=False, db_index=True, max_length=36
+    )  # tz address derived from public_key in clean
     category = models.IntegerField(
         _("Category"),
         default=WALLET_CATEGORIES.CONSUMER.value,
@@ -72,23 +78,42 @@ class Wallet(CurrencyOwnedMixin):
     state = models.IntegerField(
         _("State"), default=WALLET_STATES.UNVERIFIED.value, choices=WALLET_STATE_CHOICES
     )
+    # maintained by Transaction.save, rebuild with "manage.py rebuild_wallet_balances"
+    cached_balance = models.IntegerField(_("Balance"), default=0, editable=False)
+    # nonce of the last accepted meta transaction signed with the current public_key
+    last_nonce = models.IntegerField(_("Last nonce"), default=0, editable=False)
 
-    @property
-    def address(self):
-        return Key.from_encoded_key(self.public_key).public_key_hash()
+    @staticmethod
+    def address_from_public_key(public_key):
+        return Key.from_encoded_key(public_key).public_key_hash()
 
     @property
     def balance(self):
+        return self.cached_balance
+
+    def calculate_balance(self):
         return (
             self.to_transactions.aggregate(Sum("amount")).get("amount__sum") or 0
         ) - (self.from_transactions.aggregate(Sum("amount")).get("amount__sum") or 0)
 
+    @staticmethod
+    def apply_balance_deltas(deltas):
+        # sorted to always lock the wallet rows in the same order
+        for wallet_pk in sorted(deltas, key=str):
+            if deltas[wallet_pk] != 0:
+                Wallet.objects.filter(pk=wallet_pk).update(
+                    cached_balance=F("cached_balance") + deltas[wallet_pk]
+                )
+
     @property
     def from_metatransactions(self):
         return MetaTransaction.objects.filter(from_wallet=self)
 
     @property
     def nonce(self):
+        return self.last_nonce
+
+    def calculate_nonce(self):
         # filter out amount==0
         transactions = self.from_metatransactions.filter(
             from_public_key=self.public_key, amount__gt=0
@@ -132,17 +157,19 @@ class Wallet(CurrencyOwnedMixin):
         )
 
     def __notify_owner_devices(self, message, data=None):
-        devices = FCMDevice.objects.filter(user=self.owner)
-        devices.send_message(
-            title=settings.PUSH_NOTIFICATION_TITLE, body=message, data=data
-        )
+        if self.owner_id is not None:
+            enqueue(
+                send_push_notification,
+                args=[self.owner_id, message],
+                kwargs={"data": data},
+            )
 
     def clean(self, *args, **kwargs):
         super(Wallet, self).clean(*args, **kwargs)
         errors = {}
         # TODO: more to clean?
         try:
-            self.address
+            self.address = Wallet.address_from_public_key(self.public_key)
         except:
             errors["public_key"] = ValidationError(
                 _("Public key is not in valid format")
@@ -154,6 +181,23 @@ class Wallet(CurrencyOwnedMixin):
     def save(self, *args, **kwargs):
         if self.category == WALLET_CATEGORIES.CONSUMER.value and self._state.adding:
             self.state = WALLET_STATES.VERIFIED.value
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            # never write back a possibly stale balance or nonce, only transactions move them
+            update_fields = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in ["cached_balance", "last_nonce"]
+            ]
+            if (
+                Wallet.objects.filter(pk=self.pk)
+                .exclude(public_key=self.public_key)
+                .exists()
+            ):
+                # the nonce is counted per public key
+                self.last_nonce = self.calculate_nonce()
+                update_fields.append("last_nonce")
+            kwargs["update_fields"] = update_fields
         super().save(*args, **kwargs)
 
     class Meta:
@@ -175,6 +219,7 @@ class OwnerWallet(Wallet):
             key = Key.generate()
             self.private_key = key.secret_key()
             self.public_key = key.public_key()
+        self.address = Wallet.address_from_public_key(self.public_key)
         super(Wallet, self).clean(*args, **kwargs)
 
 
@@ -335,6 +380,85 @@ TRANSACTION_STATE_CHOICES = (
 )
 
 
+class SyncBatch(UUIDModel):
+    """
+    One operation group injected by the blockchain sync. The items in it point here
+    instead of every one of them storing the operation result.
+    """
+
+    state = models.IntegerField(
+        verbose_name=_("State"),
+        choices=TRANSACTION_STATE_CHOICES,
+        default=TRANSACTION_STATES.PENDING.value,
+    )
+    operation_hash = models.CharField(
+        verbose_name=_("Operation hash"), max_length=128, blank=True
+    )
+    # raw preapply or inject result of the node
+    result = models.JSONField(verbose_name=_("Result"), null=True, blank=True)
+    notes = models.TextField(verbose_name=_("Notes"), blank=True)
+    item_count = models.PositiveIntegerField(verbose_name=_("Items"), default=0)
+    submitted_to_chain_at = models.DateTimeField(
+        verbose_name=_("Submitted to chain"), null=True, blank=True
+    )
+    finished_at = models.DateTimeField(
+        verbose_name=_("Finished"), null=True, blank=True
+    )
+    # block levels: the head when injecting, the block including the operation and
+    # the last block searched for it, see confirm_sync_batches
+    injected_level = models.IntegerField(
+        verbose_name=_("Injected at level"), null=True, blank=True
+    )
+    included_level = models.IntegerField(
+        verbose_name=_("Included at level"), null=True, blank=True
+    )
+    checked_level = models.IntegerField(
+        verbose_name=_("Checked up to level"), null=True, blank=True
+    )
+
+    def update_items(self, items, state):
+        """
+        Moves the given transactions and transfer requests to state, with one
+        UPDATE per model
+        """
+        pks_by_model = collections.defaultdict(list)
+        for item in items:
+            pks_by_model[type(item)].append(item.pk)
+        for model, pks in pks_by_model.items():
+            model.objects.filter(pk__in=pks).update(
+                state=state,
+                sync_batch=self,
+                notes="",
+                operation_hash=self.operation_hash,
+                submitted_to_chain_at=self.submitted_to_chain_at,
+            )
+
+    def finish(self, state, result=None, notes=""):
+        """
+        Moves the batch and the items in it to their final state
+        """
+        self.state = state
+        if result is not None:
+            self.result = result
+        self.notes = notes
+        self.finished_at = now()
+        self.save()
+        for items in [self.transactions, self.transfer_requests]:
+            items.update(
+                state=state,
+                operation_hash=self.operation_hash,
+                submitted_to_chain_at=self.submitted_to_chain_at,
+            )
+
+    def __str__(self):
+        return self.operation_hash or str(self.uuid)
+
+    class Meta:
+        ordering = ["-created_at"]
+        verbose_name = _("Sync batch")
+        verbose_name_plural = _("Sync batches")
+
+
 class Transaction(UUIDModel):
     from_wallet = models.ForeignKey(
         Wallet,
@@ -372,6 +496,47 @@ class Transaction(UUIDModel):
 
     user_notes = models.TextField(verbose_name=_("User notes"), blank=True)
 
+    # further recipients of a multi recipient meta transaction, the meta transaction
+    # itself is the first recipient and the legs follow in the signed order
+    meta_transaction = models.ForeignKey(
+        "MetaTransaction",
+        verbose_name=_("Meta transaction"),
+        on_delete=models.CASCADE,
+        related_name="legs",
+        blank=True,
+        null=True,
+        editable=False,
+    )
+    leg_index = models.PositiveSmallIntegerField(
+        verbose_name=_("Leg index"), default=0, editable=False
+    )
+    sync_batch = models.ForeignKey(
+        SyncBatch,
+        verbose_name=_("Sync batch"),
+        on_delete=models.SET_NULL,
+        related_name="transactions",
+        blank=True,
+        null=True,
+        editable=False,
+    )
+    # copied from the wallets when saving, so transactions are filtered by currency
+    # and tagged without joining the wallets and currencies
+    currency = models.ForeignKey(
+        Currency,
+        verbose_name=_("Currency"),
+        on_delete=models.DO_NOTHING,
+        related_name="transactions",
+        blank=True,
+        null=True,
+        editable=False,
+    )
+    is_from_owner = models.BooleanField(
+        verbose_name=_("From owner wallet"), default=False, editable=False
+    )
+    is_to_owner = models.BooleanField(
+        verbose_name=_("To owner wallet"), default=False, editable=False
+    )
+
     def __str__(self):
         if self.from_wallet:
             return "{} -{}-> {}".format(
@@ -417,22 +582,50 @@ class Transaction(UUIDModel):
 
     @property
     def tag(self):
-        if (
-            self.from_wallet
-            and self.from_wallet == self.from_wallet.currency.owner_wallet
-        ):
+        if self.is_from_owner:
             return "from_owner"
 
-        if self.to_wallet == self.to_wallet.currency.owner_wallet:
+        if self.is_to_owner:
             return "to_owner"
 
         return ""
 
-    @staticmethod
-    def get_belonging_to_user(user):
-        belonging_wallets = user.wallets.all()
-        return Transaction.objects.filter(
-            Q(from_wallet__in=belonging_wallets) | Q(to_wallet__in=belonging_wallets)
+    def set_currency_and_tags(self):
+        """
+        Copies the currency of the wallets and whether they are its owner wallet,
+        called before inserting the transaction
+        """
+        currency = self.to_wallet.currency
+        self.currency_id = currency.pk
+        self.is_from_owner = (
+            self.from_wallet_id is not None
+            and self.from_wallet_id == currency.owner_wallet_id
+        )
+        self.is_to_owner = self.to_wallet_id == currency.owner_wallet_id
+
+    @property
+    def balance_deltas(self):
+        deltas = collections.Counter()
+        deltas[self.to_wallet_id] += self.amount
+        if self.from_wallet_id:
+            deltas[self.from_wallet_id] -= self.amount
+        return deltas
+
+    @classmethod
+    def get_belonging_to_user(cls, user):
+        """
+        Transactions from or to the wallets of the user. The pks are the union of one
+        lookup per wallet column, each backed by its (wallet, created_at) index, an
+        OR across both columns scans the whole table instead. The union still
+        collects every pk of the user before the rows are ordered and paged, so a
+        page costs as much as the whole history of the user's wallets, only the
+        other users' transactions are not read.
+        """
+        belonging_wallets = user.wallets.values("pk")
+        sent = Transaction.objects.filter(from_wallet__in=belonging_wallets)
+        received = Transaction.objects.filter(to_wallet__in=belonging_wallets)
+        return cls.objects.filter(
+            pk__in=sent.order_by().values("pk").union(received.order_by().values("pk"))
         )
 
     def clean(self, *args, **kwargs):
@@ -534,6 +727,29 @@ class Transaction(UUIDModel):
             raise ValidationError(errors)
         super(Transaction, self).clean(*args, **kwargs)
 
+    def save(self, *args, **kwargs):
+        if self._state.adding and self.to_wallet_id is not None:
+            self.set_currency_and_tags()
+
+        with transaction.atomic():
+            deltas = collections.Counter()
+            if not self._state.adding:
+                previous = (
+                    Transaction.objects.select_for_update().filter(pk=self.pk).first()
+                )
+                if previous:
+                    deltas.subtract(previous.balance_deltas)
+            super(Transaction, self).save(*args, **kwargs)
+            deltas.update(self.balance_deltas)
+            Wallet.apply_balance_deltas(deltas)
+
+        # keep the already loaded wallets in sync with the stored balance
+        for field_name in ["from_wallet", "to_wallet"]:
+            if self._meta.get_field(field_name).is_cached(self):
+                wallet = getattr(self, field_name)
+                if wallet is not None:
+                    wallet.refresh_from_db(fields=["cached_balance"])
+
     @property
     def currency_amount(self):
         if self.from_wallet:
@@ -548,6 +764,14 @@ class Transaction(UUIDModel):
         ordering = ["-created_at"]
         verbose_name = _("Transaction")
         verbose_name_plural = _("Transactions")
+        indexes = [
+            # payments of a user's wallets to the cashout wallets, see
+            # OpenCashoutTransactions
+            models.Index(fields=["to_wallet", "from_wallet"]),
+            # history of a wallet, see get_belonging_to_user
+            models.Index(fields=["from_wallet", "created_at"]),
+            models.Index(fields=["to_wallet", "created_at"]),
+        ]
 
 
 class MetaTransaction(Transaction):
@@ -557,6 +781,24 @@ class MetaTransaction(Transaction):
         _("Publickey"), blank=True, editable=False, max_length=60
     )
 
+    def set_legs(self, legs):
+        # unsaved transactions to the further recipients, created in save
+        self._pending_legs = list(legs)
+
+    @property
+    def recipients(self):
+        if hasattr(self, "_pending_legs"):
+            legs = self._pending_legs
+        elif self._state.adding:
+            legs = []
+        else:
+            legs = sorted(self.legs.all(), key=lambda leg: leg.leg_index)
+        return [self] + legs
+
+    @property
+    def total_amount(self):
+        return sum(recipient.amount or 0 for recipient in self.recipients)
+
     def to_meta_transaction_dictionary(self):
         return {
             "from_public_key": self.from_wallet.public_key,
@@ -564,10 +806,11 @@ class MetaTransaction(Transaction):
             "nonce": self.nonce,
             "txs": [
                 {
-                    "to_": self.to_wallet.address,
-                    "amount": self.amount,
+                    "to_": recipient.to_wallet.address,
+                    "amount": recipient.amount,
                     "token_id": self.from_wallet.currency.token_id,
                 }
+                for recipient in self.recipients
             ],
         }
 
@@ -591,21 +834,35 @@ class MetaTransaction(Transaction):
                     )
                 )
 
+        legs = self.recipients[1:]
+        if self._state.adding and len(legs) > 0:
+            if any(not recipient.amount for recipient in self.recipients):
+                errors["amount"] = ValidationError(
+                    _(
+                        "Every recipient of a meta transaction must receive an amount > 0"
+                    )
+                )
+            elif self.from_wallet and self.from_wallet.balance < self.total_amount:
+                errors["amount"] = ValidationError(
+                    _("Balance of from_wallet must be greater than the total amount")
+                )
+            for leg in legs:
+                leg.from_wallet = self.from_wallet
+                try:
+                    leg.full_clean(
+                        exclude=["from_wallet", "to_wallet"], validate_unique=False
+                    )
+                except ValidationError as error:
+                    errors["legs"] = ValidationError(error.messages)
+
         try:
-            message = create_message(
-                self.from_wallet,
-                self.to_wallet,
-                self.nonce,
-                self.from_wallet.currency.token_id,
-                self.amount,
-            )
+            message = pack_meta_transaction(self.to_meta_transaction_dictionary())
         except:
             pass
         if self.from_wallet and self.to_wallet:
             self.from_public_key = self.from_wallet.public_key
-            key = pytezos.Key.from_encoded_key(self.from_public_key)
             try:
-                key.verify(self.signature, message)
+                verify_signature(message, self.signature, self.from_public_key)
             except ValueError:
                 errors["signature"] = ValidationError(_("Signature is invalid"))
 
@@ -614,6 +871,205 @@ class MetaTransaction(Transaction):
 
         super(MetaTransaction, self).clean(*args, **kwargs)
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding or not self.from_wallet_id:
+            return super(MetaTransaction, self).save(*args, **kwargs)
+
+        with transaction.atomic():
+            # concurrent submissions for the same wallet wait here, so the nonce
+            # and balance checks in clean see the state left by the previous one.
+            # Every wallet the balances move on is locked at once and in the order
+            # of apply_balance_deltas, so payments in opposite directions between
+            # the same wallets cannot deadlock.
+            wallet_pks = {self.from_wallet_id} | {
+                recipient.to_wallet_id for recipient in self.recipients
+            }
+            locked_wallets = {
+                wallet.pk: wallet
+                for wallet in Wallet.objects.select_for_update()
+                .filter(pk__in=wallet_pks)
+                .order_by("pk")
+                .only("cached_balance", "last_nonce")
+            }
+            locked_wallet = locked_wallets[self.from_wallet_id]
+            self.from_wallet.cached_balance = locked_wallet.cached_balance
+            self.from_wallet.last_nonce = locked_wallet.last_nonce
+
+            super(MetaTransaction, self).save(*args, **kwargs)
+
+            legs = self.recipients[1:]
+            if len(legs) > 0:
+                deltas = collections.Counter()
+                for leg_index, leg in enumerate(legs, 1):
+                    leg.from_wallet = self.from_wallet
+                    leg.meta_transaction = self
+                    leg.leg_index = leg_index
+                    leg.set_currency_and_tags()
+                    deltas.update(leg.balance_deltas)
+                Transaction.objects.bulk_create(legs)
+                Wallet.apply_balance_deltas(deltas)
+                self.from_wallet.refresh_from_db(fields=["cached_balance"])
+
+            if self.amount > 0:
+                Wallet.objects.filter(pk=self.from_wallet_id).update(
+                    last_nonce=self.nonce
+                )
+                self.from_wallet.last_nonce = self.nonce
+
+    @staticmethod
+    def create_in_bulk(items):
+        """
+        Validates and inserts meta transactions in the given order. items are dicts
+        with the model fields, the wallets given by their wallet_id. The wallets are
+        looked up once and the balances and nonces are carried from one item to the
+        next. Returns a (meta_transaction, errors) tuple per item, meta_transaction
+        is None if the item was rejected.
+        """
+        wallet_ids = {
+            item[field_name]
+            for item in items
+            for field_name in ["from_wallet", "to_wallet"]
+        }
+        results = []
+        meta_transactions = []
+        deltas = collections.Counter()
+        nonces = {}
+
+        with transaction.atomic():
+            wallets = Wallet.objects.select_related(
+                "currency", "currency__owner_wallet"
+            ).in_bulk(wallet_ids, field_name="wallet_id")
+            wallets_by_pk = {wallet.pk: wallet for wallet in wallets.values()}
+            # every wallet the balances move on is locked at once and in pk order,
+            # as in MetaTransaction.save
+            for locked_wallet in (
+                Wallet.objects.select_for_update()
+                .filter(pk__in=wallets_by_pk)
+                .order_by("pk")
+                .only("cached_balance", "last_nonce")
+            ):
+                wallet = wallets_by_pk[locked_wallet.pk]
+                wallet.cached_balance = locked_wallet.cached_balance
+                wallet.last_nonce = locked_wallet.last_nonce
+
+            used_signatures = set(
+                MetaTransaction.objects.filter(
+                    signature__in=[item["signature"] for item in items]
+                ).values_list("signature", flat=True)
+            )
+            # zero amounts do not advance the nonce, so the running nonce alone does
+            # not keep a nonce from being used twice
+            used_nonces = set(
+                MetaTransaction.objects.filter(
+                    nonce__in=[item["nonce"] for item in items],
+                    from_public_key__in=[
+                        wallet.public_key for wallet in wallets.values()
+                    ],
+                ).values_list("nonce", "from_public_key")
+            )
+
+            for item in items:
+                errors = {}
+                for field_name in ["from_wallet", "to_wallet"]:
+                    if item[field_name] not in wallets:
+                        errors[field_name] = [_("Wallet does not exist")]
+                if item["signature"] in used_signatures:
+                    errors["signature"] = [
+                        _("Meta transaction with this Signature already exists.")
+                    ]
+                if len(errors) > 0:
+                    results.append((None, errors))
+                    continue
+
+                meta_transaction = MetaTransaction(
+                    **{
+                        **item,
+                        "from_wallet": wallets[item["from_wallet"]],
+                        "to_wallet": wallets[item["to_wallet"]],
+                    }
+                )
+                try:
+                    # the wallets are already resolved and the uniqueness is covered
+                    # by the signature and nonce checks
+                    meta_transaction.full_clean(
+                        exclude=["from_wallet", "to_wallet"], validate_unique=False
+                    )
+                except ValidationError as error:
+                    results.append((None, error.message_dict))
+                    continue
+                nonce_key = (meta_transaction.nonce, meta_transaction.from_public_key)
+                if nonce_key in used_nonces:
+                    results.append(
+                        (
+                            None,
+                            {
+                                "nonce": [
+                                    _(
+                                        "Meta transaction with this Nonce and Publickey already exists."
+                                    )
+                                ]
+                            },
+                        )
+                    )
+                    continue
+
+                used_signatures.add(meta_transaction.signature)
+                used_nonces.add(nonce_key)
+                meta_transaction.set_currency_and_tags()
+                meta_transaction.from_wallet.cached_balance -= meta_transaction.amount
+                meta_transaction.to_wallet.cached_balance += meta_transaction.amount
+                deltas.update(meta_transaction.balance_deltas)
+                if meta_transaction.amount > 0:
+                    meta_transaction.from_wallet.last_nonce = meta_transaction.nonce
+                    nonces[meta_transaction.from_wallet_id] = meta_transaction.nonce
+                meta_transactions.append(meta_transaction)
+                results.append((meta_transaction, {}))
+
+            # bulk_create does not support multi-table inheritance, so the
+            # transaction rows are created first and the meta transaction rows are
+            # inserted the same way Model.save inserts them
+            transactions = Transaction.objects.bulk_create(
+                [
+                    Transaction(
+                        **{
+                            field.attname: getattr(meta_transaction, field.attname)
+                            for field in Transaction._meta.concrete_fields
+                        }
+                    )
+                    for meta_transaction in meta_transactions
+                ]
+            )
+            for meta_transaction, created_transaction in zip(
+                meta_transactions, transactions
+            ):
+                meta_transaction.created_at = created_transaction.created_at
+                meta_transaction.updated_at = created_transaction.updated_at
+                meta_transaction.transaction_ptr_id = created_transaction.pk
+                meta_transaction._state.adding = False
+                meta_transaction._state.db = created_transaction._state.db
+            if len(meta_transactions) > 0:
+                MetaTransaction._base_manager._insert(
+                    meta_transactions,
+                    fields=MetaTransaction._meta.local_concrete_fields,
+                )
+
+            Wallet.apply_balance_deltas(deltas)
+            for wallet_pk, nonce in nonces.items():
+                Wallet.objects.filter(pk=wallet_pk).update(last_nonce=nonce)
+
+            def notify_owners():
+                for meta_transaction in meta_transactions:
+                    meta_transaction.to_wallet.notify_owner_receiving_money(
+                        meta_transaction.from_wallet, meta_transaction.amount
+                    )
+                    meta_transaction.from_wallet.notify_transfer_successful(
+                        meta_transaction.to_wallet, meta_transaction.amount
+                    )
+
+            transaction.on_commit(notify_owners)
+
+        return results
+
     class Meta:
         ordering = ["-created_at"]
         verbose_name = _("Meta transaction")
@@ -635,6 +1091,14 @@ class WalletPublicKeyTransferRequest(UUIDModel):
     operation_hash = models.CharField(max_length=128, blank=True)
 
     notes = models.TextField(blank=True, editable=False)
+    sync_batch = models.ForeignKey(
+        SyncBatch,
+        on_delete=models.SET_NULL,
+        related_name="transfer_requests",
+        blank=True,
+        null=True,
+        editable=False,
+    )
 
     class Meta:
         ordering = ["-created_at"]
@@ -693,3 +1157,64 @@ class CashOutRequest(UUIDModel):
         ordering = ["created_at"]
         verbose_name = _("Cash out request")
         verbose_name_plural = _("Cash out requests")
+
+
+class Reconciliation(UUIDModel):
+    """
+    One comparison of the wallet balances with the on-chain ledger, see
+    apps.wallet.reconciliation. Wallets are checked in the order of their primary
+    key, checkpoint is the last one checked so an interrupted run can resume.
+    """
+
+    # the start of this run and the watermark of the run before, an incremental run
+    # only compares the wallets with activity since then
+    watermark = models.DateTimeField(verbose_name=_("Watermark"), null=True, blank=True)
+    since = models.DateTimeField(verbose_name=_("Since"), null=True, blank=True)
+    checkpoint = models.UUIDField(verbose_name=_("Checkpoint"), null=True, blank=True)
+    checked_count = models.PositiveIntegerField(
+        verbose_name=_("Checked wallets"), default=0
+    )
+    mismatch_count = models.PositiveIntegerField(
+        verbose_name=_("Mismatches"), default=0
+    )
+    finished_at = models.DateTimeField(
+        verbose_name=_("Finished"), null=True, blank=True
+    )
+
+    def __str__(self):
+        return "{} ({})".format(self.created_at, self.mismatch_count)
+
+    class Meta:
+        ordering = ["-created_at"]
+        verbose_name = _("Reconciliation")
+        verbose_name_plural = _("Reconciliations")
+
+
+class ReconciliationMismatch(UUIDModel):
+    reconciliation = models.ForeignKey(
+        Reconciliation,
+        verbose_name=_("Reconciliation"),
+        on_delete=models.CASCADE,
+        related_name="mismatches",
+    )
+    wallet = models.ForeignKey(
+        Wallet,
+        verbose_name=_("Wallet"),
+        on_delete=models.CASCADE,
+        related_name="reconciliation_mismatches",
+    )
+    address = models.CharField(verbose_name=_("Address"), max_length=36)
+    token_id = models.IntegerField(verbose_name=_("Token Id"))
+    # sum of the synced transactions, the open ones are not on chain yet
+    balance = models.IntegerField(verbose_name=_("Synced balance"))
+    on_chain_balance = models.IntegerField(verbose_name=_("On-chain balance"))
+    notes = models.TextField(verbose_name=_("Notes"), blank=True)
+
+    @property
+    def difference(self):
+        return self.on_chain_balance - self.balance
+
+    class Meta:
+        ordering = ["created_at"]
+        verbose_name = _("Reconciliation mismatch")
+        verbose_name_plural = _("Reconciliation mismatches")
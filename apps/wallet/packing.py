@@ -0,0 +1,193 @@
+"""
+Splits the items of a blockchain sync into operation groups that stay within the
+protocol limits. Items keep their order, a later item may spend tokens an earlier
+one mints or transfers. The costs are estimates, see TEZOS_SYNC_COSTS.
+"""
+from collections import namedtuple
+
+from django.conf import settings
+
+# the mints to one address and token share a contract call, the items of the other
+# kinds share one contract call per kind and operation group
+MINT = "mint"
+TRANSFER = "transfer"
+META_TRANSFER = "meta_transfer"
+KEY_TRANSFER = "key_transfer"
+SHARED_KINDS = [TRANSFER, META_TRANSFER, KEY_TRANSFER]
+
+# kind is None for items synced as part of another one, e.g. the legs of a meta
+# transaction. tx_count is the amount of token transfers the item adds.
+SyncItem = namedtuple("SyncItem", ["kind", "item", "payload", "tx_count"])
+Cost = namedtuple("Cost", ["gas", "storage", "size"])
+
+
+def estimate_cost(sync_item):
+    if sync_item.kind is None:
+        return Cost(0, 0, 0)
+
+    costs = settings.TEZOS_SYNC_COSTS
+    item_cost = costs[sync_item.kind]
+    tx_cost = costs["tx"]
+    return Cost(
+        gas=item_cost["gas"] + sync_item.tx_count * tx_cost["gas"],
+        storage=item_cost["storage"] + sync_item.tx_count * tx_cost["storage"],
+        size=item_cost["size"] + sync_item.tx_count * tx_cost["size"],
+    )
+
+
+def mint_key(sync_item):
+    return sync_item.payload["address"], sync_item.payload["token_id"]
+
+
+class PackedOperationGroup:
+    def __init__(self):
+        # mints by address and token id
+        self.mints = {}
+        self.shared = {kind: [] for kind in SHARED_KINDS}
+        self.items = []
+        self.operation_costs = {}
+        self.size = 0
+
+    @property
+    def operation_count(self):
+        return len(self.mints) + sum(
+            1 for sync_items in self.shared.values() if len(sync_items) > 0
+        )
+
+    @property
+    def mint_payloads(self):
+        """
+        One mint payload per address and token, with the amounts summed up
+        """
+        return [
+            {
+                **sync_items[0].payload,
+                "amount": sum(sync_item.payload["amount"] for sync_item in sync_items),
+            }
+            for sync_items in self.mints.values()
+        ]
+
+    @property
+    def item_count(self):
+        # items synced as part of another one do not count
+        return sum(1 for sync_item in self.items if sync_item.kind is not None)
+
+    @property
+    def is_single_item(self):
+        return self.item_count == 1
+
+    def fits(self, sync_item):
+        if sync_item.kind is None:
+            return True
+        if sync_item.kind == MINT and mint_key(sync_item) in self.mints:
+            # only raises the amount of a mint in the group
+            return True
+
+        operation = settings.TEZOS_SYNC_COSTS["operation"]
+        cost = estimate_cost(sync_item)
+        operation_count = self.operation_count
+        size = self.size + cost.size
+        operation_cost = self.operation_costs.get(sync_item.kind)
+        if sync_item.kind == MINT or operation_cost is None:
+            # a new contract call, it reserves the whole gas limit of an operation
+            operation_cost = Cost(**operation)
+            operation_count += 1
+            size += operation["size"]
+        return (
+            operation_count * settings.TEZOS_OPERATION_GAS_LIMIT
+            <= settings.TEZOS_OPERATION_GROUP_GAS_LIMIT
+            and size <= settings.TEZOS_OPERATION_GROUP_SIZE_LIMIT
+            and operation_cost.gas + cost.gas <= settings.TEZOS_OPERATION_GAS_LIMIT
+            and operation_cost.storage + cost.storage
+            <= settings.TEZOS_OPERATION_STORAGE_LIMIT
+        )
+
+    def add(self, sync_item):
+        self.items.append(sync_item)
+        if sync_item.kind is None:
+            return
+
+        operation = settings.TEZOS_SYNC_COSTS["operation"]
+        cost = estimate_cost(sync_item)
+        if sync_item.kind == MINT:
+            if mint_key(sync_item) not in self.mints:
+                self.mints[mint_key(sync_item)] = []
+                self.size += operation["size"] + cost.size
+            self.mints[mint_key(sync_item)].append(sync_item)
+            return
+
+        operation_cost = self.operation_costs.get(sync_item.kind)
+        if operation_cost is None:
+            operation_cost = Cost(**operation)
+            self.size += operation["size"]
+        self.operation_costs[sync_item.kind] = Cost(
+            *(total + value for total, value in zip(operation_cost, cost))
+        )
+        self.shared[sync_item.kind].append(sync_item)
+        self.size += cost.size
+
+
+def net_transfer_payloads(sync_items):
+    """
+    Collapses the transfers of the given items into one transfer of the net amount
+    per sender, recipient and token, transfers in both directions between two
+    wallets cancel out. Every balance ends up as with the single transfers and no
+    sender moves more than before.
+    """
+    net_amounts = {}
+    for sync_item in sync_items:
+        from_ = sync_item.payload["from_"]
+        for tx in sync_item.payload["txs"]:
+            reverse_key = (tx["to_"], from_, tx["token_id"])
+            if reverse_key in net_amounts:
+                net_amounts[reverse_key] -= tx["amount"]
+            else:
+                key = (from_, tx["to_"], tx["token_id"])
+                net_amounts[key] = net_amounts.get(key, 0) + tx["amount"]
+
+    txs_by_sender = {}
+    for (from_, to_, token_id), amount in net_amounts.items():
+        if amount < 0:
+            from_, to_, amount = to_, from_, -amount
+        if amount > 0:
+            txs_by_sender.setdefault(from_, []).append(
+                {"to_": to_, "token_id": token_id, "amount": amount}
+            )
+    return [{"from_": from_, "txs": txs} for from_, txs in txs_by_sender.items()]
+
+
+def pack_sync_items(sync_items):
+    """
+    Fills operation groups in order and yields every group once the next item does
+    not fit anymore, so only one group is held at a time. An item exceeding the
+    limits on its own still gets a group, so it fails alone.
+    """
+    operation_group = PackedOperationGroup()
+    for sync_item in sync_items:
+        if not operation_group.fits(sync_item) and len(operation_group.items) > 0:
+            yield operation_group
+            operation_group = PackedOperationGroup()
+        operation_group.add(sync_item)
+    if len(operation_group.items) > 0:
+        yield operation_group
+
+
+def split_operation_group(operation_group):
+    """
+    Splits a group of several items into one group with the first half of its items
+    and one with the second half, in order. Items synced as part of another one stay
+    with the item before them.
+    """
+    item_indexes = [
+        index
+        for index, sync_item in enumerate(operation_group.items)
+        if sync_item.kind is not None
+    ]
+    middle = item_indexes[len(item_indexes) // 2]
+    halves = []
+    for sync_items in [operation_group.items[:middle], operation_group.items[middle:]]:
+        half = PackedOperationGroup()
+        for sync_item in sync_items:
+            half.add(sync_item)
+        halves.append(half)
+    return halves
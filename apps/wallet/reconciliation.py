@@ -0,0 +1,197 @@
+"""
+Compares the wallet balances with the ledger of the token contract. The balances come
+from one grouped query per chunk of wallets, the ledger entries are read by a bounded
+pool of threads. Mismatches are stored as ReconciliationMismatch together with the
+checkpoint after every chunk, so an interrupted run resumes where it stopped. An
+incremental run only compares the wallets with activity since the previous run and
+the ones that mismatched in it.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, Max, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils.timezone import now
+
+from apps.wallet.models import (
+    TRANSACTION_STATES,
+    Reconciliation,
+    ReconciliationMismatch,
+    Transaction,
+    Wallet,
+    WalletPublicKeyTransferRequest,
+)
+from apps.wallet.tezos import get_token_contract
+
+# wallets compared at once, the checkpoint moves after every chunk
+RECONCILIATION_CHUNK_SIZE = 500
+
+
+def with_synced_balance(wallets):
+    """
+    Annotates synced_balance, the sum of the synced transactions of every wallet.
+    Open and pending transactions are not on chain yet, comparing them would report
+    every wallet that is about to be synced.
+    """
+    synced_transactions = Transaction.objects.filter(
+        state=TRANSACTION_STATES.DONE.value
+    ).order_by()
+    received = (
+        synced_transactions.filter(to_wallet=OuterRef("pk"))
+        .values("to_wallet")
+        .annotate(total=Sum("amount"))
+        .values("total")
+    )
+    sent = (
+        synced_transactions.filter(from_wallet=OuterRef("pk"))
+        .values("from_wallet")
+        .annotate(total=Sum("amount"))
+        .values("total")
+    )
+    return wallets.annotate(
+        synced_balance=Coalesce(Subquery(received), Value(0))
+        - Coalesce(Subquery(sent), Value(0))
+    )
+
+
+class LedgerReader:
+    """
+    Reads ledger entries of the token contract. The threads share the cached
+    contract and its pooled node connection, see apps.wallet.tezos.
+    """
+
+    def read(self, wallet):
+        """
+        Returns the on-chain balance of the wallet and the error reading it, a
+        missing ledger entry counts as 0
+        """
+        try:
+            return (
+                get_token_contract().big_map_get(
+                    "ledger/{}::{}".format(wallet.address, wallet.currency.token_id)
+                ),
+                "",
+            )
+        except Exception as error:
+            return 0, repr(error)
+
+
+def select_wallets(since, idle_sample_size):
+    """
+    Wallets with transactions created or synced, or transfer requests changed after
+    since, the wallets that mismatched in the run that set since, plus a random
+    sample of the other wallets. Changes on chain nobody made through the system
+    only show up in the sample.
+    """
+    transactions = Transaction.objects.filter(
+        Q(to_wallet=OuterRef("pk")) | Q(from_wallet=OuterRef("pk")),
+        Q(created_at__gt=since) | Q(sync_batch__finished_at__gt=since),
+    )
+    transfer_requests = WalletPublicKeyTransferRequest.objects.filter(
+        wallet=OuterRef("pk"), updated_at__gt=since
+    )
+    # a mismatch stays on chain until it is fixed, whether the wallet changed or not
+    mismatches = ReconciliationMismatch.objects.filter(
+        wallet=OuterRef("pk"),
+        reconciliation__finished_at__isnull=False,
+        reconciliation__watermark=since,
+    )
+    wallets = Wallet.objects.annotate(
+        has_transactions=Exists(transactions),
+        has_transfer_requests=Exists(transfer_requests),
+        has_mismatches=Exists(mismatches),
+    )
+    is_active = (
+        Q(has_transactions=True)
+        | Q(has_transfer_requests=True)
+        | Q(has_mismatches=True)
+    )
+    idle_wallet_pks = list(
+        wallets.exclude(is_active)
+        .order_by("?")
+        .values_list("pk", flat=True)[:idle_sample_size]
+    )
+    return wallets.filter(is_active | Q(pk__in=idle_wallet_pks))
+
+
+def reconcile_sync_state(
+    resume=False,
+    incremental=False,
+    idle_sample_size=None,
+    workers=None,
+    ledger_reader=None,
+):
+    """
+    Compares the wallets with the chain and returns the finished Reconciliation.
+    With resume, the last unfinished run continues after its checkpoint. An
+    incremental run only compares the wallets touched since the watermark of the
+    last finished run and idle_sample_size others, the first one compares all.
+    """
+    reconciliation = None
+    if resume:
+        reconciliation = (
+            Reconciliation.objects.filter(finished_at__isnull=True)
+            .order_by("-created_at")
+            .first()
+        )
+    if reconciliation is None:
+        since = None
+        if incremental:
+            since = (
+                Reconciliation.objects.filter(finished_at__isnull=False)
+                .aggregate(Max("watermark"))
+                .get("watermark__max")
+            )
+        reconciliation = Reconciliation.objects.create(watermark=now(), since=since)
+    if idle_sample_size is None:
+        idle_sample_size = settings.RECONCILIATION_IDLE_SAMPLE_SIZE
+    if ledger_reader is None:
+        ledger_reader = LedgerReader()
+
+    wallets = Wallet.objects.all()
+    if reconciliation.since is not None:
+        wallets = select_wallets(reconciliation.since, idle_sample_size)
+    wallets = with_synced_balance(
+        wallets.select_related("currency").only(
+            "wallet_id", "address", "currency__token_id"
+        )
+    ).order_by("pk")
+    with ThreadPoolExecutor(
+        max_workers=workers or settings.RECONCILIATION_WORKERS
+    ) as executor:
+        while True:
+            chunk = wallets
+            if reconciliation.checkpoint is not None:
+                chunk = chunk.filter(pk__gt=reconciliation.checkpoint)
+            chunk = list(chunk[:RECONCILIATION_CHUNK_SIZE])
+            if len(chunk) == 0:
+                break
+
+            mismatches = []
+            for wallet, (on_chain_balance, notes) in zip(
+                chunk, executor.map(ledger_reader.read, chunk)
+            ):
+                if on_chain_balance != wallet.synced_balance:
+                    mismatches.append(
+                        ReconciliationMismatch(
+                            reconciliation=reconciliation,
+                            wallet=wallet,
+                            address=wallet.address,
+                            token_id=wallet.currency.token_id,
+                            balance=wallet.synced_balance,
+                            on_chain_balance=on_chain_balance,
+                            notes=notes,
+                        )
+                    )
+
+            with transaction.atomic():
+                ReconciliationMismatch.objects.bulk_create(mismatches)
+                reconciliation.checkpoint = chunk[-1].pk
+                reconciliation.checked_count += len(chunk)
+                reconciliation.mismatch_count += len(mismatches)
+                reconciliation.save()
+
+    reconciliation.finished_at = now()
+    reconciliation.save()
+    return reconciliation
@@ -178,6 +178,48 @@ class MetaTransactionSerializer(TransactionSerializer):
     # FIXME: add validation if its a 'activation'-transaction and check for sms verfication if needed (currency)
 
 
+class MetaTransactionRecipientSerializer(serializers.ModelSerializer):
+    to_wallet = serializers.SlugRelatedField(
+        many=False,
+        read_only=False,
+        slug_field="wallet_id",
+        queryset=Wallet.objects.all(),
+    )
+
+    class Meta:
+        model = Transaction
+        fields = ["to_wallet", "amount"]
+
+
+class MultiRecipientMetaTransactionSerializer(MetaTransactionSerializer):
+    to_wallet = serializers.SlugRelatedField(slug_field="wallet_id", read_only=True)
+    amount = serializers.IntegerField(read_only=True)
+    txs = MetaTransactionRecipientSerializer(
+        many=True, source="recipients", allow_empty=False
+    )
+
+    def create(self, validated_data):
+        first_recipient, *further_recipients = validated_data.pop("recipients")
+        meta_transaction = MetaTransaction(**validated_data, **first_recipient)
+        meta_transaction.set_legs(
+            Transaction(**recipient) for recipient in further_recipients
+        )
+        meta_transaction.save()
+        return meta_transaction
+
+    class Meta(MetaTransactionSerializer.Meta):
+        fields = MetaTransactionSerializer.Meta.fields + ["txs"]
+
+
+class MetaTransactionBulkItemSerializer(MetaTransactionSerializer):
+    # the wallets of a batch are resolved at once in MetaTransaction.create_in_bulk
+    from_wallet = serializers.CharField(max_length=128)
+    to_wallet = serializers.CharField(max_length=128)
+
+    class Meta(MetaTransactionSerializer.Meta):
+        extra_kwargs = {"signature": {"validators": []}}
+
+
 class CashOutRequestSerializer(serializers.ModelSerializer):
     transaction = serializers.PrimaryKeyRelatedField(queryset=Transaction.objects.all())
 
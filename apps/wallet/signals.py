@@ -1,6 +1,5 @@
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
-from django_simple_task import defer
 
 from apps.wallet.models import (
     TRANSACTION_STATES,
@@ -13,17 +12,32 @@ from apps.wallet.models import (
     Wallet,
     WalletPublicKeyTransferRequest,
 )
-from apps.wallet.utils import sync_to_blockchain
+from apps.wallet.utils import request_blockchain_sync
 
 
 @receiver(
     pre_save, sender=MetaTransaction, dispatch_uid="custom_meta_transaction_validation"
 )
 def custom_meta_transaction_validation(sender, instance, **kwargs):
-    instance.to_wallet.notify_owner_receiving_money(
-        instance.from_wallet, instance.amount
-    )
-    instance.from_wallet.notify_transfer_successful(instance.to_wallet, instance.amount)
+    for recipient in instance.recipients:
+        recipient.to_wallet.notify_owner_receiving_money(
+            instance.from_wallet, recipient.amount
+        )
+        instance.from_wallet.notify_transfer_successful(
+            recipient.to_wallet, recipient.amount
+        )
+
+
+@receiver(
+    post_delete,
+    sender=Transaction,
+    dispatch_uid="revert_wallet_balances_after_transaction_delete",
+)
+def revert_wallet_balances_after_transaction_delete(sender, instance, **kwargs):
+    deltas = instance.balance_deltas
+    for wallet_pk in deltas:
+        deltas[wallet_pk] = -deltas[wallet_pk]
+    Wallet.apply_balance_deltas(deltas)
 
 
 @receiver(pre_save, sender=Wallet, dispatch_uid="pre_save_signal_wallet")
@@ -54,4 +68,4 @@ def async_sync_to_blockchain_after_wallet_public_key_transfer(
     sender, instance, created, **kwargs
 ):
     if created and instance.state != TRANSACTION_STATES.DONE.value:
-        defer(lambda: sync_to_blockchain(is_dry_run=False))
+        request_blockchain_sync()
@@ -0,0 +1,107 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+import pysodium
+from django.conf import settings
+from pytezos import Key
+from pytezos.crypto.encoding import base58_decode
+
+# ed25519 signatures are verified with libsodium directly, the decoded keys and
+# signatures are memoized since the same wallets sign over and over again.
+# secp256k1 (sppk) and p256 (p2pk) keys are verified through pytezos.
+
+
+@lru_cache(maxsize=4096)
+def decode_ed25519_public_key(public_key):
+    if not public_key.startswith("edpk"):
+        return None
+    return base58_decode(public_key.encode())
+
+
+@lru_cache(maxsize=1024)
+def decode_ed25519_signature(signature):
+    # generic "sig" signatures are valid for every curve
+    if not signature.startswith(("edsig", "sig")):
+        raise ValueError("Signature and public key curves mismatch.")
+    return base58_decode(signature.encode())
+
+
+def verify_signature(message, signature, public_key):
+    """
+    Raises a ValueError if the signature is not valid, like pytezos' Key.verify
+    """
+    public_point = decode_ed25519_public_key(public_key)
+    if public_point is None:
+        Key.from_encoded_key(public_key).verify(signature, message)
+        return
+
+    signature = decode_ed25519_signature(signature)
+    try:
+        pysodium.crypto_sign_verify_detached(
+            signature,
+            pysodium.crypto_generichash(message),
+            public_point,
+        )
+    except ValueError:
+        raise ValueError("Signature is invalid.")
+
+
+def verify_signatures(triples):
+    """
+    Verifies (message, signature, public_key) triples, returns a list of booleans
+    """
+    results = []
+    for message, signature, public_key in triples:
+        try:
+            verify_signature(message, signature, public_key)
+            results.append(True)
+        except ValueError:
+            results.append(False)
+    return results
+
+
+class VerificationCache:
+    """
+    Verification results of the last maxsize keys, a result expires ttl seconds
+    after it was verified
+    """
+
+    def __init__(self, maxsize, ttl, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.results = OrderedDict()
+
+    def get(self, key):
+        """
+        Returns the cached result or None if there is none or it expired
+        """
+        with self.lock:
+            if key not in self.results:
+                return None
+            is_valid, verified_at = self.results[key]
+            if self.clock() - verified_at >= self.ttl:
+                del self.results[key]
+                return None
+            self.results.move_to_end(key)
+            return is_valid
+
+    def set(self, key, is_valid):
+        with self.lock:
+            self.results[key] = (is_valid, self.clock())
+            self.results.move_to_end(key)
+            while len(self.results) > self.maxsize:
+                self.results.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.results.clear()
+
+
+paper_wallet_signature_cache = VerificationCache(
+    settings.PAPER_WALLET_SIGNATURE_CACHE_SIZE,
+    settings.PAPER_WALLET_SIGNATURE_CACHE_TTL,
+)
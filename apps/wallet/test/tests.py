@@ -1,29 +1,44 @@
+import datetime
 import time
+from collections import defaultdict
+from io import StringIO
 from unittest import skip
 from urllib.parse import urlencode, urlparse
 
 import pytezos
 from django.conf import settings
 from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
 from django.db.models.signals import pre_save
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now
 
 from apps.currency.models import Currency
+from apps.tasks.models import TASK_STATES, Task
 from apps.wallet.models import (
     TRANSACTION_STATES,
     WALLET_CATEGORIES,
     WALLET_STATES,
     MetaTransaction,
     PaperWallet,
+    SyncBatch,
     Transaction,
     Wallet,
     WalletPublicKeyTransferRequest,
 )
 from apps.wallet.signals import custom_meta_transaction_validation
 from apps.wallet.utils import (
+    build_sync_items,
+    confirm_sync_batch,
+    lease_sync_batch,
     pack_meta_transaction,
     read_nonce_from_chain,
+    request_blockchain_sync,
     sync_to_blockchain,
+    with_sync_relations,
 )
 
 # TODO: add can view all currencies test
@@ -75,6 +90,17 @@ class WalletTestCase(TestCase):
             state=WALLET_STATES.VERIFIED.value,
         )
         self.assertEqual(wallet.nonce, 0)
+        self.assertEqual(
+            wallet.address,
+            pytezos.crypto.key.Key.from_encoded_key(
+                "edpku976gpuAD2bXyx1XGraeKuCo1gUZ3LAJcHM12W1ecxZwoiu22R"
+            ).public_key_hash(),
+        )
+
+        key = pytezos.crypto.key.Key.generate()
+        wallet.public_key = key.public_key()
+        wallet.save()
+        self.assertEqual(Wallet.objects.get(address=key.public_key_hash()), wallet)
 
     def test_nonce_calculation(self):
         # <<<<<<< HEAD
@@ -141,6 +167,60 @@ class WalletTestCase(TestCase):
         self.assertEqual(wallet1.nonce, 2)
         self.assertEqual(wallet2.nonce, 1)
 
+    def test_stored_nonce(self):
+        currency = Currency.objects.create(
+            token_id=0,
+            name="test",
+            symbol="test",
+            claim_deadline="2120-01-01",
+            campaign_end="2120-01-01",
+        )
+        key1 = pytezos.crypto.key.Key.generate()
+        wallet1 = Wallet.objects.create(
+            wallet_id=Wallet.generate_wallet_id(),
+            public_key=key1.public_key(),
+            currency=currency,
+            state=WALLET_STATES.VERIFIED.value,
+        )
+        wallet2 = Wallet.objects.create(
+            wallet_id=Wallet.generate_wallet_id(),
+            public_key=pytezos.crypto.key.Key.generate().public_key(),
+            currency=currency,
+            state=WALLET_STATES.VERIFIED.value,
+        )
+        Transaction.objects.create(to_wallet=wallet1, amount=100)
+
+        for nonce in [1, 2]:
+            meta_transaction = MetaTransaction(
+                from_wallet=wallet1, to_wallet=wallet2, amount=10, nonce=nonce
+            )
+            meta_transaction.signature = key1.sign(
+                pack_meta_transaction(meta_transaction.to_meta_transaction_dictionary())
+            )
+            meta_transaction.save()
+
+        wallet1.refresh_from_db()
+        self.assertEqual(wallet1.last_nonce, 2)
+        self.assertEqual(wallet1.nonce, wallet1.calculate_nonce())
+
+        # a stale wallet instance must not reset the stored nonce
+        stale_wallet1 = Wallet.objects.get(pk=wallet1.pk)
+        stale_wallet1.last_nonce = 0
+        stale_wallet1.save()
+        wallet1.refresh_from_db()
+        self.assertEqual(wallet1.nonce, 2)
+
+        # the nonce starts over with a new public key and comes back with the old one
+        wallet1.public_key = pytezos.crypto.key.Key.generate().public_key()
+        wallet1.save()
+        wallet1.refresh_from_db()
+        self.assertEqual(wallet1.nonce, 0)
+
+        wallet1.public_key = key1.public_key()
+        wallet1.save()
+        wallet1.refresh_from_db()
+        self.assertEqual(wallet1.nonce, 2)
+
     def test_balance_calculation(self):
         # <<<<<<< HEAD
         #         currency = Currency.objects.create(
@@ -208,6 +288,213 @@ class WalletTestCase(TestCase):
         self.assertEqual(wallet1.balance, 90)
         self.assertEqual(wallet2.balance, 10)
 
+    def test_stored_balance(self):
+        currency = Currency.objects.create(
+            token_id=0,
+            name="test",
+            symbol="test",
+            claim_deadline="2120-01-01",
+            campaign_end="2120-01-01",
+        )
+        wallet1 = Wallet.objects.create(
+            wallet_id=Wallet.generate_wallet_id(),
+            public_key=pytezos.crypto.key.Key.generate().public_key(),
+            currency=currency,
+            state=WALLET_STATES.VERIFIED.value,
+        )
+        wallet2 = Wallet.objects.create(
+            wallet_id=Wallet.generate_wallet_id(),
+            public_key=pytezos.crypto.key.Key.generate().public_key(),
+            currency=currency,
+            state=WALLET_STATES.VERIFIED.value,
+        )
+        Transaction.objects.create(to_wallet=wallet1, amount=100)
+        transaction = Transaction.objects.create(
+            from_wallet=wallet1, to_wallet=wallet2, amount=30
+        )
+        self.assertEqual(wallet1.balance, 70)
+        self.assertEqual(wallet2.balance, 30)
+
+        # a stale wallet instance must not overwrite the stored balance
+        stale_wallet1 = Wallet.objects.get(pk=wallet1.pk)
+        transaction.amount = 20
+        transaction.save()
+        stale_wallet1.save()
+
+        wallet1.refresh_from_db()
+        wallet2.refresh_from_db()
+        self.assertEqual(wallet1.balance, 80)
+        self.assertEqual(wallet2.balance, 20)
+        self.assertEqual(wallet1.balance, wallet1.calculate_balance())
+        self.assertEqual(wallet2.balance, wallet2.calculate_balance())
+
+        transaction.delete()
+        wallet1.refresh_from_db()
+        wallet2.refresh_from_db()
+        self.assertEqual(wallet1.balance, 100)
+        self.assertEqual(wallet2.balance, 0)
+
+    def test_rebuild_wallet_balances(self):
+        currency = Currency.objects.create(
+            token_id=0,
+            name="test",
+            symbol="test",
+            claim_deadline="2120-01-01",
+            campaign_end="2120-01-01",
+        )
+        wallet = Wallet.objects.create(
+            wallet_id=Wallet.generate_wallet_id(),
+            public_key=pytezos.crypto.key.Key.generate().public_key(),
+            currency=currency,
+            state=WALLET_STATES.VERIFIED.value,
+        )
+        Transaction.objects.create(to_wallet=wallet, amount=100)
+        call_command("rebuild_wallet_balances", "--verify_only", stdout=StringIO())
+
+        Wallet.objects.filter(pk=wallet.pk).update(cached_balance=5)
+        with self.assertRaises(CommandError):
+            call_command("rebuild_wallet_balances", "--verify_only", stdout=StringIO())
+
+        call_command("rebuild_wallet_balances", stdout=StringIO())
+        wallet.refresh_from_db()
+        self.assertEqual(wallet.balance, 100)
+
+    @override_settings(BLOCKCHAIN_SYNC_MAX_LATENCY=60, BLOCKCHAIN_SYNC_FLUSH_SIZE=3)
+    def test_request_blockchain_sync(self):
+        currency = Currency.objects.create(
+            token_id=0,
+            name="test",
+            symbol="test",
+            claim_deadline="2120-01-01",
+            campaign_end="2120-01-01",
+        )
+        wallet = Wallet.objects.create(
+            wallet_id=Wallet.generate_wallet_id(),
+            public_key=pytezos.crypto.key.Key.generate().public_key(),
+            currency=currency,
+            state=WALLET_STATES.VERIFIED.value,
+        )
+        Transaction.objects.create(to_wallet=wallet, amount=10)
+
+        # the transfer request triggers the first sync request
+        WalletPublicKeyTransferRequest.objects.create(
+            wallet=wallet,
+            old_public_key=wallet.public_key,
+            new_public_key=pytezos.crypto.key.Key.generate().public_key(),
+        )
+        task = request_blockchain_sync()
+        self.assertEqual(
+            Task.objects.filter(function="apps.wallet.utils.run_blockchain_sync")
+            .values_list("pk", flat=True)
+            .get(),
+            task.pk,
+        )
+        self.assertGreater(task.run_after, now() + datetime.timedelta(seconds=50))
+
+        # failed items and transfers the sync defers do not make it urgent
+        sender, idle_wallet = [
+            Wallet.objects.create(
+                wallet_id=Wallet.generate_wallet_id(),
+                public_key=pytezos.crypto.key.Key.generate().public_key(),
+                currency=currency,
+                state=WALLET_STATES.VERIFIED.value,
+            )
+            for _ in range(2)
+        ]
+        Transaction.objects.create(to_wallet=sender, amount=10)
+        Transaction.objects.filter(to_wallet=sender).update(
+            state=TRANSACTION_STATES.DONE.value
+        )
+        Transaction.objects.create(from_wallet=sender, to_wallet=idle_wallet, amount=1)
+        Transaction.objects.create(
+            to_wallet=idle_wallet, amount=10, state=TRANSACTION_STATES.FAILED.value
+        )
+        self.assertEqual(request_blockchain_sync().run_after, task.run_after)
+
+        # enough items are waiting, the queued sync is pulled forward
+        Transaction.objects.create(to_wallet=currency.owner_wallet, amount=10)
+        flushed_task = request_blockchain_sync()
+        self.assertEqual(flushed_task.pk, task.pk)
+        self.assertLessEqual(flushed_task.run_after, now())
+        self.assertEqual(
+            Task.objects.filter(
+                function="apps.wallet.utils.run_blockchain_sync"
+            ).count(),
+            1,
+        )
+
+        # a running sync does not swallow new requests
+        Task.objects.filter(pk=task.pk).update(state=TASK_STATES.RUNNING.value)
+        self.assertNotEqual(request_blockchain_sync().pk, task.pk)
+
+        # a sync waiting for another one is not pulled forward by the flush
+        Task.objects.all().delete()
+        delayed_task = request_blockchain_sync(min_delay=10)
+        self.assertGreater(
+            delayed_task.run_after, now() + datetime.timedelta(seconds=5)
+        )
+        self.assertEqual(request_blockchain_sync().pk, delayed_task.pk)
+        self.assertGreater(
+            delayed_task.run_after, now() + datetime.timedelta(seconds=5)
+        )
+
+    def test_lease_sync_batch(self):
+        currency = Currency.objects.create(
+            token_id=0,
+            name="test",
+            symbol="test",
+            claim_deadline="2120-01-01",
+            campaign_end="2120-01-01",
+        )
+        wallet = Wallet.objects.create(
+            wallet_id=Wallet.generate_wallet_id(),
+            public_key=pytezos.crypto.key.Key.generate().public_key(),
+            currency=currency,
+            state=WALLET_STATES.VERIFIED.value,
+        )
+        idle_wallet = Wallet.objects.create(
+            wallet_id=Wallet.generate_wallet_id(),
+            public_key=pytezos.crypto.key.Key.generate().public_key(),
+            currency=currency,
+            state=WALLET_STATES.VERIFIED.value,
+        )
+        Transaction.objects.create(to_wallet=currency.owner_wallet, amount=10)
+        Transaction.objects.update(state=TRANSACTION_STATES.DONE.value)
+        mints = [
+            Transaction.objects.create(to_wallet=wallet, amount=10) for _ in range(3)
+        ]
+        # not synced before the idle wallet spends
+        Transaction.objects.create(
+            from_wallet=currency.owner_wallet, to_wallet=idle_wallet, amount=1
+        )
+        Transaction.objects.filter(pk=mints[1].pk).update(
+            state=TRANSACTION_STATES.PENDING.value
+        )
+        transfer_request = WalletPublicKeyTransferRequest.objects.create(
+            wallet=wallet,
+            old_public_key=wallet.public_key,
+            new_public_key=pytezos.crypto.key.Key.generate().public_key(),
+        )
+
+        # the oldest open items come first, transfer requests wait for room
+        transactions, transfer_requests = lease_sync_batch(2)
+        self.assertEqual(transactions, [mints[0], mints[2]])
+        self.assertEqual(transfer_requests, [])
+
+        transactions, transfer_requests = lease_sync_batch(3)
+        self.assertEqual(transactions, [mints[0], mints[2]])
+        self.assertEqual(transfer_requests, [transfer_request])
+
+        # nothing open, the worker cycle does not reach the chain
+        Transaction.objects.update(state=TRANSACTION_STATES.DONE.value)
+        WalletPublicKeyTransferRequest.objects.update(
+            state=TRANSACTION_STATES.DONE.value
+        )
+        self.assertEqual(lease_sync_batch(2), ([], []))
+        out = StringIO()
+        call_command("sync_worker", "--once", stdout=out)
+        self.assertIn("batch_size=0 lag=0.0s", out.getvalue())
+
 
 class PaperWalletTestCase(TestCase):
     def setUp(self):
@@ -319,6 +606,35 @@ class TransactionTestCase(TestCase):
         with self.assertRaises(ValidationError):
             Transaction.objects.create(to_wallet=self.wallet1, amount=100)
 
+    def test_currency_and_tags(self):
+        owner_wallet = self.currency.owner_wallet
+        minted = Transaction.objects.create(to_wallet=owner_wallet, amount=100)
+        paid_out = Transaction.objects.create(
+            from_wallet=owner_wallet, to_wallet=self.wallet1, amount=20
+        )
+        transfer = Transaction.objects.create(
+            from_wallet=self.wallet1, to_wallet=self.wallet2, amount=5
+        )
+        paid_back = Transaction.objects.create(
+            from_wallet=self.wallet2, to_wallet=owner_wallet, amount=5
+        )
+
+        self.assertEqual(
+            [tx.tag for tx in [minted, paid_out, transfer, paid_back]],
+            ["to_owner", "from_owner", "", "to_owner"],
+        )
+        with self.assertNumQueries(1):
+            transactions = list(Transaction.objects.filter(currency=self.currency))
+            self.assertEqual(
+                {tx.pk: tx.tag for tx in transactions},
+                {
+                    minted.pk: "to_owner",
+                    paid_out.pk: "from_owner",
+                    transfer.pk: "",
+                    paid_back.pk: "to_owner",
+                },
+            )
+
 
 class ComplexTransactionFlowsTestCase(TestCase):
     def setUp(self):
@@ -433,6 +749,216 @@ class ComplexTransactionFlowsTestCase(TestCase):
         self.assertEqual(self.wallet2.balance, 30)
 
 
+class SyncBatchBuilderTestCase(TestCase):
+    def setUp(self):
+        self.currency = Currency.objects.create(
+            token_id=0,
+            name="test",
+            symbol="test",
+            claim_deadline="2120-01-01",
+            campaign_end="2120-01-01",
+        )
+        self.key = pytezos.crypto.key.Key.generate()
+        self.wallet1 = Wallet.objects.create(
+            wallet_id=Wallet.generate_wallet_id(),
+            public_key=self.key.public_key(),
+            currency=self.currency,
+            state=WALLET_STATES.VERIFIED.value,
+        )
+        self.wallet2 = Wallet.objects.create(
+            wallet_id=Wallet.generate_wallet_id(),
+            public_key=pytezos.crypto.key.Key.generate().public_key(),
+            currency=self.currency,
+            state=WALLET_STATES.VERIFIED.value,
+        )
+        Transaction.objects.create(to_wallet=self.currency.owner_wallet, amount=100)
+
+    def add_items(self):
+        Transaction.objects.create(to_wallet=self.wallet1, amount=10)
+        Transaction.objects.create(
+            from_wallet=self.currency.owner_wallet, to_wallet=self.wallet1, amount=10
+        )
+        meta_transaction = MetaTransaction(
+            from_wallet=self.wallet1,
+            to_wallet=self.wallet2,
+            amount=1,
+            nonce=self.wallet1.nonce + 1,
+        )
+        meta_transaction.set_legs([Transaction(to_wallet=self.wallet2, amount=2)])
+        meta_transaction.signature = self.key.sign(
+            pack_meta_transaction(meta_transaction.to_meta_transaction_dictionary())
+        )
+        meta_transaction.save()
+        self.wallet1.refresh_from_db()
+
+    def build(self):
+        with CaptureQueriesContext(connection) as context:
+            sync_items = list(
+                build_sync_items(
+                    with_sync_relations(Transaction.objects).order_by("created_at"),
+                    WalletPublicKeyTransferRequest.objects.select_related(
+                        "wallet__currency"
+                    ),
+                    is_dry_run=True,
+                )
+            )
+        return sync_items, len(context.captured_queries)
+
+    def test_constant_queries(self):
+        self.add_items()
+        sync_items, query_count = self.build()
+        self.assertEqual(
+            [sync_item.kind for sync_item in sync_items],
+            ["mint", "mint", "transfer", "meta_transfer", None],
+        )
+        self.assertEqual(
+            [tx["amount"] for tx in sync_items[3].payload["txs"]],
+            [1, 2],
+        )
+
+        for _ in range(3):
+            self.add_items()
+        sync_items, more_query_count = self.build()
+        self.assertEqual(len(sync_items), 17)
+        self.assertEqual(more_query_count, query_count)
+
+    def test_sync_batch(self):
+        self.add_items()
+        self.add_items()
+        transfer_request = WalletPublicKeyTransferRequest.objects.create(
+            wallet=self.wallet2,
+            old_public_key=self.wallet2.public_key,
+            new_public_key=pytezos.crypto.key.Key.generate().public_key(),
+        )
+        items = list(Transaction.objects.all()) + [transfer_request]
+
+        sync_batch = SyncBatch.objects.create(item_count=len(items))
+        # one statement per model, however many items the batch holds
+        with self.assertNumQueries(2):
+            sync_batch.update_items(items, TRANSACTION_STATES.PENDING.value)
+        sync_batch.operation_hash = "oo1"
+        sync_batch.finish(TRANSACTION_STATES.DONE.value, {"hash": "oo1"})
+
+        self.assertEqual(sync_batch.transactions.count(), len(items) - 1)
+        self.assertEqual(
+            set(Transaction.objects.values_list("state", "operation_hash", "notes")),
+            {(TRANSACTION_STATES.DONE.value, "oo1", "")},
+        )
+        transfer_request.refresh_from_db()
+        self.assertEqual(transfer_request.sync_batch, sync_batch)
+        self.assertEqual(transfer_request.state, TRANSACTION_STATES.DONE.value)
+        self.assertIsNotNone(SyncBatch.objects.get().finished_at)
+
+    def test_confirm_sync_batch(self):
+        self.add_items()
+        transfer_request = WalletPublicKeyTransferRequest.objects.create(
+            wallet=self.wallet2,
+            old_public_key=self.wallet2.public_key,
+            new_public_key=pytezos.crypto.key.Key.generate().public_key(),
+        )
+        items = list(Transaction.objects.all()) + [transfer_request]
+        sync_batch = SyncBatch.objects.create(
+            item_count=len(items), operation_hash="oo1", injected_level=100
+        )
+        sync_batch.update_items(items, TRANSACTION_STATES.PENDING.value)
+        shell = FakeShell()
+
+        # not included yet
+        self.assertFalse(confirm_sync_batch(sync_batch, shell, 101))
+        self.assertEqual(sync_batch.checked_level, 101)
+        self.assertIsNone(sync_batch.included_level)
+
+        # included, but not deep enough
+        shell.include(102, "oo1", "applied")
+        self.assertFalse(confirm_sync_batch(sync_batch, shell, 102))
+        self.assertEqual(sync_batch.included_level, 102)
+
+        # the including block was replaced
+        shell.blocks.clear()
+        self.assertFalse(confirm_sync_batch(sync_batch, shell, 103))
+        self.assertIsNone(sync_batch.included_level)
+        self.assertEqual(sync_batch.checked_level, 101)
+
+        shell.include(103, "oo1", "applied")
+        self.assertTrue(confirm_sync_batch(sync_batch, shell, 104))
+        self.assertEqual(
+            set(Transaction.objects.values_list("state", "operation_hash")),
+            {(TRANSACTION_STATES.DONE.value, "oo1")},
+        )
+        transfer_request.refresh_from_db()
+        self.assertEqual(transfer_request.state, TRANSACTION_STATES.DONE.value)
+        self.assertEqual(
+            transfer_request.wallet.public_key, transfer_request.new_public_key
+        )
+
+    def test_confirm_failed_sync_batch(self):
+        self.add_items()
+        items = list(Transaction.objects.all())
+        failed_batch = SyncBatch.objects.create(
+            item_count=len(items), operation_hash="oo1", injected_level=100
+        )
+        failed_batch.update_items(items[:2], TRANSACTION_STATES.PENDING.value)
+        expired_batch = SyncBatch.objects.create(
+            item_count=len(items), operation_hash="oo2", injected_level=100
+        )
+        expired_batch.update_items(items[2:], TRANSACTION_STATES.PENDING.value)
+        shell = FakeShell()
+        shell.include(101, "oo1", "backtracked")
+
+        self.assertTrue(confirm_sync_batch(failed_batch, shell, 102))
+        self.assertFalse(
+            confirm_sync_batch(expired_batch, shell, 100 + settings.TEZOS_OPERATION_TTL)
+        )
+        self.assertTrue(
+            confirm_sync_batch(expired_batch, shell, 101 + settings.TEZOS_OPERATION_TTL)
+        )
+        self.assertEqual(
+            set(Transaction.objects.values_list("state", flat=True)),
+            {TRANSACTION_STATES.FAILED.value},
+        )
+        self.assertEqual(failed_batch.notes, "Operation failed")
+        self.assertEqual(
+            expired_batch.notes,
+            "Not included within {} blocks".format(settings.TEZOS_OPERATION_TTL),
+        )
+
+
+class FakeBlock:
+    def __init__(self):
+        self.operations = FakeOperations()
+
+    def operation_hashes(self):
+        return [[], [], [], list(self.operations.contents.keys())]
+
+
+class FakeOperations:
+    def __init__(self):
+        self.contents = {}
+
+    def __getitem__(self, operation_hash):
+        def get():
+            if operation_hash not in self.contents:
+                raise StopIteration
+            return self.contents[operation_hash]
+
+        return get
+
+
+class FakeShell:
+    """
+    Answers the block queries of confirm_sync_batch like the node does
+    """
+
+    def __init__(self):
+        self.blocks = defaultdict(FakeBlock)
+
+    def include(self, level, operation_hash, status):
+        self.blocks[level].operations.contents[operation_hash] = {
+            "hash": operation_hash,
+            "contents": [{"metadata": {"operation_result": {"status": status}}}],
+        }
+
+
 @skip
 class BlockchainSyncTestCase(TestCase):
     def setUp(self):
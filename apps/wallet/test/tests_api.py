@@ -20,6 +20,7 @@ from apps.wallet.serializers import (
     WalletPublicKeyTransferRequestSerializer,
     WalletSerializer,
 )
+from apps.wallet.signatures import paper_wallet_signature_cache
 from apps.wallet.utils import create_paper_wallet_message, pack_meta_transaction
 from project.utils_testing import BaseEcouponApiTestCase
 
@@ -192,6 +193,21 @@ class WalletApiTest(BaseEcouponApiTestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data, PaperWalletSerializer(self.paper_wallet).data)
 
+        # verified once, the next scan is served from the cache
+        key = (self.paper_wallet.wallet_id, signature, self.paper_wallet.public_key)
+        self.assertTrue(paper_wallet_signature_cache.get(key))
+        paper_wallet_signature_cache.set(key, False)
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                "/api/wallet/paper_wallet/"
+                + self.paper_wallet.wallet_id
+                + "/"
+                + signature
+                + "/"
+            )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        paper_wallet_signature_cache.clear()
+
     def test_list_wallets(self):
         response = self.client.get("/api/wallet/wallet/")
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
@@ -212,6 +228,36 @@ class WalletApiTest(BaseEcouponApiTestCase):
 
         self.client.force_authenticate(user=None)
 
+    def test_list_wallets_query_count(self):
+        self.client.force_authenticate(user=self.user)
+
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/wallet/wallet/")
+        self.assertEqual(len(response.data["results"]), 3)
+
+        for _ in range(3):
+            Wallet.objects.create(
+                owner=self.user,
+                wallet_id=Wallet.generate_wallet_id(),
+                public_key=pytezos.crypto.key.Key.generate().public_key(),
+                currency=self.currency_2,
+                state=WALLET_STATES.VERIFIED.value,
+            )
+
+        # the currency and its wallets are joined, more wallets cost no queries
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/wallet/wallet/")
+        self.assertEqual(len(response.data["results"]), 6)
+
+        # the wallet is looked up once per request
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                "/api/wallet/wallet/" + self.wallet_1.wallet_id + "/"
+            )
+        self.assertEqual(response.data, WalletSerializer(self.wallet_1).data)
+
+        self.client.force_authenticate(user=None)
+
     def test_list_wallets_is_public_filter(self):
         response = self.client.get("/api/wallet/wallet/?currency__is_public=true")
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
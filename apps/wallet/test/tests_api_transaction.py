@@ -3,10 +3,12 @@ from unittest.case import skip
 import pytezos
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db.models import Q
 from rest_framework import status
 from rest_framework.test import APITestCase
 
 from apps.currency.models import Currency
+from apps.tasks.models import Task
 from apps.wallet.models import (
     WALLET_STATES,
     CashOutRequest,
@@ -324,6 +326,203 @@ class TransactionApiTest(APITestCase):
 
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(tx_count + 1, MetaTransaction.objects.all().count())
+        # both owners are notified by the task worker
+        self.assertEqual(
+            Task.objects.filter(
+                function="apps.wallet.utils.send_push_notification"
+            ).count(),
+            2,
+        )
+
+        self.client.force_authenticate(user=None)
+
+    def sign_meta_transaction(self, from_wallet, to_wallet, nonce, amount):
+        token_transaction = MetaTransaction(
+            from_wallet=from_wallet, to_wallet=to_wallet, nonce=nonce, amount=amount
+        )
+        return {
+            "from_wallet": from_wallet.wallet_id,
+            "to_wallet": to_wallet.wallet_id,
+            "amount": amount,
+            "signature": self.key.sign(
+                pack_meta_transaction(
+                    token_transaction.to_meta_transaction_dictionary()
+                )
+            ),
+            "nonce": nonce,
+        }
+
+    def test_transaction_bulk_create(self):
+        self.client.force_authenticate(user=self.user)
+        self.wallet_pk.state = WALLET_STATES.VERIFIED.value
+        self.wallet_pk.save()
+        Transaction.objects.create(to_wallet=self.wallet_pk, amount=30)
+        tx_count = MetaTransaction.objects.all().count()
+
+        items = [
+            self.sign_meta_transaction(self.wallet_pk, self.wallet_2, 1, 10),
+            self.sign_meta_transaction(self.wallet_pk, self.wallet_2_1_2, 2, 15),
+            # balance is used up by the previous items
+            self.sign_meta_transaction(self.wallet_pk, self.wallet_2, 3, 10),
+            self.sign_meta_transaction(self.wallet_pk, self.wallet_2, 3, 5),
+        ]
+        items.append(dict(items[1]))
+        items.append({**items[0], "to_wallet": "unknown", "nonce": 4})
+
+        response = self.client.post(
+            "/api/wallet/meta_transaction/bulk/", items, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(
+            [result["status"] for result in response.data],
+            [201, 201, 400, 201, 400, 400],
+        )
+        self.assertIn("from_wallet", response.data[2]["errors"])
+        self.assertIn("signature", response.data[4]["errors"])
+        self.assertIn("to_wallet", response.data[5]["errors"])
+        self.assertEqual(response.data[1]["meta_transaction"]["nonce"], 2)
+        self.assertEqual(
+            response.data[1]["meta_transaction"]["to_wallet"],
+            self.wallet_2_1_2.wallet_id,
+        )
+
+        self.assertEqual(tx_count + 3, MetaTransaction.objects.all().count())
+        for wallet in [self.wallet_pk, self.wallet_2, self.wallet_2_1_2]:
+            wallet.refresh_from_db()
+            self.assertEqual(wallet.balance, wallet.calculate_balance())
+            self.assertEqual(wallet.nonce, wallet.calculate_nonce())
+        self.assertEqual(self.wallet_pk.balance, 0)
+        self.assertEqual(self.wallet_pk.nonce, 3)
+        self.assertEqual(self.wallet_2.balance, 15)
+
+        meta_transaction = MetaTransaction.objects.get(
+            signature=response.data[0]["meta_transaction"]["signature"]
+        )
+        self.assertEqual(
+            str(meta_transaction.uuid), response.data[0]["meta_transaction"]["uuid"]
+        )
+        self.assertEqual(meta_transaction.from_public_key, self.key.public_key())
+        self.assertEqual(
+            Transaction.objects.get(pk=meta_transaction.pk).currency, self.currency
+        )
+
+        response = self.client.post(
+            "/api/wallet/meta_transaction/bulk/", items[:1], format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        Transaction.objects.create(to_wallet=self.wallet_pk, amount=5)
+        response = self.client.post(
+            "/api/wallet/meta_transaction/bulk/",
+            [self.sign_meta_transaction(self.wallet_pk, self.wallet_2, 4, 5)],
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        self.client.force_authenticate(user=None)
+
+    def test_transaction_bulk_create_zero_amounts(self):
+        self.client.force_authenticate(user=self.user)
+        self.wallet_pk.state = WALLET_STATES.VERIFIED.value
+        self.wallet_pk.save()
+
+        # a zero amount does not advance the nonce, the second item reuses it
+        items = [
+            self.sign_meta_transaction(self.wallet_pk, self.wallet_2, 1, 0),
+            self.sign_meta_transaction(self.wallet_pk, self.wallet_2_1_2, 1, 0),
+        ]
+        response = self.client.post(
+            "/api/wallet/meta_transaction/bulk/", items, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual([result["status"] for result in response.data], [201, 400])
+        self.assertIn("nonce", response.data[1]["errors"])
+
+        response = self.client.post(
+            "/api/wallet/meta_transaction/bulk/", items[1:], format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("nonce", response.data[0]["errors"])
+
+        self.client.force_authenticate(user=None)
+
+    def test_multi_recipient_meta_transaction_create(self):
+        self.client.force_authenticate(user=self.user)
+        self.wallet_pk.state = WALLET_STATES.VERIFIED.value
+        self.wallet_pk.save()
+        Transaction.objects.create(to_wallet=self.wallet_pk, amount=40)
+        transaction_count = Transaction.objects.all().count()
+
+        recipients = [(self.wallet_2, 10), (self.wallet_2_1_2, 20), (self.wallet_2, 5)]
+        message = {
+            "from_public_key": self.wallet_pk.public_key,
+            "nonce": 1,
+            "txs": [
+                {
+                    "to_": wallet.address,
+                    "amount": amount,
+                    "token_id": self.currency.token_id,
+                }
+                for wallet, amount in recipients
+            ],
+        }
+        data = {
+            "from_wallet": self.wallet_pk.wallet_id,
+            "nonce": 1,
+            "signature": self.key.sign(pack_meta_transaction(message)),
+            "txs": [
+                {"to_wallet": wallet.wallet_id, "amount": amount}
+                for wallet, amount in recipients
+            ],
+        }
+
+        # the signature covers every recipient
+        response = self.client.post(
+            "/api/wallet/meta_transaction/multi_recipient/",
+            {**data, "txs": data["txs"][:2]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(transaction_count, Transaction.objects.all().count())
+
+        response = self.client.post(
+            "/api/wallet/meta_transaction/multi_recipient/", data, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["txs"], data["txs"])
+        self.assertEqual(transaction_count + 3, Transaction.objects.all().count())
+
+        meta_transaction = MetaTransaction.objects.get(uuid=response.data["uuid"])
+        self.assertEqual(meta_transaction.legs.count(), 2)
+        self.assertEqual(
+            set(meta_transaction.legs.values_list("currency", flat=True)),
+            {self.currency.pk},
+        )
+        self.assertEqual(meta_transaction.total_amount, 35)
+        self.assertEqual(
+            meta_transaction.to_meta_transaction_dictionary(),
+            {**message, "signature": data["signature"]},
+        )
+        for wallet in [self.wallet_pk, self.wallet_2, self.wallet_2_1_2]:
+            wallet.refresh_from_db()
+            self.assertEqual(wallet.balance, wallet.calculate_balance())
+        self.assertEqual(self.wallet_pk.balance, 5)
+        self.assertEqual(self.wallet_pk.nonce, 1)
+        self.assertEqual(self.wallet_2.balance, 15)
+
+        # the total amount exceeds the balance
+        message["nonce"] = 2
+        response = self.client.post(
+            "/api/wallet/meta_transaction/multi_recipient/",
+            {
+                **data,
+                "nonce": 2,
+                "signature": self.key.sign(pack_meta_transaction(message)),
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(transaction_count + 3, Transaction.objects.all().count())
 
         self.client.force_authenticate(user=None)
 
@@ -396,8 +595,46 @@ class TransactionApiTest(APITestCase):
             ],
         )
 
+        # the cursor pagination works on top of the union
+        response = self.client.get("/api/wallet/transaction/?page_size=2")
+        self.assertEqual(
+            response.data["results"],
+            [
+                TransactionSerializer(tx3_3).data,
+                TransactionSerializer(tx3_2).data,
+            ],
+        )
+        response = self.client.get(response.data["next"])
+        self.assertEqual(response.data["results"], [TransactionSerializer(tx1_1).data])
+        self.assertIsNone(response.data["next"])
+
         self.client.force_authenticate(user=None)
 
+    def test_transaction_history_plan(self):
+        Transaction.objects.create(to_wallet=self.wallet_1, amount=20)
+        Transaction.objects.create(to_wallet=self.wallet_2, amount=20)
+        Transaction.objects.create(
+            from_wallet=self.wallet_1, to_wallet=self.wallet_2, amount=2
+        )
+        Transaction.objects.create(
+            from_wallet=self.wallet_2, to_wallet=self.wallet_1, amount=4
+        )
+        queryset = Transaction.get_belonging_to_user(self.user).order_by("-created_at")
+
+        # one lookup per wallet column, no OR across both columns
+        sql = str(queryset.query)
+        self.assertIn("UNION", sql)
+        self.assertNotIn(" OR ", sql)
+        self.assertEqual(
+            set(queryset),
+            set(
+                Transaction.objects.filter(
+                    Q(from_wallet__owner=self.user) | Q(to_wallet__owner=self.user)
+                )
+            ),
+        )
+        self.assertEqual(queryset.count(), 3)
+
     def test_open_cashout_request(self):
         self.wallet_1.state = WALLET_STATES.VERIFIED.value
         self.wallet_1.save()
@@ -449,3 +686,26 @@ class TransactionApiTest(APITestCase):
             response.data["results"][0]["uuid"],
             str(tx4.uuid),
         )
+
+        # paginated, the cashout wallet of an other currency does not count
+        tx5 = Transaction.objects.create(
+            from_wallet=self.wallet_2, to_wallet=self.currency.owner_wallet, amount=1
+        )
+        Transaction.objects.create(
+            from_wallet=self.wallet_2_2,
+            to_wallet=self.currency_2.owner_wallet,
+            amount=1,
+        )
+        self.currency_2.cashout_wallet = None
+        self.currency_2.save()
+
+        response = self.client.get("/api/wallet/open_cashout_transaction/?page_size=1")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [result["uuid"] for result in response.data["results"]], [str(tx5.uuid)]
+        )
+        response = self.client.get(response.data["next"])
+        self.assertEqual(
+            [result["uuid"] for result in response.data["results"]], [str(tx4.uuid)]
+        )
+        self.assertIsNone(response.data["next"])
@@ -0,0 +1,189 @@
+from io import StringIO
+
+import pytezos
+from django.conf import settings
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from apps.currency.models import Currency
+from apps.wallet.fake_tezos import FakeRpcError, FakeTezosNode, fake_tezos
+from apps.wallet.models import (
+    TRANSACTION_STATES,
+    WALLET_STATES,
+    MetaTransaction,
+    SyncBatch,
+    Transaction,
+    Wallet,
+)
+from apps.wallet.tezos import get_tezos_client, get_token_contract
+from apps.wallet.utils import (
+    confirm_sync_batches,
+    pack_meta_transaction,
+    read_nonce_from_chain,
+    sync_batch_to_blockchain,
+)
+
+
+class UnreachableTezosNode(FakeTezosNode):
+    def rpc(self):
+        raise FakeRpcError("Connection refused")
+
+
+class MintRejectingTezosNode(FakeTezosNode):
+    def preapply(self, contents):
+        if contents[0]["parameters"]["entrypoint"] == "mint":
+            contents = [
+                {**contents[0], "parameters": {"entrypoint": "fake_failure"}}
+            ] + contents[1:]
+        return super().preapply(contents)
+
+
+class TimingOutTezosNode(FakeTezosNode):
+    def inject(self, contents):
+        # the node takes the operation, the answer does not come back
+        super().inject(contents)
+        raise FakeRpcError("Read timed out")
+
+
+class FakeTezosTestCase(TestCase):
+    def setUp(self):
+        self.currency = Currency.objects.create(
+            token_id=0,
+            name="test",
+            symbol="test",
+            claim_deadline="2120-01-01",
+            campaign_end="2120-01-01",
+        )
+        self.key = pytezos.crypto.key.Key.generate()
+        self.wallet1 = Wallet.objects.create(
+            wallet_id=Wallet.generate_wallet_id(),
+            public_key=self.key.public_key(),
+            currency=self.currency,
+            state=WALLET_STATES.VERIFIED.value,
+        )
+        self.wallet2 = Wallet.objects.create(
+            wallet_id=Wallet.generate_wallet_id(),
+            public_key=pytezos.crypto.key.Key.generate().public_key(),
+            currency=self.currency,
+            state=WALLET_STATES.VERIFIED.value,
+        )
+        Transaction.objects.create(to_wallet=self.wallet1, amount=10)
+        meta_transaction = MetaTransaction(
+            from_wallet=self.wallet1, to_wallet=self.wallet2, amount=3, nonce=1
+        )
+        meta_transaction.signature = self.key.sign(
+            pack_meta_transaction(meta_transaction.to_meta_transaction_dictionary())
+        )
+        meta_transaction.save()
+
+    def test_sync(self):
+        with fake_tezos(FakeTezosNode()) as node:
+            self.assertEqual(sync_batch_to_blockchain(10).is_applied, True)
+            self.assertEqual(
+                set(Transaction.objects.values_list("state", flat=True)),
+                {TRANSACTION_STATES.PENDING.value},
+            )
+            for _ in range(settings.TEZOS_CONFIRMATION_DEPTH):
+                node.bake()
+            self.assertEqual(confirm_sync_batches(), 1)
+
+            self.assertEqual(
+                set(Transaction.objects.values_list("state", flat=True)),
+                {TRANSACTION_STATES.DONE.value},
+            )
+            self.assertEqual(node.ledger[(self.wallet1.address, 0)], 7)
+            self.assertEqual(
+                get_token_contract().big_map_get(
+                    "ledger/{}::0".format(self.wallet2.address)
+                ),
+                3,
+            )
+            self.assertEqual(read_nonce_from_chain(self.wallet1.address), 1)
+
+    def test_sync_worker_survives_errors(self):
+        out, err = StringIO(), StringIO()
+        with fake_tezos(UnreachableTezosNode()):
+            call_command("sync_worker", "--once", stdout=out, stderr=err)
+        self.assertIn("sync cycle failed", err.getvalue())
+        self.assertIn("Connection refused", err.getvalue())
+        # the lease is released, the items are synced by a later cycle
+        self.assertEqual(
+            set(Transaction.objects.values_list("state", flat=True)),
+            {TRANSACTION_STATES.OPEN.value},
+        )
+
+    @override_settings(TEZOS_OPERATION_GROUP_SIZE_LIMIT=1)
+    def test_failing_item_does_not_block(self):
+        # every item gets a group of its own, the mint comes first and fails
+        node = MintRejectingTezosNode()
+        node.ledger[(self.wallet1.address, 0)] = 10
+        with fake_tezos(node):
+            self.assertEqual(sync_batch_to_blockchain(10).is_applied, True)
+
+        mint = Transaction.objects.get(from_wallet__isnull=True)
+        self.assertEqual(mint.state, TRANSACTION_STATES.FAILED.value)
+        self.assertEqual(mint.sync_batch.notes, "Preapply failed for the item alone")
+        self.assertEqual(
+            MetaTransaction.objects.get().state, TRANSACTION_STATES.PENDING.value
+        )
+
+    def test_failing_item_is_isolated(self):
+        # the mint and the meta transaction share a group, which fails as a whole
+        node = MintRejectingTezosNode()
+        node.ledger[(self.wallet1.address, 0)] = 10
+        with fake_tezos(node):
+            self.assertEqual(sync_batch_to_blockchain(10).is_applied, True)
+            node.bake()
+
+        mint = Transaction.objects.get(from_wallet__isnull=True)
+        self.assertEqual(mint.state, TRANSACTION_STATES.FAILED.value)
+        self.assertEqual(mint.sync_batch.notes, "Preapply failed for the item alone")
+        self.assertEqual(
+            MetaTransaction.objects.get().state, TRANSACTION_STATES.PENDING.value
+        )
+        self.assertEqual(node.ledger[(self.wallet2.address, 0)], 3)
+
+    def test_inject_timeout(self):
+        with fake_tezos(TimingOutTezosNode()) as node:
+            self.assertEqual(sync_batch_to_blockchain(10).is_applied, False)
+            # the items are not leased again while the operation may be on its way
+            self.assertEqual(sync_batch_to_blockchain(10).size, 0)
+            sync_batch = SyncBatch.objects.get()
+            self.assertEqual(sync_batch.state, TRANSACTION_STATES.PENDING.value)
+            self.assertIn("Read timed out", sync_batch.notes)
+
+            for _ in range(settings.TEZOS_CONFIRMATION_DEPTH):
+                node.bake()
+            self.assertEqual(confirm_sync_batches(), 1)
+
+        self.assertEqual(
+            set(Transaction.objects.values_list("state", flat=True)),
+            {TRANSACTION_STATES.DONE.value},
+        )
+        self.assertEqual(node.ledger[(self.wallet2.address, 0)], 3)
+
+    def test_counter(self):
+        node = FakeTezosNode()
+        with fake_tezos(node):
+            token_contract = get_token_contract()
+            first = get_tezos_client().bulk(
+                token_contract.mint(address="tz1", token_id=0, amount=1)
+            )
+            second = get_tezos_client().bulk(
+                token_contract.mint(address="tz1", token_id=0, amount=1)
+            )
+            first.fill().sign().inject()
+            # filled with the same counter as the first one
+            with self.assertRaises(FakeRpcError):
+                second.fill().sign().inject()
+
+            node.bake()
+            second.fill().sign().inject()
+            node.bake()
+        self.assertEqual(node.ledger[("tz1", 0)], 2)
+
+    def test_benchmark(self):
+        out = StringIO()
+        call_command("benchmark_sync", wallets=3, transactions=10, stdout=out)
+        self.assertIn("synced=10 failed=0 open=0", out.getvalue())
+        self.assertEqual(Wallet.objects.filter(currency__name="benchmark").count(), 0)
@@ -0,0 +1,86 @@
+import random
+
+from django.test import SimpleTestCase
+from pytezos import Key
+from pytezos.crypto.encoding import base58_encode
+
+from apps.wallet.michelson import pack_message, pack_paper_wallet_message
+from apps.wallet.utils import (
+    create_paper_wallet_message_micheline,
+    pack_meta_transaction_micheline,
+)
+
+
+class PaperWalletStub:
+    def __init__(self, wallet_id):
+        self.wallet_id = wallet_id
+
+
+class MichelsonEncoderTestCase(SimpleTestCase):
+    # randomized equivalence checks against the pytezos type system
+    iterations = 200
+
+    def setUp(self):
+        self.rng = random.Random(4)
+        self.public_keys = [
+            Key.generate(curve=curve, export=False).public_key()
+            for curve in (b"ed", b"sp", b"p2")
+            for _ in range(3)
+        ]
+
+    def random_address(self):
+        prefix = self.rng.choice([b"tz1", b"tz2", b"tz3", b"KT1"])
+        return base58_encode(
+            self.rng.getrandbits(160).to_bytes(20, "big"), prefix
+        ).decode()
+
+    def random_nat(self):
+        return self.rng.choice(
+            [0, 1, 63, 64, 127, 128, 8191, 8192, self.rng.getrandbits(70)]
+            + [self.rng.randint(0, 10 ** 6)] * 3
+        )
+
+    def test_meta_transaction_message(self):
+        for _ in range(self.iterations):
+            meta_transaction = {
+                "from_public_key": self.rng.choice(self.public_keys),
+                "nonce": self.random_nat(),
+                "txs": [
+                    {
+                        "to_": self.random_address(),
+                        "token_id": self.random_nat(),
+                        "amount": self.random_nat(),
+                    }
+                    for _ in range(self.rng.randint(0, 5))
+                ],
+            }
+            self.assertEqual(
+                pack_message(
+                    meta_transaction["from_public_key"],
+                    meta_transaction["nonce"],
+                    meta_transaction["txs"],
+                ),
+                pack_meta_transaction_micheline(meta_transaction),
+                meta_transaction,
+            )
+
+    def test_paper_wallet_message(self):
+        alphabet = "ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789 -_.:"
+        for _ in range(self.iterations):
+            wallet_id = "".join(
+                self.rng.choice(alphabet) for _ in range(self.rng.randint(0, 20))
+            )
+            token_id = self.random_nat()
+            self.assertEqual(
+                pack_paper_wallet_message(wallet_id, token_id),
+                create_paper_wallet_message_micheline(
+                    PaperWalletStub(wallet_id), token_id
+                ),
+                (wallet_id, token_id),
+            )
+
+    def test_negative_nat(self):
+        with self.assertRaises(ValueError):
+            pack_message(self.public_keys[0], -1, [])
+        with self.assertRaises(ValueError):
+            pack_paper_wallet_message("AB123456", -1)
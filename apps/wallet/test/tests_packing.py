@@ -0,0 +1,170 @@
+from django.test import SimpleTestCase, override_settings
+
+from apps.wallet.packing import (
+    KEY_TRANSFER,
+    META_TRANSFER,
+    MINT,
+    TRANSFER,
+    SyncItem,
+    net_transfer_payloads,
+    pack_sync_items,
+    split_operation_group,
+)
+
+
+def mint(item, address, token_id=0, amount=1):
+    return SyncItem(
+        MINT, item, {"address": address, "token_id": token_id, "amount": amount}, 1
+    )
+
+
+def transfer(from_, to_, amount, token_id=0):
+    return SyncItem(
+        TRANSFER,
+        None,
+        {
+            "from_": from_,
+            "txs": [{"to_": to_, "token_id": token_id, "amount": amount}],
+        },
+        1,
+    )
+
+
+class PackSyncItemsTestCase(SimpleTestCase):
+    def test_operation_count(self):
+        # every contract call reserves the gas limit of a whole operation
+        mints = [mint(index, index) for index in range(12)]
+        operation_groups = list(pack_sync_items(mints))
+
+        self.assertEqual([len(group.mints) for group in operation_groups], [10, 2])
+        self.assertEqual(
+            [sync_item.item for group in operation_groups for sync_item in group.items],
+            list(range(12)),
+        )
+
+    def test_aggregated_mints(self):
+        sync_items = [
+            mint("a", "tz1", amount=1),
+            mint("b", "tz2", amount=2),
+            mint("c", "tz1", amount=3),
+            mint("d", "tz1", token_id=1, amount=4),
+        ]
+        operation_groups = list(pack_sync_items(sync_items))
+
+        self.assertEqual(len(operation_groups), 1)
+        self.assertEqual(operation_groups[0].operation_count, 3)
+        self.assertEqual(
+            [
+                (payload["address"], payload["token_id"], payload["amount"])
+                for payload in operation_groups[0].mint_payloads
+            ],
+            [("tz1", 0, 4), ("tz2", 0, 2), ("tz1", 1, 4)],
+        )
+        self.assertEqual(
+            [sync_item.item for sync_item in operation_groups[0].items],
+            ["a", "b", "c", "d"],
+        )
+
+    def test_shared_operations(self):
+        sync_items = [
+            mint("mint", "tz1"),
+            SyncItem(TRANSFER, "transfer", {}, 1),
+            SyncItem(META_TRANSFER, "meta", {}, 2),
+            SyncItem(None, "leg", None, 0),
+            SyncItem(TRANSFER, "transfer", {}, 1),
+            SyncItem(KEY_TRANSFER, "key_transfer", {}, 1),
+        ]
+        operation_groups = list(pack_sync_items(sync_items))
+
+        self.assertEqual(len(operation_groups), 1)
+        self.assertEqual(operation_groups[0].operation_count, 4)
+        self.assertEqual(len(operation_groups[0].shared[TRANSFER]), 2)
+
+    @override_settings(TEZOS_OPERATION_GROUP_SIZE_LIMIT=1000)
+    def test_size_limit(self):
+        # 120 + 150 + 40 bytes for the first meta transfer, 190 for every other one
+        sync_items = []
+        for index in range(20):
+            sync_items.append(SyncItem(META_TRANSFER, index, {}, 1))
+            sync_items.append(SyncItem(None, index, None, 0))
+        operation_groups = list(pack_sync_items(sync_items))
+
+        self.assertEqual(
+            [len(group.items) for group in operation_groups], [8, 8, 8, 8, 8]
+        )
+        # the legs stay with their meta transaction
+        for group in operation_groups:
+            self.assertEqual(group.items[-1].kind, None)
+            self.assertEqual(group.items[-1].item, group.items[-2].item)
+
+    @override_settings(TEZOS_OPERATION_GAS_LIMIT=100000)
+    def test_operation_gas_limit(self):
+        # 25000 gas for the contract call and 12000 for every transfer
+        sync_items = [SyncItem(TRANSFER, index, {}, 1) for index in range(10)]
+        operation_groups = list(pack_sync_items(sync_items))
+
+        self.assertEqual([len(group.items) for group in operation_groups], [6, 4])
+
+    def test_oversized_item(self):
+        sync_items = [
+            SyncItem(TRANSFER, "before", {}, 1),
+            SyncItem(META_TRANSFER, "oversized", {}, 1000),
+            SyncItem(TRANSFER, "after", {}, 1),
+        ]
+        operation_groups = list(pack_sync_items(sync_items))
+
+        self.assertEqual(
+            [
+                [sync_item.item for sync_item in group.items]
+                for group in operation_groups
+            ],
+            [["before"], ["oversized"], ["after"]],
+        )
+
+    def test_split(self):
+        sync_items = [
+            mint("mint", "tz1"),
+            SyncItem(META_TRANSFER, "meta", {}, 2),
+            SyncItem(None, "leg", None, 0),
+            SyncItem(TRANSFER, "transfer", {}, 1),
+        ]
+        (operation_group,) = pack_sync_items(sync_items)
+        halves = split_operation_group(operation_group)
+
+        # the leg stays with its meta transaction
+        self.assertEqual(
+            [[sync_item.item for sync_item in half.items] for half in halves],
+            [["mint"], ["meta", "leg", "transfer"]],
+        )
+        self.assertEqual([half.item_count for half in halves], [1, 2])
+        self.assertEqual(halves[1].operation_count, 2)
+
+
+class NetTransferPayloadsTestCase(SimpleTestCase):
+    def test_net_amounts(self):
+        payloads = net_transfer_payloads(
+            [
+                transfer("owner", "tz1", 10),
+                transfer("owner", "tz2", 10),
+                transfer("owner", "tz1", 10),
+                transfer("tz1", "owner", 5),
+                transfer("tz2", "owner", 15),
+                transfer("owner", "tz3", 1, token_id=1),
+                transfer("tz3", "owner", 1, token_id=1),
+                transfer("owner", "tz3", 2),
+            ]
+        )
+
+        self.assertEqual(
+            payloads,
+            [
+                {
+                    "from_": "owner",
+                    "txs": [
+                        {"to_": "tz1", "token_id": 0, "amount": 15},
+                        {"to_": "tz3", "token_id": 0, "amount": 2},
+                    ],
+                },
+                {"from_": "tz2", "txs": [{"to_": "owner", "token_id": 0, "amount": 5}]},
+            ],
+        )
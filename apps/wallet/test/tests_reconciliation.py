@@ -0,0 +1,185 @@
+import pytezos
+from django.test import TestCase
+
+from apps.currency.models import Currency
+from apps.wallet.fake_tezos import FakeTezosNode, fake_tezos
+from apps.wallet.models import (
+    TRANSACTION_STATES,
+    WALLET_STATES,
+    Reconciliation,
+    SyncBatch,
+    Transaction,
+    Wallet,
+)
+from apps.wallet.reconciliation import reconcile_sync_state, with_synced_balance
+from apps.wallet.utils import fix_sync_state
+
+
+class FakeLedgerReader:
+    def __init__(self, ledger):
+        self.ledger = ledger
+        self.read_addresses = []
+
+    def read(self, wallet):
+        self.read_addresses.append(wallet.address)
+        if wallet.address not in self.ledger:
+            return 0, "RpcError('Not found')"
+        return self.ledger[wallet.address], ""
+
+
+class ReconciliationTestCase(TestCase):
+    def setUp(self):
+        self.currency = Currency.objects.create(
+            token_id=0,
+            name="test",
+            symbol="test",
+            claim_deadline="2120-01-01",
+            campaign_end="2120-01-01",
+        )
+        self.wallets = [
+            Wallet.objects.create(
+                wallet_id=Wallet.generate_wallet_id(),
+                public_key=pytezos.crypto.key.Key.generate().public_key(),
+                currency=self.currency,
+                state=WALLET_STATES.VERIFIED.value,
+            )
+            for _ in range(3)
+        ]
+        Transaction.objects.create(to_wallet=self.wallets[0], amount=10)
+        Transaction.objects.create(to_wallet=self.wallets[1], amount=8)
+        Transaction.objects.create(
+            from_wallet=self.wallets[1], to_wallet=self.wallets[0], amount=3
+        )
+        Transaction.objects.update(state=TRANSACTION_STATES.DONE.value)
+        # not synced yet
+        Transaction.objects.create(to_wallet=self.wallets[2], amount=7)
+
+        self.ledger = {
+            self.wallets[0].address: 13,
+            self.wallets[1].address: 6,
+        }
+
+    def test_synced_balance(self):
+        with self.assertNumQueries(1):
+            balances = dict(
+                with_synced_balance(Wallet.objects.all()).values_list(
+                    "pk", "synced_balance"
+                )
+            )
+        self.assertEqual(balances[self.wallets[0].pk], 13)
+        self.assertEqual(balances[self.wallets[1].pk], 5)
+        self.assertEqual(balances[self.wallets[2].pk], 0)
+        self.assertEqual(self.wallets[2].balance, 7)
+
+    def test_reconcile(self):
+        reconciliation = reconcile_sync_state(
+            workers=2, ledger_reader=FakeLedgerReader(self.ledger)
+        )
+
+        self.assertEqual(reconciliation.checked_count, Wallet.objects.count())
+        self.assertIsNotNone(reconciliation.finished_at)
+        self.assertEqual(
+            list(
+                reconciliation.mismatches.values_list(
+                    "wallet", "balance", "on_chain_balance"
+                )
+            ),
+            [(self.wallets[1].pk, 5, 6)],
+        )
+        self.assertEqual(reconciliation.mismatches.get().difference, 1)
+
+    def test_resume(self):
+        wallets = list(Wallet.objects.order_by("pk"))
+        interrupted = Reconciliation.objects.create(checkpoint=wallets[0].pk)
+        ledger_reader = FakeLedgerReader(self.ledger)
+
+        reconciliation = reconcile_sync_state(resume=True, ledger_reader=ledger_reader)
+
+        self.assertEqual(reconciliation, interrupted)
+        self.assertEqual(
+            ledger_reader.read_addresses, [wallet.address for wallet in wallets[1:]]
+        )
+        self.assertEqual(reconciliation.checked_count, len(wallets) - 1)
+
+        # a finished reconciliation is not resumed
+        self.assertNotEqual(
+            reconcile_sync_state(resume=True, ledger_reader=ledger_reader),
+            interrupted,
+        )
+
+    def test_incremental(self):
+        # the first incremental run compares everything
+        first = reconcile_sync_state(
+            incremental=True, ledger_reader=FakeLedgerReader(self.ledger)
+        )
+        self.assertIsNone(first.since)
+        self.assertEqual(first.checked_count, Wallet.objects.count())
+
+        # synced after the watermark, created before
+        synced_transaction = Transaction.objects.get(to_wallet=self.wallets[2])
+        sync_batch = SyncBatch.objects.create(item_count=1)
+        sync_batch.update_items([synced_transaction], TRANSACTION_STATES.PENDING.value)
+        sync_batch.finish(TRANSACTION_STATES.DONE.value)
+        Transaction.objects.create(
+            from_wallet=self.wallets[0], to_wallet=self.wallets[1], amount=1
+        )
+
+        ledger_reader = FakeLedgerReader(self.ledger)
+        reconciliation = reconcile_sync_state(
+            incremental=True, idle_sample_size=0, ledger_reader=ledger_reader
+        )
+        self.assertEqual(reconciliation.since, first.watermark)
+        self.assertEqual(
+            sorted(ledger_reader.read_addresses),
+            sorted(wallet.address for wallet in self.wallets),
+        )
+        self.assertEqual(
+            set(reconciliation.mismatches.values_list("wallet", flat=True)),
+            {self.wallets[1].pk, self.wallets[2].pk},
+        )
+
+        # nothing happened since, the mismatched wallets are compared again
+        ledger_reader = FakeLedgerReader(self.ledger)
+        reconciliation = reconcile_sync_state(
+            incremental=True, idle_sample_size=0, ledger_reader=ledger_reader
+        )
+        self.assertEqual(
+            sorted(ledger_reader.read_addresses),
+            sorted([self.wallets[1].address, self.wallets[2].address]),
+        )
+        self.assertEqual(reconciliation.mismatch_count, 2)
+
+        # fixed on chain
+        self.ledger[self.wallets[1].address] = 5
+        self.ledger[self.wallets[2].address] = 7
+        reconciliation = reconcile_sync_state(
+            incremental=True, idle_sample_size=0, ledger_reader=ledger_reader
+        )
+        self.assertEqual(reconciliation.checked_count, 2)
+        self.assertEqual(reconciliation.mismatch_count, 0)
+
+        # nothing happened since, only the idle sample is compared
+        ledger_reader = FakeLedgerReader(self.ledger)
+        reconciliation = reconcile_sync_state(
+            incremental=True, idle_sample_size=2, ledger_reader=ledger_reader
+        )
+        self.assertEqual(reconciliation.checked_count, 2)
+        self.assertEqual(len(ledger_reader.read_addresses), 2)
+
+    def test_fix_sync_state(self):
+        # on chain already, not confirmed yet
+        pending_transaction = Transaction.objects.get(to_wallet=self.wallets[2])
+        sync_batch = SyncBatch.objects.create(item_count=1)
+        sync_batch.update_items([pending_transaction], TRANSACTION_STATES.PENDING.value)
+        self.ledger[self.wallets[2].address] = 7
+
+        node = FakeTezosNode()
+        for address, amount in self.ledger.items():
+            node.ledger[(address, 0)] = amount
+        with fake_tezos(node):
+            fix_sync_state("tz1payback")
+
+        # only the surplus of the wallet without pending items is paid back
+        self.assertEqual(node.ledger[("tz1payback", 0)], 1)
+        self.assertEqual(node.ledger[(self.wallets[1].address, 0)], 5)
+        self.assertEqual(node.ledger[(self.wallets[2].address, 0)], 7)
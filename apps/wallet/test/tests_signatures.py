@@ -0,0 +1,97 @@
+from django.test import SimpleTestCase
+from pytezos import Key
+
+from apps.wallet.signatures import (
+    VerificationCache,
+    decode_ed25519_public_key,
+    verify_signature,
+    verify_signatures,
+)
+
+
+class SignatureVerificationTestCase(SimpleTestCase):
+    def setUp(self):
+        self.ed_key = Key.generate(export=False)
+        self.sp_key = Key.generate(curve=b"sp", export=False)
+        self.p2_key = Key.generate(curve=b"p2", export=False)
+        self.message = b"\x05\x07\x07\x01\x00\x00\x00\x02AB\x00\x01"
+
+    def test_ed25519(self):
+        public_key = self.ed_key.public_key()
+        verify_signature(self.message, self.ed_key.sign(self.message), public_key)
+        verify_signature(
+            self.message, self.ed_key.sign(self.message, generic=True), public_key
+        )
+
+        with self.assertRaisesMessage(ValueError, "Signature is invalid."):
+            verify_signature(
+                self.message + b"\x00", self.ed_key.sign(self.message), public_key
+            )
+        with self.assertRaisesMessage(ValueError, "Signature is invalid."):
+            verify_signature(
+                self.message,
+                self.ed_key.sign(self.message),
+                Key.generate(export=False).public_key(),
+            )
+        with self.assertRaisesMessage(ValueError, "curves mismatch"):
+            verify_signature(self.message, self.sp_key.sign(self.message), public_key)
+        with self.assertRaises(ValueError):
+            verify_signature(self.message, "edsigbroken", public_key)
+
+    def test_public_key_decoding_is_memoized(self):
+        public_key = self.ed_key.public_key()
+        signature = self.ed_key.sign(self.message)
+        verify_signature(self.message, signature, public_key)
+        hits = decode_ed25519_public_key.cache_info().hits
+        verify_signature(self.message, signature, public_key)
+        self.assertEqual(decode_ed25519_public_key.cache_info().hits, hits + 1)
+
+    def test_pytezos_fallback(self):
+        for key in (self.sp_key, self.p2_key):
+            verify_signature(self.message, key.sign(self.message), key.public_key())
+            verify_signature(
+                self.message, key.sign(self.message, generic=True), key.public_key()
+            )
+            with self.assertRaises(ValueError):
+                verify_signature(
+                    self.message + b"\x00", key.sign(self.message), key.public_key()
+                )
+
+    def test_batch(self):
+        triples = [
+            (self.message, key.sign(self.message), key.public_key())
+            for key in (self.ed_key, self.sp_key, self.p2_key)
+        ]
+        triples.append(
+            (self.message, self.ed_key.sign(b"other"), self.ed_key.public_key())
+        )
+        triples.append(
+            (self.message, self.p2_key.sign(self.message), self.ed_key.public_key())
+        )
+        self.assertEqual(verify_signatures(triples), [True, True, True, False, False])
+        self.assertEqual(verify_signatures([]), [])
+
+
+class VerificationCacheTestCase(SimpleTestCase):
+    def setUp(self):
+        self.time = 0
+        self.cache = VerificationCache(maxsize=2, ttl=10, clock=lambda: self.time)
+
+    def test_ttl(self):
+        self.cache.set("a", True)
+        self.cache.set("b", False)
+        self.time = 9
+        self.assertTrue(self.cache.get("a"))
+        self.assertFalse(self.cache.get("b"))
+        self.time = 10
+        self.assertIsNone(self.cache.get("a"))
+        self.assertNotIn("a", self.cache.results)
+
+    def test_least_recently_used_is_evicted(self):
+        self.cache.set("a", True)
+        self.cache.set("b", True)
+        self.assertTrue(self.cache.get("a"))
+        self.cache.set("c", True)
+        self.assertIsNone(self.cache.get("b"))
+        self.assertTrue(self.cache.get("a"))
+        self.assertTrue(self.cache.get("c"))
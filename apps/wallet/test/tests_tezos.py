@@ -0,0 +1,29 @@
+from django.test import SimpleTestCase, override_settings
+
+from apps.wallet.tezos import TezosClientCache
+
+
+class TezosClientCacheTestCase(SimpleTestCase):
+    def setUp(self):
+        self.load_count = 0
+
+    def load(self):
+        self.load_count += 1
+        return "client", "token_contract {}".format(self.load_count)
+
+    @override_settings(TEZOS_CLIENT_TTL=600)
+    def test_loaded_once(self):
+        cache = TezosClientCache(self.load)
+        for _ in range(3):
+            self.assertEqual(cache.get(), ("client", "token_contract 1"))
+        self.assertEqual(self.load_count, 1)
+
+        cache.invalidate()
+        self.assertEqual(cache.get(), ("client", "token_contract 2"))
+
+    @override_settings(TEZOS_CLIENT_TTL=0)
+    def test_expired(self):
+        cache = TezosClientCache(self.load)
+        cache.get()
+        cache.get()
+        self.assertEqual(self.load_count, 2)
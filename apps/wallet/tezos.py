@@ -0,0 +1,94 @@
+"""
+Process wide pytezos client and token contract. Loading the contract fetches and
+parses its script, so both are kept for TEZOS_CLIENT_TTL seconds and all their RPC
+calls go through one pooled http session. rpc_call_count tells how many requests
+went to the node, e.g. to compare two runs.
+"""
+import threading
+import time
+
+from django.conf import settings
+from pytezos import pytezos
+from pytezos.rpc.node import RpcNode
+from pytezos.rpc.shell import ShellQuery
+from requests.adapters import HTTPAdapter
+
+_rpc_call_count = 0
+_rpc_call_count_lock = threading.Lock()
+
+
+def rpc_call_count():
+    return _rpc_call_count
+
+
+def count_rpc_call():
+    global _rpc_call_count
+    with _rpc_call_count_lock:
+        _rpc_call_count += 1
+
+
+class CountingRpcNode(RpcNode):
+    """
+    Node connection with a connection pool of TEZOS_RPC_POOL_SIZE, large enough for
+    the reconciliation threads, that counts its requests
+    """
+
+    def __init__(self, uri, network="", caching=False):
+        super().__init__(uri, network=network, caching=caching)
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=settings.TEZOS_RPC_POOL_SIZE
+        )
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+    def request(self, method, path, **kwargs):
+        count_rpc_call()
+        return super().request(method, path, **kwargs)
+
+
+def load_tezos_client():
+    pytezos_client = pytezos.using(
+        key=settings.TEZOS_ADMIN_ACCOUNT_PRIVATE_KEY,
+        shell=ShellQuery(node=CountingRpcNode(settings.TEZOS_NODE)),
+    )
+    return pytezos_client, pytezos_client.contract(
+        settings.TEZOS_TOKEN_CONTRACT_ADDRESS
+    )
+
+
+class TezosClientCache:
+    """
+    Keeps what load returns for TEZOS_CLIENT_TTL seconds. Operation groups and
+    contract calls spawn a context of their own, so the cached client does not
+    carry counters from one operation group to the next.
+    """
+
+    def __init__(self, load):
+        self.load = load
+        self.lock = threading.Lock()
+        self.invalidate()
+
+    def invalidate(self):
+        self.value = None
+        self.loaded_at = None
+
+    def get(self):
+        with self.lock:
+            if (
+                self.value is None
+                or time.monotonic() - self.loaded_at >= settings.TEZOS_CLIENT_TTL
+            ):
+                self.value = self.load()
+                self.loaded_at = time.monotonic()
+            return self.value
+
+
+tezos_client_cache = TezosClientCache(load_tezos_client)
+
+
+def get_tezos_client():
+    return tezos_client_cache.get()[0]
+
+
+def get_token_contract():
+    return tezos_client_cache.get()[1]
@@ -2,7 +2,9 @@ from django.urls import path
 
 from apps.wallet.views import (
     CashOutRequestListCreate,
+    MetaTransactionBulkCreate,
     MetaTransactionListCreate,
+    MultiRecipientMetaTransactionCreate,
     OpenCashoutTransactions,
     PaperWalletDetail,
     TransactionList,
@@ -45,4 +47,14 @@ urlpatterns = [
         MetaTransactionListCreate.as_view(),
         name="meta_transaction_list_create",
     ),
+    path(
+        "meta_transaction/bulk/",
+        MetaTransactionBulkCreate.as_view(),
+        name="meta_transaction_bulk_create",
+    ),
+    path(
+        "meta_transaction/multi_recipient/",
+        MultiRecipientMetaTransactionCreate.as_view(),
+        name="multi_recipient_meta_transaction_create",
+    ),
 ]
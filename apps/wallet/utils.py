@@ -1,13 +1,35 @@
-import json
+import datetime
 import time
 import traceback
+from collections import namedtuple
+from contextlib import contextmanager
+from itertools import islice
 
 from django.conf import settings
+from django.db import connection
+from django.db import transaction as db_transaction
+from django.db.models import Exists, OuterRef, Prefetch, Q, QuerySet
 from django.utils.timezone import now
-from pytezos import pytezos
+from fcm_django.models import FCMDevice
 from pytezos.michelson.types.base import MichelsonType
 from pytezos.operation.result import OperationResult
 
+from apps.tasks.models import TASK_STATES, Task
+from apps.tasks.utils import enqueue
+from apps.wallet.michelson import pack_message, pack_paper_wallet_message
+from apps.wallet.packing import (
+    KEY_TRANSFER,
+    META_TRANSFER,
+    MINT,
+    TRANSFER,
+    SyncItem,
+    net_transfer_payloads,
+    pack_sync_items,
+    split_operation_group,
+)
+from apps.wallet.signatures import paper_wallet_signature_cache, verify_signature
+from apps.wallet.tezos import get_tezos_client, get_token_contract
+
 PAPER_WALLET_MESSAGE_STRUCTURE = {
     "prim": "pair",
     "args": [
@@ -18,6 +40,32 @@ PAPER_WALLET_MESSAGE_STRUCTURE = {
 
 
 def create_paper_wallet_message(wallet, token_id):
+    return pack_paper_wallet_message(wallet.wallet_id, token_id)
+
+
+def verify_paper_wallet_signature(wallet, signature):
+    """
+    Returns whether the paper wallet signed its message with signature. The result
+    is cached, the public key is part of the key since it changes with a transfer.
+    """
+    key = (wallet.wallet_id, signature, wallet.public_key)
+    is_valid = paper_wallet_signature_cache.get(key)
+    if is_valid is None:
+        try:
+            verify_signature(
+                create_paper_wallet_message(wallet, wallet.currency.token_id),
+                signature,
+                wallet.public_key,
+            )
+            is_valid = True
+        except ValueError:
+            is_valid = False
+        paper_wallet_signature_cache.set(key, is_valid)
+    return is_valid
+
+
+def create_paper_wallet_message_micheline(wallet, token_id):
+    # reference implementation through the pytezos type system
     message_to_encode = {
         "prim": "Pair",
         "args": [
@@ -59,36 +107,23 @@ MESSAGE_STRUCTURE = {
 
 
 def create_message(from_wallet, to_wallet, nonce, token_id, amount):
-    message_to_encode = {
-        "prim": "Pair",
-        "args": [
-            {"string": from_wallet.public_key},
-            {
-                "prim": "Pair",
-                "args": [
-                    {"int": nonce},
-                    [
-                        {
-                            "prim": "Pair",
-                            "args": [
-                                {"string": to_wallet.address},
-                                {
-                                    "prim": "Pair",
-                                    "args": [{"int": token_id}, {"int": amount}],
-                                },
-                            ],
-                        }
-                    ],
-                ],
-            },
-        ],
-    }
-
-    michelson_type = MichelsonType.match(MESSAGE_STRUCTURE)
-    return michelson_type.from_micheline_value(message_to_encode).pack()
+    return pack_message(
+        from_wallet.public_key,
+        nonce,
+        [{"to_": to_wallet.address, "token_id": token_id, "amount": amount}],
+    )
 
 
 def pack_meta_transaction(meta_transaction):
+    return pack_message(
+        meta_transaction["from_public_key"],
+        meta_transaction["nonce"],
+        meta_transaction["txs"],
+    )
+
+
+def pack_meta_transaction_micheline(meta_transaction):
+    # reference implementation through the pytezos type system
     message_to_encode = {
         "prim": "Pair",
         "args": [
@@ -117,11 +152,14 @@ def pack_meta_transaction(meta_transaction):
     return michelson_type.from_micheline_value(message_to_encode).pack()
 
 
-def read_nonce_from_chain(address):
-    pytezos_client = pytezos.using(
-        key=settings.TEZOS_ADMIN_ACCOUNT_PRIVATE_KEY, shell=settings.TEZOS_NODE
+def send_push_notification(user_id, message, data=None):
+    FCMDevice.objects.filter(user=user_id).send_message(
+        title=settings.PUSH_NOTIFICATION_TITLE, body=message, data=data
     )
-    token_contract = pytezos_client.contract(settings.TEZOS_TOKEN_CONTRACT_ADDRESS)
+
+
+def read_nonce_from_chain(address):
+    token_contract = get_token_contract()
     try:
         return int(
             token_contract.nonce_of(
@@ -139,287 +177,687 @@ def read_nonce_from_chain(address):
         return 0
 
 
-def sync_to_blockchain(is_dry_run=True, _async=False):
+# key of the postgres advisory lock held while syncing
+BLOCKCHAIN_SYNC_LOCK_ID = 7307213
+# key of the postgres advisory lock serializing the sync requests
+BLOCKCHAIN_SYNC_REQUEST_LOCK_ID = 7307214
+
+# waits for the chain, see BLOCKCHAIN_SYNC_WAIT_TIME
+BLOCKCHAIN_SYNC_VISIBILITY_TIMEOUT = 60 * 60
+
+# transactions loaded and prepared for the sync at once
+SYNC_CHUNK_SIZE = 2000
+
+SyncBatchResult = namedtuple("SyncBatchResult", ["size", "lag", "is_applied"])
+# a committed PENDING SyncBatch and the signed operation group to inject for it
+SyncInjection = namedtuple("SyncInjection", ["sync_batch", "operation_group"])
+
+
+@contextmanager
+def blockchain_sync_lock():
+    """
+    Yields whether this process may sync, at most one process across all pods holds
+    the lock. Only postgres has advisory locks, other databases always get it.
+    """
+    if connection.vendor != "postgresql":
+        yield True
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_try_advisory_lock(%s)", [BLOCKCHAIN_SYNC_LOCK_ID])
+        acquired = cursor.fetchone()[0]
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT pg_advisory_unlock(%s)", [BLOCKCHAIN_SYNC_LOCK_ID]
+                )
+
+
+def count_pending_sync_items():
+    """
+    Open transactions and transfer requests the next lease_sync_batch picks up.
+    Failed items are retried by the next sync but do not make it more urgent.
+    """
+    from apps.wallet.models import (
+        TRANSACTION_STATES,
+        Transaction,
+        WalletPublicKeyTransferRequest,
+    )
+
+    return (
+        exclude_deferred_transfers(with_sync_relations(Transaction.objects))
+        .filter(state=TRANSACTION_STATES.OPEN.value)
+        .count()
+        + WalletPublicKeyTransferRequest.objects.filter(
+            state=TRANSACTION_STATES.OPEN.value
+        ).count()
+    )
+
+
+def lock_blockchain_sync_requests():
+    """
+    Serializes the sync requests until the end of the database transaction, so
+    concurrent requests find the queued run instead of enqueueing one each. Only
+    postgres has advisory locks, other databases serialize their writes anyway.
+    """
+    if connection.vendor != "postgresql":
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT pg_advisory_xact_lock(%s)", [BLOCKCHAIN_SYNC_REQUEST_LOCK_ID]
+        )
+
+
+def request_blockchain_sync(min_delay=0):
+    """
+    Coalesces sync triggers into one queued run. It starts at the latest
+    BLOCKCHAIN_SYNC_MAX_LATENCY seconds after the first trigger, or right away once
+    BLOCKCHAIN_SYNC_FLUSH_SIZE items wait for the sync, but never before min_delay
+    seconds.
+    """
+    with db_transaction.atomic():
+        lock_blockchain_sync_requests()
+        task = (
+            Task.objects.select_for_update()
+            .filter(
+                function="{}.{}".format(__name__, run_blockchain_sync.__name__),
+                state=TASK_STATES.QUEUED.value,
+            )
+            .order_by("run_after")
+            .first()
+        )
+        flush = count_pending_sync_items() >= settings.BLOCKCHAIN_SYNC_FLUSH_SIZE
+
+        if task is None:
+            return enqueue(
+                run_blockchain_sync,
+                delay=max(
+                    min_delay, 0 if flush else settings.BLOCKCHAIN_SYNC_MAX_LATENCY
+                ),
+                visibility_timeout=BLOCKCHAIN_SYNC_VISIBILITY_TIMEOUT,
+            )
+        run_after = now() + datetime.timedelta(seconds=min_delay)
+        if flush and task.run_after > run_after:
+            task.run_after = run_after
+            Task.objects.filter(pk=task.pk).update(run_after=task.run_after)
+        return task
+
+
+def run_blockchain_sync():
+    from apps.wallet.models import TRANSACTION_STATES, SyncBatch
+
+    confirm_sync_batches()
+    with blockchain_sync_lock() as acquired:
+        if not acquired:
+            # the items are picked up by the next run, which waits for the other
+            # sync instead of retrying right away
+            request_blockchain_sync(min_delay=settings.BLOCKCHAIN_SYNC_IDLE_INTERVAL)
+            return
+        batch = sync_batch_to_blockchain(settings.BLOCKCHAIN_SYNC_BATCH_SIZE)
+    if (
+        batch.is_applied and batch.size >= settings.BLOCKCHAIN_SYNC_BATCH_SIZE
+    ) or SyncBatch.objects.filter(state=TRANSACTION_STATES.PENDING.value).exclude(
+        operation_hash=""
+    ).exists():
+        # more items are likely waiting or an injected batch is to be confirmed
+        request_blockchain_sync()
+
+
+def lease_sync_batch(batch_size):
+    """
+    Locks the oldest open transactions and transfer requests, at most batch_size
+    items in total. Rows locked by another worker are skipped. Call it inside
+    db_transaction.atomic, the lease ends with the database transaction.
+    """
+    from apps.wallet.models import (
+        TRANSACTION_STATES,
+        Transaction,
+        WalletPublicKeyTransferRequest,
+    )
+
+    synced_states = [TRANSACTION_STATES.PENDING.value, TRANSACTION_STATES.DONE.value]
+    transactions = list(
+        exclude_deferred_transfers(
+            with_sync_relations(
+                Transaction.objects.select_for_update(skip_locked=True, of=("self",))
+            )
+        )
+        .exclude(state__in=synced_states)
+        .order_by("created_at")[:batch_size]
+    )
+    # a transfer request moves the whole balance, so it only joins a batch once
+    # every open transaction fits into it
+    if len(transactions) >= batch_size:
+        return transactions, []
+    wallet_public_key_transfer_requests = list(
+        WalletPublicKeyTransferRequest.objects.select_for_update(
+            skip_locked=True, of=("self",)
+        )
+        .select_related("wallet__currency")
+        .exclude(state__in=synced_states)
+        .order_by("created_at")[: batch_size - len(transactions)]
+    )
+    return transactions, wallet_public_key_transfer_requests
+
+
+def sync_batch_to_blockchain(batch_size):
+    """
+    Leases a batch and prepares its SyncBatch. The lease ends once the SyncBatch
+    and the PENDING items are committed, only then the operation group is
+    injected, so a failure after the injection cannot reopen injected items. If
+    preparing raises, the lease is released and the items stay open.
+    """
+    with db_transaction.atomic():
+        transactions, wallet_public_key_transfer_requests = lease_sync_batch(batch_size)
+        items = transactions + wallet_public_key_transfer_requests
+        if len(items) == 0:
+            return SyncBatchResult(size=0, lag=0.0, is_applied=None)
+
+        lag = (now() - min(item.created_at for item in items)).total_seconds()
+        is_applied, sync_injection = prepare_sync_items(
+            transactions, wallet_public_key_transfer_requests, is_dry_run=False
+        )
+    if sync_injection is not None:
+        is_applied = inject_sync_batch(sync_injection)
+    return SyncBatchResult(size=len(items), lag=lag, is_applied=is_applied)
+
+
+def sync_to_blockchain(is_dry_run=True):
     print("starting sync")
     time.sleep(settings.BLOCKCHAIN_SYNC_WAIT_TIME)
     from apps.wallet.models import (
         TRANSACTION_STATES,
+        Transaction,
+        WalletPublicKeyTransferRequest,
+    )
+
+    return sync_items_to_blockchain(
+        with_sync_relations(Transaction.objects)
+        .exclude(state=TRANSACTION_STATES.PENDING.value)
+        .exclude(state=TRANSACTION_STATES.DONE.value)
+        .order_by("created_at"),
+        WalletPublicKeyTransferRequest.objects.select_related("wallet__currency")
+        .exclude(state=TRANSACTION_STATES.PENDING.value)
+        .exclude(state=TRANSACTION_STATES.DONE.value)
+        .order_by("created_at"),
+        is_dry_run=is_dry_run,
+    )
+
+
+def with_sync_relations(transactions):
+    """
+    Fetches the wallets and currency of every transaction along with it and
+    annotates what decides how it is synced
+    """
+    from apps.wallet.models import (
         MetaTransaction,
         Transaction,
-        Wallet,
         WalletPublicKeyTransferRequest,
     )
 
-    pytezos_client = pytezos.using(
-        key=settings.TEZOS_ADMIN_ACCOUNT_PRIVATE_KEY, shell=settings.TEZOS_NODE
+    return transactions.select_related(
+        "from_wallet", "to_wallet__currency", "meta_transaction"
+    ).annotate(
+        is_meta_transaction=Exists(MetaTransaction.objects.filter(pk=OuterRef("pk"))),
+        to_wallet_has_spent=Exists(
+            Transaction.objects.filter(from_wallet=OuterRef("to_wallet"))
+        ),
+        to_wallet_has_transfer_requests=Exists(
+            WalletPublicKeyTransferRequest.objects.filter(wallet=OuterRef("to_wallet"))
+        ),
     )
-    token_contract = pytezos_client.contract(settings.TEZOS_TOKEN_CONTRACT_ADDRESS)
 
-    funding_transactions = {}
-    meta_transactions = []
-    operation_groups = []
 
-    state_update_items = []
+def exclude_deferred_transfers(transactions):
+    """
+    Plain transfers to a wallet that never spent are skipped by the sync until the
+    wallet does, they must not take up a batch in the meantime. The transactions
+    have to come from with_sync_relations.
+    """
+    return transactions.filter(
+        Q(from_wallet__isnull=True)
+        | Q(meta_transaction__isnull=False)
+        | Q(is_meta_transaction=True)
+        | Q(to_wallet_has_spent=True)
+        | Q(to_wallet_has_transfer_requests=True)
+    )
 
-    for transaction in (
-        Transaction.objects.exclude(state=TRANSACTION_STATES.PENDING.value)
-        .exclude(state=TRANSACTION_STATES.DONE.value)
-        .order_by("created_at")
-    ):
-        if not transaction.from_wallet:
-            operation_groups.append(
-                token_contract.mint(
-                    address=transaction.to_wallet.address,
-                    decimals=transaction.to_wallet.currency.decimals,
-                    name=transaction.to_wallet.currency.name,
-                    token_id=transaction.to_wallet.currency.token_id,
-                    symbol=transaction.to_wallet.currency.symbol,
-                    amount=transaction.amount,
-                ).operation_group.sign()
-            )
-            state_update_items.append(transaction)
-        elif MetaTransaction.objects.filter(pk=transaction.pk).exists():
-            meta_transactions.append(MetaTransaction.objects.get(pk=transaction))
-            state_update_items.append(transaction)
-        elif (
-            transaction.to_wallet.from_transactions.count() > 0
-            or transaction.to_wallet.transfer_requests.count() > 0
-        ):
-            same_from_txs = funding_transactions.get(
-                transaction.from_wallet.address, []
+
+def iterate_in_chunks(items, chunk_size=SYNC_CHUNK_SIZE):
+    # querysets are streamed instead of loaded at once
+    if isinstance(items, QuerySet):
+        items = items.iterator(chunk_size=chunk_size)
+    items = iter(items)
+    chunk = list(islice(items, chunk_size))
+    while len(chunk) > 0:
+        yield chunk
+        chunk = list(islice(items, chunk_size))
+
+
+def build_sync_items(transactions, wallet_public_key_transfer_requests, is_dry_run):
+    """
+    Yields the SyncItem of every transaction and transfer request that goes to the
+    chain. The transactions have to come from with_sync_relations, the transfer
+    requests with their wallet and its currency. Every chunk takes the same amount
+    of queries, however many transactions it holds.
+    """
+    from apps.wallet.models import (
+        TRANSACTION_STATES,
+        MetaTransaction,
+        Transaction,
+        Wallet,
+    )
+
+    meta_transaction_ids = set()
+
+    for chunk in iterate_in_chunks(transactions):
+        meta_transactions = (
+            MetaTransaction.objects.select_related("from_wallet__currency", "to_wallet")
+            .prefetch_related(
+                Prefetch(
+                    "legs", queryset=Transaction.objects.select_related("to_wallet")
+                )
             )
-            same_from_txs.append(
-                {
-                    "to_": transaction.to_wallet.address,
-                    "token_id": transaction.to_wallet.currency.token_id,
-                    "amount": transaction.amount,
-                }
+            .in_bulk(
+                [
+                    transaction.pk
+                    for transaction in chunk
+                    if transaction.is_meta_transaction
+                ]
             )
-            funding_transactions[transaction.from_wallet.address] = same_from_txs
-            state_update_items.append(transaction)
+        )
+
+        for transaction in chunk:
+            if transaction.from_wallet_id is None:
+                yield SyncItem(
+                    MINT,
+                    transaction,
+                    {
+                        "address": transaction.to_wallet.address,
+                        "decimals": transaction.to_wallet.currency.decimals,
+                        "name": transaction.to_wallet.currency.name,
+                        "token_id": transaction.to_wallet.currency.token_id,
+                        "symbol": transaction.to_wallet.currency.symbol,
+                        "amount": transaction.amount,
+                    },
+                    1,
+                )
+            elif transaction.meta_transaction_id is not None:
+                # synced as part of its meta transaction's txs
+                if transaction.meta_transaction_id in meta_transaction_ids:
+                    yield SyncItem(None, transaction, None, 0)
+                elif not is_dry_run:
+                    # the meta transaction went into an earlier batch
+                    meta_transaction = transaction.meta_transaction
+                    Transaction.objects.filter(pk=transaction.pk).update(
+                        state=meta_transaction.state,
+                        sync_batch=meta_transaction.sync_batch_id,
+                        notes=meta_transaction.notes,
+                        operation_hash=meta_transaction.operation_hash,
+                        submitted_to_chain_at=meta_transaction.submitted_to_chain_at,
+                    )
+            elif transaction.is_meta_transaction:
+                meta_transaction_ids.add(transaction.pk)
+                meta_transaction_payload = meta_transactions[
+                    transaction.pk
+                ].to_meta_transaction_dictionary()
+                yield SyncItem(
+                    META_TRANSFER,
+                    transaction,
+                    meta_transaction_payload,
+                    len(meta_transaction_payload["txs"]),
+                )
+            elif (
+                transaction.to_wallet_has_spent
+                or transaction.to_wallet_has_transfer_requests
+            ):
+                yield SyncItem(
+                    TRANSFER,
+                    transaction,
+                    {
+                        "from_": transaction.from_wallet.address,
+                        "txs": [
+                            {
+                                "to_": transaction.to_wallet.address,
+                                "token_id": transaction.to_wallet.currency.token_id,
+                                "amount": transaction.amount,
+                            }
+                        ],
+                    },
+                    1,
+                )
+
+    # wallet public key transfers
+    for chunk in iterate_in_chunks(wallet_public_key_transfer_requests):
+        for wallet_public_key_transfer_request in chunk:
+            if (
+                wallet_public_key_transfer_request.wallet.balance > 0
+                and wallet_public_key_transfer_request.wallet.public_key
+                != wallet_public_key_transfer_request.new_public_key
+            ):
+                new_address = Wallet.address_from_public_key(
+                    wallet_public_key_transfer_request.new_public_key
+                )
+                yield SyncItem(
+                    KEY_TRANSFER,
+                    wallet_public_key_transfer_request,
+                    {
+                        "from_": wallet_public_key_transfer_request.wallet.address,
+                        "txs": [
+                            {
+                                "to_": new_address,
+                                "token_id": wallet_public_key_transfer_request.wallet.currency.token_id,
+                                "amount": wallet_public_key_transfer_request.wallet.balance,
+                            }
+                        ],
+                    },
+                    1,
+                )
+            else:
+                complete_wallet_public_key_transfer_request(
+                    wallet_public_key_transfer_request,
+                    notes=(
+                        "Has no balance or was recovering to same pubkey, "
+                        "transferred offchain"
+                    ),
+                )
+
 
-    # preparing funding
-    if len(funding_transactions.items()) > 0:
+def sync_items_to_blockchain(
+    transactions, wallet_public_key_transfer_requests, is_dry_run=True
+):
+    """
+    Packs the given transactions and transfer requests into operation groups within
+    the protocol limits and injects the first one without waiting for the chain,
+    confirm_sync_batches completes it. The next group needs the counter after this
+    one, so the remaining items stay open until the node included it. A dry run
+    only preapplies the first group.
+    """
+    is_applied, sync_injection = prepare_sync_items(
+        transactions, wallet_public_key_transfer_requests, is_dry_run=is_dry_run
+    )
+    if sync_injection is not None:
+        return inject_sync_batch(sync_injection)
+    return is_applied
+
+
+def prepare_sync_items(transactions, wallet_public_key_transfer_requests, is_dry_run):
+    """
+    Packs the first operation group of the given items and prepares it, see
+    prepare_operation_group. A group of several items that fails is split in halves
+    and the first half is prepared, until the failing item is alone. A group of a
+    single item that fails is marked failed and the next group is prepared instead,
+    so the item does not hold back the ones after it. Returns (None, None) if there
+    is nothing to sync or an injected batch is still in flight.
+    """
+    if not is_dry_run and is_sync_batch_in_flight():
+        return None, None
+
+    pytezos_client = get_tezos_client()
+    token_contract = get_token_contract()
+
+    sync_items = build_sync_items(
+        transactions, wallet_public_key_transfer_requests, is_dry_run=is_dry_run
+    )
+    is_applied = None
+    for packed_operation_group in pack_sync_items(sync_items):
+        operation_groups = [packed_operation_group]
+        while len(operation_groups) > 0:
+            operation_group = operation_groups.pop(0)
+            is_applied, sync_injection = prepare_operation_group(
+                pytezos_client, token_contract, operation_group, is_dry_run=is_dry_run
+            )
+            if is_applied or is_dry_run:
+                return is_applied, sync_injection
+            if operation_group.item_count > 1:
+                # the halves keep their order, items left over by an applied half
+                # stay open for the next batch
+                operation_groups = split_operation_group(operation_group) + (
+                    operation_groups
+                )
+    return is_applied, None
+
+
+def prepare_operation_group(
+    pytezos_client, token_contract, packed_operation_group, is_dry_run
+):
+    """
+    Preapplies one packed operation group and, unless it is a dry run, stores it as
+    a SyncBatch with its items PENDING, or FAILED if the group of a single item
+    failed. Returns whether it was applied and the SyncInjection to pass to
+    inject_sync_batch once that is committed.
+    """
+    from apps.wallet.models import TRANSACTION_STATES, SyncBatch
+
+    state_update_items = [sync_item.item for sync_item in packed_operation_group.items]
+
+    contract_calls = [
+        token_contract.mint(**mint_payload)
+        for mint_payload in packed_operation_group.mint_payloads
+    ]
+
+    # preparing funding, the transactions keep pointing to the sync batch of the
+    # netted transfer
+    if settings.BLOCKCHAIN_SYNC_NET_TRANSFERS:
+        funding_transaction_payloads = net_transfer_payloads(
+            packed_operation_group.shared[TRANSFER]
+        )
+    else:
+        funding_transactions = {}
+        for sync_item in packed_operation_group.shared[TRANSFER]:
+            same_from_txs = funding_transactions.get(sync_item.payload["from_"], [])
+            same_from_txs.extend(sync_item.payload["txs"])
+            funding_transactions[sync_item.payload["from_"]] = same_from_txs
         funding_transaction_payloads = list(
             map(
                 lambda item: {"from_": item[0], "txs": item[1]},
                 funding_transactions.items(),
             )
         )
-        operation_groups.append(
-            token_contract.transfer(funding_transaction_payloads).operation_group.sign()
-        )
+    if len(funding_transaction_payloads) > 0:
+        contract_calls.append(token_contract.transfer(funding_transaction_payloads))
 
     # preparing meta
-    if len(meta_transactions) > 0:
-        meta_transaction_payloads = list(
-            map(
-                lambda meta_transaction: meta_transaction.to_meta_transaction_dictionary(),
-                meta_transactions,
-            )
+    if len(packed_operation_group.shared[META_TRANSFER]) > 0:
+        meta_transaction_payloads = [
+            sync_item.payload
+            for sync_item in packed_operation_group.shared[META_TRANSFER]
+        ]
+        contract_calls.append(token_contract.meta_transfer(meta_transaction_payloads))
+
+    # wallet public key transfers
+    if len(packed_operation_group.shared[KEY_TRANSFER]) > 0:
+        wallet_public_key_transfer_payloads = [
+            sync_item.payload
+            for sync_item in packed_operation_group.shared[KEY_TRANSFER]
+        ]
+        contract_calls.append(
+            token_contract.transfer(wallet_public_key_transfer_payloads)
+        )
+
+    # all contract calls in one group, filled with consecutive counters and signed once
+    final_operation_group = pytezos_client.bulk(*contract_calls).fill().sign()
+    print(final_operation_group)
+    operation_result = final_operation_group.preapply()
+    print(operation_result)
+    is_applied = OperationResult.is_applied(operation_result)
+    if not is_applied and not is_dry_run and packed_operation_group.is_single_item:
+        # the item fails on its own, it would stay first in line and fail again
+        sync_batch = SyncBatch.objects.create(
+            item_count=len(state_update_items), result=operation_result
+        )
+        sync_batch.update_items(state_update_items, TRANSACTION_STATES.FAILED.value)
+        sync_batch.finish(
+            TRANSACTION_STATES.FAILED.value, notes="Preapply failed for the item alone"
         )
-        operation_groups.append(
-            token_contract.meta_transfer(
-                meta_transaction_payloads
-            ).operation_group.sign()
+    if is_dry_run or not is_applied:
+        return is_applied, None
+
+    # the hash is known before injecting, so the batch can be found on chain even if
+    # the node accepted the operation but the inject call failed
+    sync_batch = SyncBatch.objects.create(
+        item_count=len(state_update_items),
+        result=operation_result,
+        operation_hash=final_operation_group.hash(),
+        injected_level=final_operation_group.shell.head.level(),
+        submitted_to_chain_at=now(),
+    )
+    sync_batch.update_items(state_update_items, TRANSACTION_STATES.PENDING.value)
+    return True, SyncInjection(sync_batch, final_operation_group)
+
+
+def inject_sync_batch(sync_injection):
+    """
+    Injects the operation group of a prepared SyncBatch without waiting for the
+    chain. Returns whether the node took it. If injecting raises the operation may
+    still have reached the node, the SyncBatch stays PENDING and
+    confirm_sync_batches fails it only once it was not included within
+    TEZOS_OPERATION_TTL blocks.
+    """
+    sync_batch, operation_group = sync_injection
+    try:
+        operation_group.inject(_async=True, preapply=False, check_result=True)
+    except Exception as error:
+        sync_batch.notes = "Exception during inject: {}\nTraceback: {}".format(
+            repr(error), traceback.format_exc()
         )
+        sync_batch.save()
+        return False
+    return True
 
-    # wallet public key transfers
-    wallet_public_key_transfer_payloads = []
-    wallet_public_key_transfer_requests = []
-    for wallet_public_key_transfer_request in (
-        WalletPublicKeyTransferRequest.objects.exclude(
-            state=TRANSACTION_STATES.PENDING.value
+
+def is_sync_batch_in_flight():
+    """
+    Whether an injected operation group waits for its inclusion. A batch without
+    operation hash predates storing the hash before injecting, it is left for a
+    manual review.
+    """
+    from apps.wallet.models import TRANSACTION_STATES, SyncBatch
+
+    return (
+        SyncBatch.objects.filter(
+            state=TRANSACTION_STATES.PENDING.value, included_level__isnull=True
         )
-        .exclude(state=TRANSACTION_STATES.DONE.value)
+        .exclude(operation_hash="")
+        .exists()
+    )
+
+
+def confirm_sync_batches():
+    """
+    Moves injected sync batches and their items to DONE once the operation is
+    TEZOS_CONFIRMATION_DEPTH blocks deep, or to FAILED if it failed or was not
+    included within TEZOS_OPERATION_TTL blocks. Returns how many batches finished.
+    """
+    from apps.wallet.models import TRANSACTION_STATES, SyncBatch
+
+    sync_batch_pks = list(
+        SyncBatch.objects.filter(state=TRANSACTION_STATES.PENDING.value)
+        .exclude(operation_hash="")
         .order_by("created_at")
-    ):
-        if (
-            wallet_public_key_transfer_request.wallet.balance > 0
-            and wallet_public_key_transfer_request.wallet.public_key
-            != wallet_public_key_transfer_request.new_public_key
-        ):
-            new_address = Wallet(
-                public_key=wallet_public_key_transfer_request.new_public_key
-            ).address
-            state_update_items.append(wallet_public_key_transfer_request)
-            wallet_public_key_transfer_requests.append(
-                wallet_public_key_transfer_request
-            )
-            wallet_public_key_transfer_payloads.append(
-                {
-                    "from_": wallet_public_key_transfer_request.wallet.address,
-                    "txs": [
-                        {
-                            "to_": new_address,
-                            "token_id": wallet_public_key_transfer_request.wallet.currency.token_id,
-                            "amount": wallet_public_key_transfer_request.wallet.balance,
-                        }
-                    ],
-                }
-            )
-        else:
-            wallet_public_key_transfer_request.old_public_key = (
-                wallet_public_key_transfer_request.wallet.public_key
-            )
-            wallet_public_key_transfer_request.wallet.public_key = (
-                wallet_public_key_transfer_request.new_public_key
+        .values_list("pk", flat=True)
+    )
+    if len(sync_batch_pks) == 0:
+        return 0
+
+    shell = get_tezos_client().shell
+    head_level = shell.head.level()
+    finished_count = 0
+    for sync_batch_pk in sync_batch_pks:
+        with db_transaction.atomic():
+            sync_batch = (
+                SyncBatch.objects.select_for_update(skip_locked=True)
+                .filter(pk=sync_batch_pk, state=TRANSACTION_STATES.PENDING.value)
+                .first()
             )
-            wallet_public_key_transfer_request.wallet.save()
-            wallet_public_key_transfer_request.state = TRANSACTION_STATES.DONE.value
-            wallet_public_key_transfer_request.notes = (
-                "Has no balance or was recovering to same pubkey, transferred offchain"
+            if sync_batch is not None and confirm_sync_batch(
+                sync_batch, shell, head_level
+            ):
+                finished_count += 1
+    return finished_count
+
+
+def confirm_sync_batch(sync_batch, shell, head_level):
+    from apps.wallet.models import TRANSACTION_STATES
+
+    if sync_batch.included_level is None:
+        first_level = (sync_batch.checked_level or sync_batch.injected_level) + 1
+        for level in range(first_level, head_level + 1):
+            operation_hashes = shell.blocks[level].operation_hashes()
+            sync_batch.checked_level = level
+            if any(sync_batch.operation_hash in hashes for hashes in operation_hashes):
+                sync_batch.included_level = level
+                break
+
+    if sync_batch.included_level is None:
+        if head_level - sync_batch.injected_level > settings.TEZOS_OPERATION_TTL:
+            sync_batch.finish(
+                TRANSACTION_STATES.FAILED.value,
+                notes="Not included within {} blocks".format(
+                    settings.TEZOS_OPERATION_TTL
+                ),
             )
-            wallet_public_key_transfer_request.save()
-            wallet_public_key_transfer_request.wallet.notify_owner_transfer_request_done()
-
-    if len(wallet_public_key_transfer_payloads) > 0:
-        operation_groups.append(
-            token_contract.transfer(
-                wallet_public_key_transfer_payloads
-            ).operation_group.sign()
-        )
+            return True
+        sync_batch.save()
+        return False
 
-    # merging all operations into one single group
-    final_operation_group = None
-    operation_counter = 0
-    for operation_group in operation_groups:
-        if final_operation_group is None:
-            final_operation_group = operation_group
-            operation_counter = int(operation_group.contents[0]["counter"])
-        else:
-            operation_counter += 1
-            operation = operation_group.contents[0]
-            operation["counter"] = str(operation_counter)
-            final_operation_group = final_operation_group.operation(
-                operation_group.contents[0]
-            )
+    if head_level - sync_batch.included_level + 1 < settings.TEZOS_CONFIRMATION_DEPTH:
+        sync_batch.save()
+        return False
 
-    if final_operation_group is not None:  # we have stuff to sync
-        print(final_operation_group)
-        operation_result = final_operation_group.sign().preapply()
-        print(operation_result)
-        if is_dry_run:
-            return OperationResult.is_applied(operation_result)
-        elif OperationResult.is_applied(operation_result):
-
-            def update_sync_state(
-                items,
-                state=TRANSACTION_STATES.PENDING.value,
-                notes="",
-                operation_hash="",
-            ):
-                for item in items:
-                    type(item).objects.filter(pk=item.pk).update(
-                        state=state,
-                        notes=notes,
-                        operation_hash=operation_hash,
-                        submitted_to_chain_at=now(),
-                    )
+    try:
+        operation = shell.blocks[sync_batch.included_level].operations[
+            sync_batch.operation_hash
+        ]()
+    except StopIteration:
+        # the including block was replaced, the operation may come in another one
+        sync_batch.checked_level = sync_batch.included_level - 1
+        sync_batch.included_level = None
+        sync_batch.save()
+        return False
 
-            update_sync_state(state_update_items)
-            try:
-                is_confirmed_in_chain = False
-                try:
-                    operation_inject_result = final_operation_group.sign().inject(
-                        _async=_async,
-                        preapply=True,
-                        check_result=True,
-                        num_blocks_wait=settings.TEZOS_BLOCK_WAIT_TIME,
-                    )
-                    is_operation_applied = OperationResult.is_applied(
-                        operation_inject_result
-                    )
-                    is_confirmed_in_chain = True
-                except AssertionError:
-                    # here we assume that the operation was applied even if we know the assertion failed
-                    is_operation_applied = True
-
-                if is_operation_applied:
-                    for (
-                        wallet_public_key_transfer_request
-                    ) in wallet_public_key_transfer_requests:
-                        wallet_public_key_transfer_request.old_public_key = (
-                            wallet_public_key_transfer_request.wallet.public_key
-                        )
-                        wallet_public_key_transfer_request.wallet.public_key = (
-                            wallet_public_key_transfer_request.new_public_key
-                        )
-                        wallet_public_key_transfer_request.wallet.save()
-                        wallet_public_key_transfer_request.state = (
-                            TRANSACTION_STATES.DONE.value
-                        )
-                        wallet_public_key_transfer_request.save()
-                        wallet_public_key_transfer_request.wallet.notify_owner_transfer_request_done()
-
-                    if is_confirmed_in_chain:
-                        update_sync_state(
-                            state_update_items,
-                            TRANSACTION_STATES.DONE.value,
-                            json.dumps(operation_inject_result),
-                            operation_inject_result["hash"],
-                        )
-                    else:
-                        update_sync_state(
-                            state_update_items,
-                            TRANSACTION_STATES.DONE.value,
-                            json.dumps(operation_result),
-                            "*",
-                        )
-                else:
-                    if operation_inject_result is None:
-                        update_sync_state(
-                            state_update_items,
-                            TRANSACTION_STATES.FAILED.value,
-                            "Error during sync: {}".format(
-                                json.dumps(operation_result)
-                            ),
-                        )
-                    else:
-                        update_sync_state(
-                            state_update_items,
-                            TRANSACTION_STATES.FAILED.value,
-                            "Error during sync: {}".format(
-                                json.dumps(operation_inject_result)
-                            ),
-                        )
-                return is_operation_applied
-            except Exception as error:
-                update_sync_state(
-                    state_update_items,
-                    TRANSACTION_STATES.FAILED.value,
-                    "Exception during sync: {}\nTraceback: {}".format(
-                        repr(error), traceback.format_exc()
-                    ),
-                )
-                return False
-        else:
-            return OperationResult.is_applied(operation_result)
+    if not OperationResult.is_applied(operation):
+        sync_batch.finish(
+            TRANSACTION_STATES.FAILED.value, operation, notes="Operation failed"
+        )
+        return True
+
+    for wallet_public_key_transfer_request in sync_batch.transfer_requests.all():
+        complete_wallet_public_key_transfer_request(wallet_public_key_transfer_request)
+    sync_batch.finish(TRANSACTION_STATES.DONE.value, operation)
+    return True
 
 
-def check_sync_state():
-    from apps.wallet.models import Wallet
+def complete_wallet_public_key_transfer_request(
+    wallet_public_key_transfer_request, notes=""
+):
+    from apps.wallet.models import TRANSACTION_STATES
 
-    pytezos_client = pytezos.using(
-        key=settings.TEZOS_ADMIN_ACCOUNT_PRIVATE_KEY, shell=settings.TEZOS_NODE
+    wallet_public_key_transfer_request.old_public_key = (
+        wallet_public_key_transfer_request.wallet.public_key
     )
-    token_contract = pytezos_client.contract(settings.TEZOS_TOKEN_CONTRACT_ADDRESS)
-    fail_message = ""
-    for wallet in Wallet.objects.all():
-        try:
-            on_chain_balance = token_contract.big_map_get(
-                "ledger/{}::{}".format(wallet.address, wallet.currency.token_id)
-            )
-            if wallet.balance != on_chain_balance:
+    wallet_public_key_transfer_request.wallet.public_key = (
+        wallet_public_key_transfer_request.new_public_key
+    )
+    wallet_public_key_transfer_request.wallet.save()
+    wallet_public_key_transfer_request.state = TRANSACTION_STATES.DONE.value
+    wallet_public_key_transfer_request.notes = notes
+    wallet_public_key_transfer_request.save()
+    wallet_public_key_transfer_request.wallet.notify_owner_transfer_request_done()
 
-                fail_message += "{} has {} onchain balance but on system {}\n".format(
-                    wallet.wallet_id, on_chain_balance, wallet.balance
-                )
-        except:
-            if wallet.balance > 0:
-                fail_message += "{} has 0 onchain balance but on system {}\n".format(
-                    wallet.wallet_id, wallet.balance
-                )
+
+def check_sync_state(resume=False, incremental=True):
+    from apps.wallet.reconciliation import reconcile_sync_state
+
+    reconciliation = reconcile_sync_state(resume=resume, incremental=incremental)
+    fail_message = ""
+    for mismatch in reconciliation.mismatches.select_related("wallet"):
+        fail_message += "{} has {} onchain balance but on system {}\n".format(
+            mismatch.wallet.wallet_id, mismatch.on_chain_balance, mismatch.balance
+        )
     if len(fail_message) > 0:
         raise Exception(fail_message)
         return False
@@ -427,42 +865,66 @@ def check_sync_state():
         return True
 
 
-def fix_sync_state(payback_address):
-    from apps.wallet.models import Wallet
-
-    pytezos_client = pytezos.using(
-        key=settings.TEZOS_ADMIN_ACCOUNT_PRIVATE_KEY, shell=settings.TEZOS_NODE
+def fix_sync_state(payback_address, resume=False):
+    from apps.wallet.models import (
+        TRANSACTION_STATES,
+        Transaction,
+        WalletPublicKeyTransferRequest,
+    )
+    from apps.wallet.reconciliation import reconcile_sync_state
+
+    reconciliation = reconcile_sync_state(resume=resume)
+    # the synced balance only counts confirmed transactions, the tokens of a
+    # pending batch may already be on chain and must not be paid back
+    pending_transactions = Transaction.objects.filter(
+        Q(to_wallet=OuterRef("wallet")) | Q(from_wallet=OuterRef("wallet")),
+        state=TRANSACTION_STATES.PENDING.value,
+    )
+    pending_transfer_requests = WalletPublicKeyTransferRequest.objects.filter(
+        wallet=OuterRef("wallet"), state=TRANSACTION_STATES.PENDING.value
+    )
+    mismatches = reconciliation.mismatches.select_related("wallet").annotate(
+        has_pending_transactions=Exists(pending_transactions),
+        has_pending_transfer_requests=Exists(pending_transfer_requests),
     )
-    token_contract = pytezos_client.contract(settings.TEZOS_TOKEN_CONTRACT_ADDRESS)
     transfer_transaction_payloads = []
     total_amount = 0
-    for wallet in Wallet.objects.all():
-        try:
-            on_chain_balance = token_contract.big_map_get(
-                "ledger/{}::{}".format(wallet.address, wallet.currency.token_id)
+    for mismatch in mismatches:
+        if mismatch.notes:
+            print(
+                "wallet {} had some issues: {}".format(
+                    mismatch.wallet.wallet_id, mismatch.notes
+                )
             )
-            if wallet.balance < on_chain_balance:
-                transfer_transaction_payloads.append(
-                    {
-                        "from_": wallet.address,
-                        "txs": [
-                            {
-                                "to_": payback_address,
-                                "token_id": wallet.currency.token_id,
-                                "amount": on_chain_balance - wallet.balance,
-                            }
-                        ],
-                    }
+        elif (
+            mismatch.has_pending_transactions or mismatch.has_pending_transfer_requests
+        ):
+            print(
+                "wallet {} has items waiting for confirmation, skipped".format(
+                    mismatch.wallet.wallet_id
                 )
-                total_amount += on_chain_balance - wallet.balance
-        except Exception as error:
-            if wallet.balance > 0:
-                print("wallet {} had some issues: {}".format(wallet.wallet_id, error))
+            )
+        elif mismatch.difference > 0:
+            transfer_transaction_payloads.append(
+                {
+                    "from_": mismatch.address,
+                    "txs": [
+                        {
+                            "to_": payback_address,
+                            "token_id": mismatch.token_id,
+                            "amount": mismatch.difference,
+                        }
+                    ],
+                }
+            )
+            total_amount += mismatch.difference
     print(
         "going to transfer {} from {} wallets to {}".format(
             total_amount, len(transfer_transaction_payloads), payback_address
         )
     )
+
+    token_contract = get_token_contract()
     token_contract.transfer(
         transfer_transaction_payloads
     ).operation_group.sign().inject(
@@ -1,7 +1,7 @@
-import pytezos
-from django.db.models import Q
+from django.db.models import F
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import filters, generics, serializers
+from rest_framework import filters, generics, serializers, status
+from rest_framework.response import Response
 
 from apps.wallet.models import (
     WALLET_STATES,
@@ -14,7 +14,9 @@ from apps.wallet.models import (
 )
 from apps.wallet.serializers import (
     CashOutRequestSerializer,
+    MetaTransactionBulkItemSerializer,
     MetaTransactionSerializer,
+    MultiRecipientMetaTransactionSerializer,
     PaperWalletSerializer,
     PublicPaperWalletSerializer,
     PublicWalletSerializer,
@@ -22,7 +24,11 @@ from apps.wallet.serializers import (
     WalletPublicKeyTransferRequestSerializer,
     WalletSerializer,
 )
-from apps.wallet.utils import create_paper_wallet_message
+from apps.wallet.utils import verify_paper_wallet_signature
+from project.utils import raise_api_exception
+
+# relations the wallet serializers render, joined so every wallet costs no query
+WALLET_RELATED_FIELDS = ["currency__owner_wallet", "currency__cashout_wallet"]
 
 
 class WalletDetail(generics.RetrieveAPIView):
@@ -30,12 +36,20 @@ class WalletDetail(generics.RetrieveAPIView):
     serializer_class = WalletSerializer
 
     def get_queryset(self):
-        return Wallet.objects.exclude(state=WALLET_STATES.DEACTIVATED.value)
+        return Wallet.objects.exclude(
+            state=WALLET_STATES.DEACTIVATED.value
+        ).select_related(*WALLET_RELATED_FIELDS)
+
+    def get_object(self):
+        # the serializer class depends on the wallet, it is looked up only once
+        if not hasattr(self, "wallet"):
+            self.wallet = super().get_object()
+        return self.wallet
 
     def get_serializer_class(self):
         wallet = self.get_object()
 
-        if wallet.owner == self.request.user:
+        if wallet.owner_id == self.request.user.pk:
             return WalletSerializer
         else:
             return PublicWalletSerializer
@@ -43,22 +57,16 @@ class WalletDetail(generics.RetrieveAPIView):
 
 class PaperWalletDetail(WalletDetail):
     def get_queryset(self):
-        return PaperWallet.objects.all()
+        return PaperWallet.objects.select_related(*WALLET_RELATED_FIELDS)
 
     def get_serializer_class(self):
         wallet = self.get_object()
         message_verified = False
         if self.kwargs.get("signature", None):
-            try:
-                key = pytezos.Key.from_encoded_key(wallet.public_key)
-                key.verify(
-                    self.kwargs["signature"],
-                    create_paper_wallet_message(wallet, wallet.currency.token_id),
-                )
-                message_verified = True
-            except ValueError:
+            if not verify_paper_wallet_signature(wallet, self.kwargs["signature"]):
                 raise serializers.ValidationError("invalid signature")
-        if wallet.owner == self.request.user or message_verified:
+            message_verified = True
+        if wallet.owner_id == self.request.user.pk or message_verified:
             return PaperWalletSerializer
         else:
             return PublicPaperWalletSerializer
@@ -69,32 +77,36 @@ class WalletListCreate(generics.ListCreateAPIView):
     filterset_fields = ["currency", "currency__is_public"]
 
     def get_queryset(self):
-        return self.request.user.wallets.exclude(state=WALLET_STATES.DEACTIVATED.value)
+        return self.request.user.wallets.exclude(
+            state=WALLET_STATES.DEACTIVATED.value
+        ).select_related(*WALLET_RELATED_FIELDS)
 
 
 class TransactionList(generics.ListAPIView):
     serializer_class = TransactionSerializer
 
-    filterset_fields = ["from_wallet__wallet_id", "to_wallet__wallet_id", "amount"]
+    filterset_fields = [
+        "from_wallet__wallet_id",
+        "to_wallet__wallet_id",
+        "amount",
+        "currency",
+    ]
     search_fields = ["=from_wallet__wallet_id", "=to_wallet__wallet_id"]
     filter_backends = [filters.SearchFilter, DjangoFilterBackend]
 
     def get_queryset(self):
-        return Transaction.objects.filter(
-            Q(from_wallet__owner=self.request.user)
-            | Q(to_wallet__owner=self.request.user)
-        ).order_by("-created_at")
+        return Transaction.get_belonging_to_user(self.request.user).order_by(
+            "-created_at"
+        )
 
 
 class OpenCashoutTransactions(TransactionList):
     def get_queryset(self):
-        cashout_ids = [
-            str(tx.uuid)
-            for tx in Transaction.objects.filter(from_wallet__owner=self.request.user)
-            if tx.is_cashout_transaction
-        ]
+        # payments to the cashout wallet of their currency without a cash out request
         return Transaction.objects.filter(
-            uuid__in=cashout_ids, cash_out_requests__isnull=True
+            from_wallet__owner=self.request.user,
+            to_wallet=F("to_wallet__currency__cashout_wallet"),
+            cash_out_requests__isnull=True,
         ).order_by("-created_at")
 
 
@@ -106,10 +118,55 @@ class MetaTransactionListCreate(generics.ListCreateAPIView):
     filter_backends = [filters.SearchFilter, DjangoFilterBackend]
 
     def get_queryset(self):
-        return MetaTransaction.objects.filter(
-            Q(from_wallet__owner=self.request.user)
-            | Q(to_wallet__owner=self.request.user)
-        ).order_by("-created_at")
+        return MetaTransaction.get_belonging_to_user(self.request.user).order_by(
+            "-created_at"
+        )
+
+
+class MetaTransactionBulkCreate(generics.GenericAPIView):
+    serializer_class = MetaTransactionBulkItemSerializer
+    max_items = 100
+
+    def post(self, request, *args, **kwargs):
+        if isinstance(request.data, list) and len(request.data) > self.max_items:
+            raise_api_exception(
+                400, f"At most {self.max_items} meta transactions per request"
+            )
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+
+        results = []
+        for meta_transaction, errors in MetaTransaction.create_in_bulk(
+            serializer.validated_data
+        ):
+            if meta_transaction is None:
+                results.append(
+                    {"status": status.HTTP_400_BAD_REQUEST, "errors": errors}
+                )
+            else:
+                results.append(
+                    {
+                        "status": status.HTTP_201_CREATED,
+                        "meta_transaction": MetaTransactionSerializer(
+                            meta_transaction
+                        ).data,
+                    }
+                )
+
+        created_count = sum(
+            1 for result in results if result["status"] == status.HTTP_201_CREATED
+        )
+        if created_count == len(results):
+            response_status = status.HTTP_201_CREATED
+        elif created_count == 0:
+            response_status = status.HTTP_400_BAD_REQUEST
+        else:
+            response_status = status.HTTP_207_MULTI_STATUS
+        return Response(results, status=response_status)
+
+
+class MultiRecipientMetaTransactionCreate(generics.CreateAPIView):
+    serializer_class = MultiRecipientMetaTransactionSerializer
 
 
 class WalletPublicKeyTransferRequestListCreate(generics.ListCreateAPIView):
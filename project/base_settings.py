@@ -57,7 +57,7 @@ INSTALLED_APPS = [
     "rest_framework_simplejwt.token_blacklist",
     "django_filters",
     "fcm_django",
-    "django_simple_task",
+    "apps.tasks",
     "apps.wallet",
     "apps.currency",
     "apps.profiles",
@@ -281,6 +281,10 @@ TEZOS_CALLBACK_CONTRACT_ADDRESS = os.environ.get(
 )
 TEZOS_BLOCK_WAIT_TIME = int(os.environ.get("TEZOS_BLOCK_WAIT_TIME", "15"))
 TEZOS_NODE = os.environ.get("TEZOS_NODE", "https://rpc.tzkt.io/carthagenet/")
+# seconds a process keeps its pytezos client and token contract, and the http
+# connections it keeps open to the node
+TEZOS_CLIENT_TTL = int(os.environ.get("TEZOS_CLIENT_TTL", "600"))
+TEZOS_RPC_POOL_SIZE = int(os.environ.get("TEZOS_RPC_POOL_SIZE", "16"))
 
 FCM_DJANGO_SETTINGS = {
     "APP_VERBOSE_NAME": "FCM Django",
@@ -359,6 +363,66 @@ OAUTH2_PROVIDER = {
 }
 
 BLOCKCHAIN_SYNC_WAIT_TIME = 6
+# a requested sync starts after at most BLOCKCHAIN_SYNC_MAX_LATENCY seconds, or as
+# soon as BLOCKCHAIN_SYNC_FLUSH_SIZE transactions and transfer requests are open
+BLOCKCHAIN_SYNC_MAX_LATENCY = int(os.environ.get("BLOCKCHAIN_SYNC_MAX_LATENCY", "60"))
+BLOCKCHAIN_SYNC_FLUSH_SIZE = int(os.environ.get("BLOCKCHAIN_SYNC_FLUSH_SIZE", "50"))
+# upper bound of transactions and transfer requests injected in one operation group
+BLOCKCHAIN_SYNC_BATCH_SIZE = int(os.environ.get("BLOCKCHAIN_SYNC_BATCH_SIZE", "100"))
+# seconds the sync worker waits when there is nothing left to sync
+BLOCKCHAIN_SYNC_IDLE_INTERVAL = int(
+    os.environ.get("BLOCKCHAIN_SYNC_IDLE_INTERVAL", "10")
+)
+
+# collapse the admin signed transfers of a sync batch into one transfer of the net
+# amount per sender, recipient and token
+BLOCKCHAIN_SYNC_NET_TRANSFERS = (
+    os.environ.get("BLOCKCHAIN_SYNC_NET_TRANSFERS", "false").lower() == "true"
+)
+
+# protocol limits the synced items are packed into, every contract call reserves the
+# whole gas limit of an operation
+TEZOS_OPERATION_GAS_LIMIT = 1040000
+TEZOS_OPERATION_STORAGE_LIMIT = 60000
+TEZOS_OPERATION_GROUP_GAS_LIMIT = 10400000
+TEZOS_OPERATION_GROUP_SIZE_LIMIT = 32 * 1024
+# an injected operation group is done once it is TEZOS_CONFIRMATION_DEPTH blocks deep
+# (its own block included) and failed if no block included it within
+# TEZOS_OPERATION_TTL blocks, the branch pytezos signs on expires by then
+TEZOS_CONFIRMATION_DEPTH = int(os.environ.get("TEZOS_CONFIRMATION_DEPTH", "2"))
+TEZOS_OPERATION_TTL = 60
+# estimated costs, "operation" is the contract call itself and "tx" every token
+# transfer in it. Tune them with the consumed gas and storage of synced groups.
+TEZOS_SYNC_COSTS = {
+    "operation": {"gas": 25000, "storage": 0, "size": 120},
+    "mint": {"gas": 15000, "storage": 300, "size": 150},
+    "transfer": {"gas": 2000, "storage": 0, "size": 30},
+    "meta_transfer": {"gas": 10000, "storage": 0, "size": 150},
+    "key_transfer": {"gas": 2000, "storage": 0, "size": 30},
+    "tx": {"gas": 10000, "storage": 70, "size": 40},
+}
+
+# threads reading the on-chain ledger when reconciling the wallet balances
+RECONCILIATION_WORKERS = int(os.environ.get("RECONCILIATION_WORKERS", "8"))
+# idle wallets an incremental reconciliation compares along with the active ones
+RECONCILIATION_IDLE_SAMPLE_SIZE = int(
+    os.environ.get("RECONCILIATION_IDLE_SAMPLE_SIZE", "100")
+)
+
+# verified paper wallet signatures remembered per process, scanning the same paper
+# wallet again within the ttl skips the verification
+PAPER_WALLET_SIGNATURE_CACHE_SIZE = int(
+    os.environ.get("PAPER_WALLET_SIGNATURE_CACHE_SIZE", "4096")
+)
+PAPER_WALLET_SIGNATURE_CACHE_TTL = int(
+    os.environ.get("PAPER_WALLET_SIGNATURE_CACHE_TTL", "300")
+)
+
+TASK_WORKER_POOL_SIZE = int(os.environ.get("TASK_WORKER_POOL_SIZE", "4"))
+TASK_MAX_ATTEMPTS = 5
+TASK_VISIBILITY_TIMEOUT = 5 * 60
+TASK_RETRY_BACKOFF_SECONDS = 10
+TASK_RETRY_BACKOFF_MAX_SECONDS = 60 * 60
 
 DEEPLINK_ISI_PARAM = "1526099770"
 DEEPLINK_BASE_URL = "https://app.ecoo.ch/deeplink/v1/"